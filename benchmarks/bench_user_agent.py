@@ -0,0 +1,88 @@
+"""
+Microbenchmark for parse_user_agent.
+
+Compares the rule-table parser in visitor/user_agent.py with the substring
+cascade it replaced. "hot" replays the weighted corpus, so repeat agents hit
+the parser's cache as they do in a warm container; "cold" clears the cache
+before every call to show the cost of a first sighting.
+
+    python benchmarks/bench_user_agent.py --calls 100000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.corpus import user_agents
+from visitor import user_agent
+
+
+def legacy_parse_user_agent(user_agent):
+    """parse_user_agent as it was before the rule-table parser, kept for comparison."""
+    if not user_agent:
+        return {'browser': 'Unknown', 'os': 'Unknown'}
+
+    browser = 'Unknown'
+    if 'Edg/' in user_agent:
+        browser = 'Edge'
+    elif 'Chrome/' in user_agent:
+        browser = 'Chrome'
+    elif 'Firefox/' in user_agent:
+        browser = 'Firefox'
+    elif 'Safari/' in user_agent and 'Chrome' not in user_agent:
+        browser = 'Safari'
+
+    os_name = 'Unknown'
+    if 'Windows' in user_agent:
+        os_name = 'Windows'
+    elif 'Macintosh' in user_agent or 'Mac OS X' in user_agent:
+        os_name = 'macOS'
+    elif 'Linux' in user_agent:
+        os_name = 'Linux'
+    elif 'Android' in user_agent:
+        os_name = 'Android'
+    elif 'iPhone' in user_agent or 'iPad' in user_agent:
+        os_name = 'iOS'
+
+    return {'browser': browser, 'os': os_name}
+
+
+def _per_call_ns(func, agents, repeat):
+    def run():
+        for agent in agents:
+            func(agent)
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(agents) * 1e9
+
+
+def _parse_cold(agent):
+    user_agent.clear_cache()
+    return user_agent.parse(agent)
+
+
+def run(calls, repeat=5):
+    agents = user_agents(calls)
+    user_agent.clear_cache()
+    return {
+        'legacy': _per_call_ns(legacy_parse_user_agent, agents, repeat),
+        'hot': _per_call_ns(user_agent.parse, agents, repeat),
+        'cold': _per_call_ns(_parse_cold, agents[:max(1, calls // 20)], repeat),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = run(args.calls, args.repeat)
+    for name, ns in results.items():
+        print(f"{name:<8} {ns:>10.0f} ns/call")
+    print(f"hot path is {results['legacy'] / results['hot']:.2f}x the legacy parser's speed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Compare recording a visit with two DynamoDB calls (counter UpdateItem, then
+visit PutItem) against the single TransactWriteItems call used when
+visitWriteMode=transact.
+
+Runs against moto's in-process DynamoDB. An in-process stand-in has no
+network, so every request is delayed by --rtt-ms to model the round trip to
+DynamoDB; the difference between the modes is then dominated by how many
+round trips each one makes, which is what matters in Lambda. Time spent
+inside moto itself is reported separately and subtracted in the "net"
+columns, since moto's transaction emulation is far slower than its
+single-item calls and would otherwise swamp the comparison.
+
+    python benchmarks/bench_visit_write.py --visits 200 --rtt-ms 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from uuid import uuid4
+
+import boto3
+from moto import mock_dynamodb
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+TABLE_NAME = 'visitor-bench'
+
+
+def _visit_item():
+    return {
+        'visitId': {'S': str(uuid4())},
+        'timestamp': {'S': '2024-01-01T00:00:00Z'},
+        'ipAddress': {'S': '203.0.0.0'},
+        'userAgent': {'S': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'},
+        'browser': {'S': 'Chrome'},
+        'os': {'S': 'macOS'},
+        'referer': {'S': 'Direct'}
+    }
+
+
+def _two_call_visit(app):
+    visit_number, _ = app.get_next_visit_number(TABLE_NAME, 1)
+    item = _visit_item()
+    item['visitNumId'] = {'N': str(visit_number)}
+    app.get_ddb_client().put_item(TableName=TABLE_NAME, Item=item)
+
+
+def _transact_visit(app):
+    app.record_visit_transactionally(TABLE_NAME, _visit_item(), 1)
+
+
+def run(visits, rtt_ms):
+    with mock_dynamodb():
+        import visitor.app as app
+
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+        calls = Counter()
+        stand_in = {'ms': 0.0, 'started': 0.0}
+
+        def simulate_round_trip(model, **kwargs):
+            calls[model.name] += 1
+            time.sleep(rtt_ms / 1000)
+            stand_in['started'] = time.perf_counter()
+
+        def measure_stand_in(**kwargs):
+            stand_in['ms'] += (time.perf_counter() - stand_in['started']) * 1000
+
+        app.get_ddb_client().meta.events.register('before-call.dynamodb', simulate_round_trip)
+        app.get_ddb_client().meta.events.register('after-call.dynamodb', measure_stand_in)
+        try:
+            results = {}
+            for name, record in (('two-call', _two_call_visit), ('transact', _transact_visit)):
+                calls.clear()
+                record(app)  # warm up (cold read of the counter in transact mode)
+                calls.clear()
+
+                latencies, net_latencies = [], []
+                for _ in range(visits):
+                    stand_in['ms'] = 0.0
+                    start = time.perf_counter()
+                    record(app)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    latencies.append(elapsed)
+                    net_latencies.append(elapsed - stand_in['ms'])
+                results[name] = (latencies, net_latencies, dict(calls))
+        finally:
+            app.get_ddb_client().meta.events.unregister('before-call.dynamodb', simulate_round_trip)
+            app.get_ddb_client().meta.events.unregister('after-call.dynamodb', measure_stand_in)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--visits', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=8.0, help='Simulated DynamoDB round trip per call')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    results = run(args.visits, args.rtt_ms)
+
+    print(f"{args.visits} visits, {args.rtt_ms}ms simulated round trip")
+    print(f"{'mode':<10} {'p50 ms':>8} {'p95 ms':>8} {'net p50':>8} {'net p95':>8}  calls per visit")
+    for name, (latencies, net_latencies, calls) in results.items():
+        per_visit = ', '.join(f"{op}={count / args.visits:.2f}" for op, count in sorted(calls.items()))
+        print(f"{name:<10} {statistics.median(latencies):>8.2f} {statistics.quantiles(latencies, n=20)[-1]:>8.2f} "
+              f"{statistics.median(net_latencies):>8.2f} {statistics.quantiles(net_latencies, n=20)[-1]:>8.2f}  {per_visit}")
+
+
+if __name__ == '__main__':
+    main()
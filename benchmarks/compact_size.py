@@ -0,0 +1,117 @@
+"""
+Size report for the compact visit encoding (visitEncoding=compact).
+
+Builds visit records from the request mix in benchmarks/corpus.py, or reads a
+sample of an existing table with --table, and reports for the full and the
+compact encoding:
+
+  average item bytes, by DynamoDB's item size rules
+  write capacity units per visit write, which DynamoDB rounds up per 1KB,
+  counted for the table and each index that projects ALL attributes
+  storage per million visits, across the table and those indexes
+
+Visit records are already below 1KB in the full encoding, so the write units
+per visit only drop for unusually long user agents or referers; the saving
+is in storage, in the indexes' copies of every item and in read units for
+queries that return many visits, which are billed on total bytes. Compact
+items also cost one dictionary table write per user agent a container
+hasn't seen before, which the report counts as distinct agents.
+
+    python benchmarks/compact_size.py --visits 2000
+    python benchmarks/compact_size.py --table VisitorDetailsTable --sample 500
+"""
+import argparse
+import math
+import os
+import sys
+from uuid import uuid4
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import corpus
+
+WCU_BYTES = 1024
+# Secondary indexes that project every attribute of a visit, i.e. store it
+# again: TimestampIndex and TimeBucketIndex
+INDEX_COPIES = 2
+
+GEO_DATA = (
+    {'country': 'Canada', 'countryCode': 'CA', 'region': 'Ontario', 'city': 'Toronto', 'latitude': 43.6532,
+     'longitude': -79.3832, 'timezone': 'America/Toronto', 'isp': 'Rogers Communications Canada Inc.'},
+    {'country': 'United States', 'countryCode': 'US', 'region': 'California', 'city': 'San Francisco',
+     'latitude': 37.7749, 'longitude': -122.4194, 'timezone': 'America/Los_Angeles', 'isp': 'Comcast Cable'},
+    {'country': 'Germany', 'countryCode': 'DE', 'region': 'Berlin', 'city': 'Berlin', 'latitude': 52.52,
+     'longitude': 13.405, 'timezone': 'Europe/Berlin', 'isp': 'Deutsche Telekom AG'},
+)
+
+
+def corpus_items(count):
+    """Logical visit items as lambda_handler builds them, for count corpus requests."""
+    import visitor.app as app
+
+    items = []
+    requests = zip(corpus.ip_addresses(count), corpus.user_agents(count), corpus.referers(count))
+    for number, (ip, agent, referer) in enumerate(requests, start=1):
+        timestamp = f"2024-01-{number % 28 + 1:02d}T{number % 24:02d}:15:30.123456Z"
+        items.append(app.build_visit_item(str(uuid4()), number, timestamp, app.anonymize_ip(ip), agent,
+                                          app.parse_user_agent(agent), referer, GEO_DATA[number % len(GEO_DATA)]))
+    return items
+
+
+def table_items(table_name, sample):
+    """Up to sample logical visit items scanned from an existing table."""
+    import visitor.app as app
+
+    items = []
+    paginator = app.get_ddb_client().get_paginator('scan')
+    for page in paginator.paginate(TableName=table_name, PaginationConfig={'MaxItems': sample * 2}):
+        items.extend(item for item in page['Items'] if 'timestamp' in item)  # skip counter/rollup items
+    return app.decode_visit_items(items[:sample])
+
+
+def report(items):
+    """Average bytes, write units and storage per encoding for logical visit items."""
+    from visitor import compact
+
+    encodings = {'full': items, 'compact': [compact.encode(item)[0] for item in items]}
+    results = {}
+    for name, encoded in encodings.items():
+        sizes = [compact.item_size(item) for item in encoded]
+        results[name] = {
+            'bytes': sum(sizes) / len(sizes),
+            'max_bytes': max(sizes),
+            'wcu': sum(math.ceil(size / WCU_BYTES) for size in sizes) * (1 + INDEX_COPIES) / len(sizes),
+            'mb_per_million': sum(sizes) / len(sizes) * (1 + INDEX_COPIES),  # bytes * 1e6 visits / 1e6
+        }
+    results['distinct_user_agents'] = len({item['userAgent']['S'] for item in items if 'userAgent' in item})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--visits', type=int, default=2000, help='Corpus visits to encode')
+    parser.add_argument('--table', help='Sample visit records from this table instead of the corpus')
+    parser.add_argument('--sample', type=int, default=1000, help='Visit records to read with --table')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    items = table_items(args.table, args.sample) if args.table else corpus_items(args.visits)
+    if not items:
+        parser.error('no visit records to measure')
+    results = report(items)
+
+    full, small = results['full'], results['compact']
+    print(f"{len(items)} visit records from {args.table or 'the corpus'}, "
+          f"{results['distinct_user_agents']} distinct user agents")
+    print(f"{'encoding':<10} {'avg bytes':>10} {'max bytes':>10} {'WCU/visit':>10} {'MB/1M visits':>13}")
+    for name in ('full', 'compact'):
+        result = results[name]
+        print(f"{name:<10} {result['bytes']:>10.1f} {result['max_bytes']:>10} {result['wcu']:>10.2f} "
+              f"{result['mb_per_million']:>13.1f}")
+    print(f"\ncompact items are {(1 - small['bytes'] / full['bytes']) * 100:.0f}% smaller; write units and "
+          f"storage include {INDEX_COPIES} index copies of each item")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Realistic request mix for the benchmarks: the user agents a personal site
+actually sees, weighted so a few common browsers dominate, plus the odd
+crawler and scripted client.
+"""
+import random
+
+# (user agent, relative weight)
+USER_AGENTS = (
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36", 30),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36", 18),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_1_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/17.1.2 Mobile/15E148 Safari/604.1", 14),
+    ("Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Mobile Safari/537.36", 10),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0", 8),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/17.1 Safari/605.1.15", 6),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0", 5),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36", 3),
+    ("Mozilla/5.0 (iPad; CPU OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "CriOS/120.0.6099.119 Mobile/15E148 Safari/604.1", 2),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", 2),
+    ("Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)", 1),
+    ("facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)", 1),
+    ("curl/8.4.0", 1),
+)
+
+
+def user_agents(count, seed=1234):
+    """Return count user agents drawn with the corpus weights."""
+    rng = random.Random(seed)
+    agents, weights = zip(*USER_AGENTS)
+    return rng.choices(agents, weights=weights, k=count)
+
+# Share of visitors arriving over IPv6
+IPV6_SHARE = 0.2
+
+REFERERS = (
+    ('Direct', 50),
+    ('https://www.linkedin.com/in/someone', 25),
+    ('https://www.google.com/', 15),
+    ('https://github.com/someone', 10),
+)
+
+
+def _address(rng):
+    if rng.random() < IPV6_SHARE:
+        return '2001:db8:' + ':'.join(f"{rng.randrange(0x10000):x}" for _ in range(6))
+    return f"{rng.randint(1, 223)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randint(1, 254)}"
+
+
+def ip_addresses(count, seed=1234, visitors=None):
+    """
+    Return count client addresses. Visitors come back, so addresses are drawn
+    from a pool of count // 4 distinct ones (or visitors, if given).
+    """
+    rng = random.Random(seed)
+    pool = [_address(rng) for _ in range(visitors or max(1, count // 4))]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def referers(count, seed=1234):
+    rng = random.Random(seed)
+    values, weights = zip(*REFERERS)
+    return rng.choices(values, weights=weights, k=count)
+
+
+def api_gateway_events(count, seed=1234):
+    """API Gateway GET /visitor events built from the corpus."""
+    return [
+        {
+            'httpMethod': 'GET',
+            'path': '/visitor',
+            'requestContext': {'identity': {'sourceIp': ip}},
+            'headers': {'X-Forwarded-For': ip, 'User-Agent': agent, 'Referer': referer}
+        }
+        for ip, agent, referer in zip(ip_addresses(count, seed), user_agents(count, seed), referers(count, seed))
+    ]
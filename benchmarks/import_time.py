@@ -0,0 +1,133 @@
+"""
+Measure what a cold start of the visitor function costs before any AWS call
+is made, and check it against benchmarks/import_budget.json.
+
+Each run starts a fresh interpreter in visitor/ (the function's code root,
+as in Lambda), imports app under -X importtime and then serves one OPTIONS
+preflight. Reported per run:
+
+  import ms   cumulative import time of app, from -X importtime
+  options ms  time to answer the first OPTIONS request after import
+
+The budget also lists modules that must not be loaded by then, so the lazy
+AWS client and HTTP setup can't quietly regress into eager imports.
+
+    python benchmarks/import_time.py --runs 10
+    python benchmarks/import_time.py --top 15         # heaviest imports of the last run
+    python benchmarks/import_time.py --write-budget   # re-baseline after an intended change
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CODE_ROOT = os.path.join(ROOT, 'visitor')
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budget.json')
+
+# Headroom applied to measured medians by --write-budget, to absorb machine
+# noise; sub-millisecond timings are floored so they don't flap
+BUDGET_HEADROOM = 1.5
+BUDGET_FLOOR_MS = 1.0
+
+PROBE = """
+import json, sys, time
+import app
+start = time.perf_counter()
+app.lambda_handler({'httpMethod': 'OPTIONS'}, None)
+options_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({'optionsMs': options_ms, 'modules': sorted(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr):
+    """Map module name to (self us, cumulative us) from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure_once():
+    env = dict(os.environ, AWS_REGION=os.environ.get('AWS_REGION', 'us-east-1'), tableName='visitor-details')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=CODE_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    imports = parse_importtime(result.stderr)
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        'importMs': imports['app'][1] / 1000,
+        'optionsMs': probe['optionsMs'],
+        'modules': set(probe['modules']),
+        'imports': imports
+    }
+
+
+def load_budget(path=BUDGET_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def check(results, budget):
+    """Return a list of budget violations for the measured runs."""
+    violations = []
+    for metric in ('importMs', 'optionsMs'):
+        median = statistics.median(run[metric] for run in results)
+        if median > budget[metric]:
+            violations.append(f"{metric} median {median:.1f} exceeds budget {budget[metric]:.1f}")
+    loaded = set().union(*(run['modules'] for run in results))
+    for module in budget.get('forbiddenModules', []):
+        if module in loaded:
+            violations.append(f"{module} is loaded before the first AWS call")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='Also list the N heaviest imports (cumulative) of the last run')
+    parser.add_argument('--budget', default=BUDGET_PATH)
+    parser.add_argument('--write-budget', action='store_true', help='Store the measured medians, with headroom, as the budget')
+    args = parser.parse_args(argv)
+
+    results = [measure_once() for _ in range(args.runs)]
+
+    print(f"{args.runs} cold starts of visitor/app.py")
+    print(f"{'metric':<10} {'min':>8} {'median':>8} {'max':>8}")
+    for metric in ('importMs', 'optionsMs'):
+        values = [run[metric] for run in results]
+        print(f"{metric:<10} {min(values):>8.1f} {statistics.median(values):>8.1f} {max(values):>8.1f}")
+
+    if args.top:
+        print("\nHeaviest imports (cumulative ms):")
+        heaviest = sorted(results[-1]['imports'].items(), key=lambda entry: entry[1][1], reverse=True)
+        for name, (_, cumulative_us) in heaviest[:args.top]:
+            print(f"  {cumulative_us / 1000:>8.1f}  {name}")
+
+    budget = load_budget(args.budget)
+    if args.write_budget:
+        for metric in ('importMs', 'optionsMs'):
+            median = statistics.median(run[metric] for run in results)
+            budget[metric] = round(max(median * BUDGET_HEADROOM, BUDGET_FLOOR_MS), 1)
+        with open(args.budget, 'w') as f:
+            json.dump(budget, f, indent=2)
+            f.write('\n')
+        print(f"\nBudget written to {args.budget}")
+        return
+
+    violations = check(results, budget)
+    for violation in violations:
+        print(f"OVER BUDGET: {violation}", file=sys.stderr)
+    if violations:
+        sys.exit(1)
+    print("\nWithin budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Concurrent load test for the visit counter.
+
+Drives many lambda_handler invocations at once against moto (the default)
+or a real DynamoDB endpoint such as DynamoDB Local, starting from an empty
+table so the first writes to the COUNTER race each other too, then reports:
+
+  throughput and latency percentiles of the invocations
+  retries: counter/transaction retries logged by the handler, and
+           botocore's own retries (throttling, transient errors)
+  visit numbers returned twice (duplicates) or never returned (gaps)
+  drift between the stored counter and the visits that succeeded
+
+Threads share one module, i.e. one warm container, as far as in-memory state
+(counter blocks, caches) goes. With --endpoint-url, --processes spreads the
+threads over separate interpreters to model separate containers. moto keeps
+its tables in process memory, so it only supports threads; requests to it
+are serialized to give each call the per-item atomicity DynamoDB has.
+
+Counter modes are chosen with the function's own environment variables:
+
+    python benchmarks/load_counter.py --visits 1000 --threads 32
+    python benchmarks/load_counter.py --set counterShards=8 --set counterShardSelection=hash
+    python benchmarks/load_counter.py --set visitWriteMode=transact
+    python benchmarks/load_counter.py --endpoint-url http://localhost:8000 --processes 4 --threads 16
+
+In sharded and block modes duplicates and gaps respectively are part of the
+design; in the default and transact modes any of either is a bug.
+
+--hot-client-share sends that fraction of the invocations, spread through the
+run, from a single client address, and reports latency and outcomes of its
+requests and everyone else's separately. Comparing runs with and without a
+per-client limit shows whether shedding the hot client keeps legitimate
+visits' latency where it is without one:
+
+    python benchmarks/load_counter.py --hot-client-share 0.5
+    python benchmarks/load_counter.py --hot-client-share 0.5 --set rateLimitPerMinute=60
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from uuid import uuid4
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import corpus
+
+HOT_CLIENT = '192.0.2.10'
+
+
+class _RetryLog(logging.Handler):
+    """Counts the handler's counter and transaction retries from its log."""
+
+    def __init__(self, counts):
+        super().__init__(logging.INFO)
+        self.counts = counts
+
+    def emit(self, record):
+        if 'retrying' in record.getMessage():
+            self.counts['handler retries'] += 1
+
+
+def with_hot_client(events, share):
+    """Send share of the events, evenly spread, from HOT_CLIENT; returns the events and which are hot."""
+    hot = [int((n + 1) * share) > int(n * share) for n in range(len(events))]
+    for event, is_hot in zip(events, hot):
+        if is_hot:
+            event['headers']['X-Forwarded-For'] = HOT_CLIENT
+            event['requestContext']['identity']['sourceIp'] = HOT_CLIENT
+    return events, hot
+
+
+def run_chunk(visits, threads, seed, hot_share=0.0):
+    """
+    Run visits invocations over threads threads in this process; returns
+    results, which of them came from the hot client, and retry counts.
+    """
+    import visitor.app as app
+
+    counts = Counter()
+    lock = threading.Lock()
+
+    def count_sdk_retries(parsed, **kwargs):
+        attempts = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if attempts:
+            with lock:
+                counts['sdk retries'] += attempts
+
+    def invoke(event):
+        start = time.perf_counter()
+        response = app.lambda_handler(event, None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        body = json.loads(response['body'])
+        return elapsed_ms, response['statusCode'], body.get('visitorCount')
+
+    retry_log = _RetryLog(counts)
+    logging.getLogger().addHandler(retry_log)
+    client = app.get_ddb_client()
+    client.meta.events.register('after-call.dynamodb', count_sdk_retries)
+    try:
+        # The handler prints a metrics line per invocation; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=threads) as executor:
+            events, hot = with_hot_client(corpus.api_gateway_events(visits, seed), hot_share)
+            results = list(executor.map(invoke, events))
+    finally:
+        logging.getLogger().removeHandler(retry_log)
+        client.meta.events.unregister('after-call.dynamodb', count_sdk_retries)
+    return {'results': results, 'hot': hot, 'retries': dict(counts)}
+
+
+def _init_process(env):
+    os.environ.update(env)
+
+
+def _create_table(client, table_name):
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+
+@contextlib.contextmanager
+def _serialized_moto():
+    """Run moto with one request at a time, like DynamoDB's per-item atomic writes."""
+    from moto import mock_dynamodb
+    from moto.core.botocore_stubber import BotocoreStubber
+
+    lock = threading.Lock()
+    stub = BotocoreStubber.__call__
+
+    def serialized(self, event_name, request, **kwargs):
+        with lock:
+            return stub(self, event_name, request, **kwargs)
+
+    with mock_dynamodb():
+        BotocoreStubber.__call__ = serialized
+        try:
+            yield
+        finally:
+            BotocoreStubber.__call__ = stub
+
+
+def _percentiles(latencies):
+    return statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+
+
+def client_report(results):
+    """Latency percentiles and outcomes of one group of invocations."""
+    latencies = sorted(elapsed for elapsed, _, _ in results) or [0.0]
+    percentiles = _percentiles(latencies)
+    statuses = Counter(status for _, status, _ in results)
+    return {
+        'invocations': len(results),
+        'succeeded': statuses[200],
+        'shed': statuses[429],
+        'p50': percentiles[49],
+        'p95': percentiles[94],
+        'p99': percentiles[98]
+    }
+
+
+def analyze(results, starting_number, counter_total):
+    """Summarize invocation results against the stored counter."""
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    numbers = [number for _, status, number in results if status == 200 and number is not None]
+    succeeded = sum(1 for _, status, _ in results if status == 200)
+    seen = Counter(numbers)
+    expected = set(range(starting_number, starting_number + succeeded))
+    percentiles = _percentiles(latencies)
+    return {
+        'invocations': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'p50': percentiles[49],
+        'p95': percentiles[94],
+        'p99': percentiles[98],
+        'max': latencies[-1] if latencies else 0,
+        'duplicates': sum(count - 1 for count in seen.values() if count > 1),
+        'gaps': len(expected - seen.keys()),
+        'counter': counter_total,
+        'drift': counter_total - (starting_number - 1) - succeeded
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--visits', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent invocations per process')
+    parser.add_argument('--processes', type=int, default=1, help='Requires --endpoint-url')
+    parser.add_argument('--endpoint-url', help='DynamoDB endpoint, e.g. DynamoDB Local; moto if omitted')
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    parser.add_argument('--starting-number', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Function environment variable, e.g. counterShards=8 (repeatable)')
+    parser.add_argument('--hot-client-share', type=float, default=0.0,
+                        help='Fraction of invocations sent from one client address, e.g. 0.5')
+    parser.add_argument('--keep-table', action='store_true', help='Leave the load test table in place')
+    args = parser.parse_args(argv)
+
+    if args.processes > 1 and not args.endpoint_url:
+        parser.error('--processes needs --endpoint-url; moto tables live in a single process')
+    if not 0 <= args.hot_client_share < 1:
+        parser.error('--hot-client-share must be at least 0 and below 1')
+
+    table_name = f"visitor-load-{uuid4().hex[:8]}"
+    env = {
+        'AWS_REGION': args.region,
+        'tableName': table_name,
+        'startingVisitNumber': str(args.starting_number),
+        'geoSourceOrder': 'headers',  # no geolocation upstream in a load test
+        'statsRollups': 'false',
+        'stageWorkers': str(args.threads * 2),  # one executor per process, shared by its threads
+    }
+    if args.endpoint_url:
+        env['ddbEndpoint'] = args.endpoint_url
+    for assignment in args.set:
+        name, _, value = assignment.partition('=')
+        env[name] = value
+    os.environ.update(env)
+
+    backend = contextlib.nullcontext() if args.endpoint_url else _serialized_moto()
+    with backend:
+        import visitor.app as app
+
+        client = app.get_ddb_client()
+        _create_table(client, table_name)
+        try:
+            start = time.perf_counter()
+            if args.processes > 1:
+                shares = [args.visits // args.processes + (1 if i < args.visits % args.processes else 0)
+                          for i in range(args.processes)]
+                with ProcessPoolExecutor(args.processes, initializer=_init_process, initargs=(env,)) as executor:
+                    chunks = list(executor.map(run_chunk, shares, [args.threads] * args.processes,
+                                               range(args.processes), [args.hot_client_share] * args.processes))
+            else:
+                chunks = [run_chunk(args.visits, args.threads, 0, args.hot_client_share)]
+            elapsed = time.perf_counter() - start
+
+            results = [result for chunk in chunks for result in chunk['results']]
+            hot = [is_hot for chunk in chunks for is_hot in chunk['hot']]
+            retries = Counter()
+            for chunk in chunks:
+                retries.update(chunk['retries'])
+            counter_total, _ = app.read_visit_count(table_name, args.starting_number, consistent=True)
+        finally:
+            if not args.keep_table:
+                client.delete_table(TableName=table_name)
+
+    report = analyze(results, args.starting_number, counter_total)
+    settings = ', '.join(args.set) or 'defaults'
+    print(f"{report['invocations']} visits, {args.processes} process(es) x {args.threads} threads, "
+          f"{'moto' if not args.endpoint_url else args.endpoint_url}, {settings}")
+    print(f"throughput   {report['invocations'] / elapsed:.1f} visits/s over {elapsed:.2f}s")
+    print(f"latency ms   p50 {report['p50']:.1f}  p95 {report['p95']:.1f}  p99 {report['p99']:.1f}  "
+          f"max {report['max']:.1f}")
+    print(f"outcomes     {report['succeeded']} succeeded, {report['failed']} failed")
+    if args.hot_client_share:
+        for label, from_hot in (('legitimate', False), ('hot client', True)):
+            group = client_report([result for result, is_hot in zip(results, hot) if is_hot == from_hot])
+            print(f"{label:<12} {group['invocations']} visits, p50 {group['p50']:.1f}  p95 {group['p95']:.1f}  "
+                  f"p99 {group['p99']:.1f} ms, {group['succeeded']} succeeded, {group['shed']} shed (429)")
+    print(f"retries      handler {retries['handler retries']}, sdk {retries['sdk retries']}")
+    print(f"numbers      {report['duplicates']} duplicated, {report['gaps']} never returned")
+    print(f"counter      {report['counter']} (drift {report['drift']:+d} against successful visits)")
+
+
+if __name__ == '__main__':
+    main()
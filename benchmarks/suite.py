@@ -0,0 +1,258 @@
+"""
+Microbenchmark suite for the handler's hot path, with a stored baseline.
+
+Cases, each replayed over the realistic request mix in benchmarks/corpus.py:
+
+  parse_user_agent       warm parser cache, as in a warm container
+  parse_user_agent_cold  parser cache cleared before every call
+  anonymize_ip           IPv4/IPv6 client addresses
+  build_visit_item       DynamoDB item construction from parsed inputs
+  lambda_handler         full GET /visitor invocations against an in-memory
+                         DynamoDB stub and a canned geolocation response, so
+                         only the function's own CPU time is measured
+  count                  GET /visitor/count served from the warm count cache
+  count_cold             GET /visitor/count with the count read on every call
+
+Every case runs --rounds times over --number inputs; the per-call median
+across rounds is compared with benchmarks/baseline.json and the run fails
+when a case is slower than the baseline by more than --tolerance. Baselines
+are only comparable on the same machine and Python version, so re-baseline
+with --save when either changes (the file records both).
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --case lambda_handler --rounds 15
+    python benchmarks/suite.py --save
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import corpus
+from visitor.http_pool import KeepAlivePool
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TABLE_NAME = 'visitor-bench'
+
+GEO_RESPONSE = json.dumps({
+    'status': 'success', 'country': 'Canada', 'countryCode': 'CA', 'regionName': 'Ontario',
+    'city': 'Toronto', 'lat': 43.65, 'lon': -79.38, 'timezone': 'America/Toronto', 'isp': 'Example ISP'
+}).encode()
+
+
+class StubDynamoDB:
+    """Answers the calls the visit path makes with canned responses, without any I/O."""
+
+    def __init__(self):
+        self.visit_count = 0
+        self.items = 0
+
+    def update_item(self, **kwargs):
+        self.visit_count += 1
+        return {'Attributes': {'visitCount': {'N': str(self.visit_count - 1)},
+                               'lastUpdated': {'S': '2024-01-01T00:00:00Z'}}}
+
+    def put_item(self, **kwargs):
+        self.items += 1
+        return {}
+
+    def get_item(self, **kwargs):
+        return {'Item': {'visitId': {'S': 'COUNTER'}, 'visitCount': {'N': str(self.visit_count)},
+                         'lastUpdated': {'S': '2024-01-01T00:00:00Z'}}}
+
+
+class StubGeoPool(KeepAlivePool):
+    """The function's geolocation pool, with its settings, answering every lookup without a connection."""
+
+    def __init__(self):
+        super().__init__('ip-api.com')
+
+    def get(self, path, headers=None, timeout=None):
+        return 200, {'Content-Type': 'application/json'}, GEO_RESPONSE
+
+
+def _succeeded(response):
+    """Fail the case instead of timing an error path."""
+    if response['statusCode'] != 200:
+        raise AssertionError(f"handler returned {response['statusCode']}: {response['body']}")
+    return response
+
+
+def _app():
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    import visitor.app as app
+    return app
+
+
+def case_parse_user_agent(number):
+    app = _app()
+    return app.parse_user_agent, corpus.user_agents(number)
+
+
+def case_parse_user_agent_cold(number):
+    app = _app()
+
+    def parse_cold(agent):
+        app.ua_parser.clear_cache()
+        return app.parse_user_agent(agent)
+
+    return parse_cold, corpus.user_agents(number)
+
+
+def case_anonymize_ip(number):
+    app = _app()
+    return app.anonymize_ip, corpus.ip_addresses(number)
+
+
+def case_build_visit_item(number):
+    app = _app()
+    geo_data = {'country': 'Canada', 'countryCode': 'CA', 'region': 'Ontario', 'city': 'Toronto',
+                'latitude': 43.65, 'longitude': -79.38, 'timezone': 'America/Toronto'}
+    inputs = [
+        (f"visit-{n}", n, '2024-01-01T12:00:00Z', app.anonymize_ip(ip), agent, app.parse_user_agent(agent),
+         referer, geo_data)
+        for n, (ip, agent, referer) in enumerate(zip(corpus.ip_addresses(number), corpus.user_agents(number),
+                                                     corpus.referers(number)))
+    ]
+    return lambda args: app.build_visit_item(*args), inputs
+
+
+def case_lambda_handler(number):
+    app = _app()
+    os.environ['tableName'] = TABLE_NAME
+    app._ddb_client = StubDynamoDB()
+    app.geo_pool = StubGeoPool()
+    app.geo_cache.clear()
+    return lambda event: _succeeded(app.lambda_handler(event, None)), corpus.api_gateway_events(number)
+
+
+def _count_events(number):
+    return [{'httpMethod': 'GET', 'path': '/visitor/count', 'headers': event['headers']}
+            for event in corpus.api_gateway_events(number)]
+
+
+def case_count(number):
+    app = _app()
+    os.environ['tableName'] = TABLE_NAME
+    app._ddb_client = StubDynamoDB()
+    app.count_cache.clear()
+    return lambda event: _succeeded(app.lambda_handler(event, None)), _count_events(number)
+
+
+def case_count_cold(number):
+    app = _app()
+    os.environ['tableName'] = TABLE_NAME
+    app._ddb_client = StubDynamoDB()
+
+    def count_cold(event):
+        app.count_cache.clear()
+        return _succeeded(app.lambda_handler(event, None))
+
+    return count_cold, _count_events(number)
+
+
+CASES = {
+    'parse_user_agent': case_parse_user_agent,
+    'parse_user_agent_cold': case_parse_user_agent_cold,
+    'anonymize_ip': case_anonymize_ip,
+    'build_visit_item': case_build_visit_item,
+    'lambda_handler': case_lambda_handler,
+    'count': case_count,
+    'count_cold': case_count_cold,
+}
+
+
+def measure(func, inputs, rounds):
+    """Per-call nanoseconds for each round over all inputs."""
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        for value in inputs:
+            func(value)
+        per_call.append((time.perf_counter_ns() - start) / len(inputs))
+    return per_call
+
+
+def run(cases, number, rounds):
+    results = {}
+    # The handler logs and prints a metrics line per call; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in cases:
+            func, inputs = CASES[name](number)
+            measure(func, inputs[:max(1, number // 10)], 1)  # warm up
+            per_call = measure(func, inputs, rounds)
+            results[name] = {'median_ns': round(statistics.median(per_call)), 'min_ns': round(min(per_call))}
+    return results
+
+
+def environment():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'system': platform.system()}
+
+
+def compare(results, baseline, tolerance):
+    """Return (case, current, baseline, ratio) for every case slower than baseline by more than tolerance."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('cases', {}).get(name)
+        if not reference:
+            continue
+        ratio = result['median_ns'] / reference['median_ns']
+        if ratio > 1 + tolerance:
+            regressions.append((name, result['median_ns'], reference['median_ns'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='Run only this case (repeatable)')
+    parser.add_argument('--number', type=int, default=2000, help='Corpus inputs per round')
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help='Store these results as the baseline')
+    args = parser.parse_args(argv)
+
+    cases = args.case or list(CASES)
+    results = run(cases, args.number, args.rounds)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{args.rounds} rounds x {args.number} inputs, ns per call")
+    print(f"{'case':<24} {'median':>10} {'min':>10} {'baseline':>10} {'change':>8}")
+    for name, result in results.items():
+        reference = baseline.get('cases', {}).get(name)
+        change = f"{(result['median_ns'] / reference['median_ns'] - 1) * 100:+.0f}%" if reference else '-'
+        reference_ns = reference['median_ns'] if reference else '-'
+        print(f"{name:<24} {result['median_ns']:>10} {result['min_ns']:>10} {reference_ns:>10} {change:>8}")
+
+    if args.save:
+        saved = {'environment': environment(), 'cases': {**baseline.get('cases', {}), **results}}
+        with open(args.baseline, 'w') as f:
+            json.dump(saved, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if baseline and baseline.get('environment') != environment():
+        print(f"\nNote: baseline was recorded on {baseline.get('environment')}, comparisons are indicative only")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, current, reference, ratio in regressions:
+        print(f"REGRESSION: {name} {current}ns vs baseline {reference}ns ({ratio:.2f}x)", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Add the timeBucket attribute to visits recorded before TimeBucketIndex
+existed, so they show up in GET /visitor/recent and other bucket queries.
+
+    python scripts/backfill_time_buckets.py --table visitor-details --segments 4
+
+The table is read with a parallel Scan, one worker per segment, and each
+visit missing a bucket gets a conditional UpdateItem. Items written by the
+function in the meantime already carry timeBucket and are left alone, so the
+backfill can run while the function is serving traffic and can be re-run
+after an interruption.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from visitor.app import time_bucket
+
+
+def backfill_segment(client, table_name, segment, total_segments):
+    """Bucket every unbucketed visit in one Scan segment. Returns the number of items updated."""
+    updated = 0
+    scan = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': 'attribute_exists(#ts) AND attribute_not_exists(timeBucket)',
+        'ProjectionExpression': 'visitId, #ts',
+        'ExpressionAttributeNames': {'#ts': 'timestamp'}
+    }
+    while True:
+        response = client.scan(**scan)
+        for item in response.get('Items', []):
+            try:
+                client.update_item(
+                    TableName=table_name,
+                    Key={'visitId': item['visitId']},
+                    UpdateExpression='SET timeBucket = :bucket',
+                    ConditionExpression='attribute_exists(visitId) AND attribute_not_exists(timeBucket)',
+                    ExpressionAttributeValues={':bucket': {'S': time_bucket(item['timestamp']['S'])}}
+                )
+                updated += 1
+            except client.exceptions.ConditionalCheckFailedException:
+                pass
+        if 'LastEvaluatedKey' not in response:
+            return updated
+        scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def backfill(client, table_name, segments=4):
+    """Backfill all segments in parallel. Returns the total number of items updated."""
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        counts = executor.map(lambda segment: backfill_segment(client, table_name, segment, segments), range(segments))
+        return sum(counts)
+
+
+def main(argv=None, client=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', required=True, help='Visitor details table name')
+    parser.add_argument('--segments', type=int, default=4, help='Parallel Scan segments')
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    parser.add_argument('--endpoint-url', help='DynamoDB endpoint, e.g. DynamoDB Local')
+    args = parser.parse_args(argv)
+
+    if args.segments < 1:
+        parser.error('--segments must be at least 1')
+
+    client = client or boto3.client('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url)
+    updated = backfill(client, args.table, args.segments)
+    print(f"Added timeBucket to {updated} visits")
+
+
+if __name__ == '__main__':
+    main()
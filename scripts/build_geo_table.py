@@ -0,0 +1,64 @@
+"""
+Convert a CSV geolocation dataset into the memory-mapped table read by
+visitor/geo_table.py.
+
+The CSV needs either ip_start/ip_end columns or a network (CIDR) column, plus
+any of the geolocation fields the handler stores: country, countryCode,
+region, city, latitude, longitude, timezone, isp. Headerless files such as
+the DB-IP "IP to City Lite" export can be converted by naming the columns:
+
+    python scripts/build_geo_table.py dbip-city-lite.csv visitor/geo.bin \
+        --columns ip_start,ip_end,continent,countryCode,region,city,latitude,longitude
+
+Columns that aren't geolocation fields (continent above) are ignored.
+"""
+import argparse
+import csv
+import os
+import sys
+from ipaddress import ip_network
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from visitor.geo_table import write_table
+
+GEO_FIELDS = ('country', 'countryCode', 'region', 'city', 'latitude', 'longitude', 'timezone', 'isp')
+NUMERIC_FIELDS = ('latitude', 'longitude')
+
+
+def read_ranges(rows):
+    for row in rows:
+        if row.get('network'):
+            network = ip_network(row['network'].strip(), strict=False)
+            start, end = str(network.network_address), str(network.broadcast_address)
+        else:
+            start, end = row['ip_start'].strip(), row['ip_end'].strip()
+
+        location = {}
+        for field in GEO_FIELDS:
+            value = (row.get(field) or '').strip()
+            if not value:
+                continue
+            location[field] = float(value) if field in NUMERIC_FIELDS else value
+
+        yield start, end, location
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path', help='CSV geolocation dataset')
+    parser.add_argument('table_path', help='Output table file')
+    parser.add_argument('--columns', help='Comma-separated column names for a headerless CSV')
+    args = parser.parse_args(argv)
+
+    fieldnames = args.columns.split(',') if args.columns else None
+    with open(args.csv_path, newline='', encoding='utf-8') as f:
+        v4_count, v6_count = write_table(read_ranges(csv.DictReader(f, fieldnames=fieldnames)), args.table_path)
+
+    size = os.path.getsize(args.table_path)
+    print(f"Wrote {v4_count} IPv4 and {v6_count} IPv6 ranges to {args.table_path} ({size} bytes)")
+
+
+if __name__ == '__main__':
+    main()
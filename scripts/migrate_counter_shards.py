@@ -0,0 +1,149 @@
+"""
+Move the visit count between the legacy single COUNTER item and the sharded
+COUNTER#<n> items used when the function runs with counterShards set.
+
+Sharded mode already adds the legacy COUNTER into its total, so folding is
+optional; it just retires the hot item. Collapse before turning sharding off
+again, otherwise the single-item counter would lose the shard totals:
+
+    python scripts/migrate_counter_shards.py --table visitor-details --shards 8 --starting-number 700 fold
+    python scripts/migrate_counter_shards.py --table visitor-details --shards 8 --starting-number 700 collapse
+
+COUNTER holds the count including startingVisitNumber - 1, while shards only
+hold increments (readers add the offset when COUNTER is missing), so both
+steps need the function's startingVisitNumber.
+
+Each step is a single TransactWriteItems call conditioned on the counts it
+read, so it is safe to run while the function is serving traffic; a
+concurrent increment cancels the transaction and the step is retried.
+"""
+import argparse
+import os
+import sys
+import time
+
+import boto3
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from visitor.app import COUNTER_KEY, counter_shard_keys
+
+
+def _read_counters(client, table_name, keys):
+    counters = {}
+    for key in keys:
+        item = client.get_item(
+            TableName=table_name,
+            Key={'visitId': {'S': key}},
+            ConsistentRead=True
+        ).get('Item')
+        if item:
+            counters[key] = (int(item.get('visitCount', {}).get('N', '0')), item.get('lastUpdated', {}).get('S'))
+    return counters
+
+
+def _count_condition(key, count):
+    if count is None:
+        return {'ConditionExpression': 'attribute_not_exists(visitId)'}
+    return {
+        'ConditionExpression': 'visitCount = :expected',
+        'ExpressionAttributeValues': {':expected': {'N': str(count)}}
+    }
+
+
+def fold(client, table_name, shards, starting_number=1):
+    """
+    Add the legacy COUNTER, less the starting offset readers add back once it
+    is gone, into shard 0 and delete it. Returns the count moved.
+    """
+    counters = _read_counters(client, table_name, [COUNTER_KEY])
+    if COUNTER_KEY not in counters:
+        return 0
+
+    count, last_updated = counters[COUNTER_KEY]
+    moved = count - (starting_number - 1)
+    client.transact_write_items(TransactItems=[
+        {'Update': {
+            'TableName': table_name,
+            'Key': {'visitId': {'S': counter_shard_keys(shards)[0]}},
+            'UpdateExpression': 'ADD visitCount :count SET lastUpdated = if_not_exists(lastUpdated, :ts)',
+            'ExpressionAttributeValues': {
+                ':count': {'N': str(moved)},
+                ':ts': {'S': last_updated or ''}
+            }
+        }},
+        {'Delete': {
+            'TableName': table_name,
+            'Key': {'visitId': {'S': COUNTER_KEY}},
+            **_count_condition(COUNTER_KEY, count)
+        }}
+    ])
+    return moved
+
+
+def collapse(client, table_name, shards, starting_number=1):
+    """Sum every shard into the legacy COUNTER and delete the shards. Returns the new total."""
+    shard_keys = counter_shard_keys(shards)
+    counters = _read_counters(client, table_name, [COUNTER_KEY] + shard_keys)
+    shard_counters = {key: counters[key] for key in shard_keys if key in counters}
+    if not shard_counters:
+        return counters.get(COUNTER_KEY, (None, None))[0]
+
+    base = counters[COUNTER_KEY][0] if COUNTER_KEY in counters else starting_number - 1
+    total = base + sum(count for count, _ in shard_counters.values())
+    last_updated = max((ts for _, ts in counters.values() if ts), default='')
+
+    transact_items = [{'Put': {
+        'TableName': table_name,
+        'Item': {
+            'visitId': {'S': COUNTER_KEY},
+            'visitCount': {'N': str(total)},
+            'lastUpdated': {'S': last_updated}
+        },
+        **_count_condition(COUNTER_KEY, counters.get(COUNTER_KEY, (None, None))[0])
+    }}]
+    for key, (count, _) in shard_counters.items():
+        transact_items.append({'Delete': {
+            'TableName': table_name,
+            'Key': {'visitId': {'S': key}},
+            **_count_condition(key, count)
+        }})
+
+    client.transact_write_items(TransactItems=transact_items)
+    return total
+
+
+def main(argv=None, client=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('action', choices=['fold', 'collapse'])
+    parser.add_argument('--table', required=True, help='Visitor details table name')
+    parser.add_argument('--shards', type=int, required=True, help='Value of counterShards')
+    parser.add_argument('--starting-number', type=int, default=1, help='Value of startingVisitNumber')
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    parser.add_argument('--endpoint-url', help='DynamoDB endpoint, e.g. DynamoDB Local')
+    parser.add_argument('--attempts', type=int, default=5, help='Retries when traffic changes a counter mid-step')
+    args = parser.parse_args(argv)
+
+    if args.shards < 1 or args.shards > 99:
+        parser.error('--shards must be between 1 and 99 (one transaction holds at most 100 items)')
+
+    client = client or boto3.client('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url)
+    for attempt in range(1, args.attempts + 1):
+        try:
+            if args.action == 'fold':
+                moved = fold(client, args.table, args.shards, args.starting_number)
+                print(f"Moved {moved} visits from {COUNTER_KEY} into {counter_shard_keys(args.shards)[0]}")
+            else:
+                total = collapse(client, args.table, args.shards, args.starting_number)
+                print(f"{COUNTER_KEY} now holds {total} visits")
+            return
+        except client.exceptions.TransactionCanceledException:
+            print(f"Counter changed during attempt {attempt}, retrying", file=sys.stderr)
+            time.sleep(0.1 * attempt)
+
+    sys.exit(f"Gave up after {args.attempts} attempts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Re-enrich stored visits: add geolocation to visits recorded while the lookup
+failed, and re-parse user agents recorded by an older parser version.
+
+    python scripts/reenrich_visits.py --table visitor-details --segments 4 --checkpoint reenrich.json
+    python scripts/reenrich_visits.py --table visitor-details --endpoint-url http://localhost:8000
+
+The table is read with a parallel Scan, one worker per segment. For each
+page, visits without a country, or with a uaParserVersion older than the
+current parser, are collected; their addresses are deduplicated (across
+the whole run, not just the page) and resolved with ip-api.com's batch
+endpoint, up to 100 per call, pausing whenever its X-Rl / X-Ttl headers say
+the rate limit is used up. Updates are written back --write-workers at a
+time as conditional UpdateItems that only set the enrichment attributes, in
+whichever encoding (full or compact) the visit was stored.
+
+Visits only keep anonymized addresses (/16 for IPv4, /48 for IPv6), so the
+recovered location is that of the network, which is what a lookup at visit
+time would mostly have cached too.
+
+With --checkpoint, the position of every segment and the addresses already
+resolved are saved after each page, and a rerun with the same file resumes
+where the last one stopped. Rerunning without one is safe too: enriched
+visits no longer match.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from visitor import app, compact
+from visitor import user_agent as ua_parser
+from visitor.http_pool import KeepAlivePool
+
+BATCH_LOOKUP_SIZE = 100  # ip-api.com batch endpoint limit
+GEO_FIELDS = ('country', 'countryCode', 'region', 'city', 'latitude', 'longitude', 'timezone', 'isp')
+USER_AGENT_FIELDS = ('browser', 'browserVersion', 'os', 'osVersion', 'device', 'isBot')
+
+
+class Checkpoint:
+    """Scan positions and resolved addresses, saved to path (if any) as JSON."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.total_segments = None
+        self.segments = {}  # segment -> {'lastKey': key or None, 'done': bool}
+        self.geo = {}  # address -> geo_data, or None if it doesn't resolve
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.total_segments = state.get('totalSegments')
+            self.segments = {int(segment): position for segment, position in state.get('segments', {}).items()}
+            self.geo = state.get('geo', {})
+
+    def position(self, segment):
+        return self.segments.get(segment, {'lastKey': None, 'done': False})
+
+    def save(self, segment, last_key):
+        with self._lock:
+            self.segments[segment] = {'lastKey': last_key, 'done': last_key is None}
+            if not self.path:
+                return
+            temporary = f"{self.path}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump({'totalSegments': self.total_segments, 'segments': self.segments,
+                           'geo': dict(self.geo)}, f)
+            os.replace(temporary, self.path)
+
+
+class BatchGeoResolver:
+    """Resolves addresses with ip-api.com's batch endpoint, once each, honoring its rate limit."""
+
+    def __init__(self, pool, known=None, sleep=time.sleep):
+        self.pool = pool
+        self.known = known if known is not None else {}
+        self.calls = 0
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def resolve(self, addresses):
+        """Return {address: geo_data or None} for addresses, looking up only the ones not seen before."""
+        with self._lock:
+            pending = sorted({address for address in addresses if address not in self.known})
+            for start in range(0, len(pending), BATCH_LOOKUP_SIZE):
+                self._lookup(pending[start:start + BATCH_LOOKUP_SIZE])
+            return {address: self.known.get(address) for address in addresses}
+
+    def _lookup(self, batch):
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                self._sleep(wait)
+            status, headers, body = self.pool.post(
+                f"/batch?fields={app.GEO_API_FIELDS},query", json.dumps(batch).encode(),
+                {'Content-Type': 'application/json'}
+            )
+            self.calls += 1
+            names = {name.lower(): value for name, value in headers.items()}
+            reset = float(names.get('x-ttl', '60'))
+            if status == 429:
+                self._paused_until = time.monotonic() + reset
+                continue
+            if status != 200:
+                raise RuntimeError(f"ip-api.com batch lookup returned HTTP {status}")
+            if int(names.get('x-rl', '1')) <= 0:
+                self._paused_until = time.monotonic() + reset
+            for address, result in zip(batch, json.loads(body.decode())):
+                self.known[address] = app._parse_ip_api(result)
+            return
+
+
+def _needs_geo(visit):
+    address = visit.get('ipAddress', {}).get('S')
+    return 'country' not in visit and address not in (None, 'Unknown', '127.0.0.1')
+
+
+def _needs_user_agent(visit):
+    return 'userAgent' in visit and int(visit.get('uaParserVersion', {}).get('N', '0')) < ua_parser.PARSER_VERSION
+
+
+def enrichment(visit, geo_data):
+    """Logical attributes to set on a visit, from its geolocation and a fresh parse of its user agent."""
+    updates = {}
+    if geo_data and 'country' not in visit:
+        for field in GEO_FIELDS:
+            value = geo_data.get(field)
+            if value is None or value == '':
+                continue
+            updates[field] = {'N': str(value)} if field in ('latitude', 'longitude') else {'S': value}
+    if _needs_user_agent(visit):
+        parsed = ua_parser.parse(visit['userAgent']['S'])
+        for field in USER_AGENT_FIELDS:
+            if field == 'isBot':
+                updates[field] = {'BOOL': parsed.get('isBot', False)}
+            elif parsed.get(field):
+                updates[field] = {'S': parsed[field]}
+        updates['uaParserVersion'] = {'N': str(ua_parser.PARSER_VERSION)}
+    return updates
+
+
+def update_visit(client, table_name, stored, updates):
+    """SET the logical attributes in updates on a stored visit, in the encoding it was stored with."""
+    if compact.is_compact(stored):
+        updates = dict(compact.encode_attribute(name, value) for name, value in updates.items())
+    names = {f"#a{n}": name for n, name in enumerate(updates)}
+    values = {f":v{n}": value for n, value in enumerate(updates.values())}
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key={'visitId': stored['visitId']},
+            UpdateExpression='SET ' + ', '.join(f"#a{n} = :v{n}" for n in range(len(updates))),
+            ConditionExpression='attribute_exists(visitId)',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+        return True
+    except client.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def reenrich_segment(client, table_name, segment, total_segments, resolver, checkpoint, writer):
+    """Re-enrich every visit in one Scan segment, saving the checkpoint after each page. Returns its counts."""
+    counts = {'scanned': 0, 'updated': 0, 'unresolved': 0}
+    position = checkpoint.position(segment)
+    if position['done']:
+        return counts
+    scan = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': 'attribute_exists(#ts)',
+        'ExpressionAttributeNames': {'#ts': 'timestamp'}
+    }
+    if position['lastKey']:
+        scan['ExclusiveStartKey'] = position['lastKey']
+    # Interned user agents of compact visits can only be re-parsed with the dictionary table
+    resolve_user_agents = bool(os.environ.get('userAgentTableName'))
+
+    while True:
+        response = client.scan(**scan)
+        stored = response.get('Items', [])
+        candidates = [(item, visit) for item, visit in zip(stored, app.decode_visit_items(stored, resolve_user_agents))
+                      if _needs_geo(visit) or _needs_user_agent(visit)]
+        geo = resolver.resolve([visit['ipAddress']['S'] for _, visit in candidates if _needs_geo(visit)])
+
+        work = []
+        for item, visit in candidates:
+            geo_data = geo.get(visit['ipAddress']['S']) if _needs_geo(visit) else None
+            if _needs_geo(visit) and not geo_data:
+                counts['unresolved'] += 1
+            updates = enrichment(visit, geo_data)
+            if updates:
+                work.append((item, updates))
+        counts['updated'] += sum(writer.map(lambda job: update_visit(client, table_name, *job), work))
+        counts['scanned'] += len(stored)
+
+        last_key = response.get('LastEvaluatedKey')
+        checkpoint.save(segment, last_key)
+        if not last_key:
+            return counts
+        scan['ExclusiveStartKey'] = last_key
+
+
+def reenrich(client, table_name, pool, segments=4, write_workers=8, checkpoint=None):
+    """Re-enrich the whole table. Returns counts of visits scanned, updated and left without geolocation."""
+    checkpoint = checkpoint or Checkpoint()
+    checkpoint.total_segments = segments
+    resolver = BatchGeoResolver(pool, checkpoint.geo)
+    with ThreadPoolExecutor(max_workers=write_workers) as writer, \
+            ThreadPoolExecutor(max_workers=segments) as scanners:
+        results = list(scanners.map(
+            lambda segment: reenrich_segment(client, table_name, segment, segments, resolver, checkpoint, writer),
+            range(segments)
+        ))
+    totals = {name: sum(counts[name] for counts in results) for name in ('scanned', 'updated', 'unresolved')}
+    totals['lookups'] = resolver.calls
+    return totals
+
+
+def main(argv=None, client=None, pool=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', required=True, help='Visitor details table name')
+    parser.add_argument('--segments', type=int, default=4, help='Parallel Scan segments')
+    parser.add_argument('--write-workers', type=int, default=8, help='Concurrent UpdateItem calls')
+    parser.add_argument('--checkpoint', help='JSON file to resume from and save progress to')
+    parser.add_argument('--user-agent-table', default=os.environ.get('userAgentTableName'),
+                        help='Dictionary table of compact visits, to re-parse their user agents too')
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    parser.add_argument('--endpoint-url', help='DynamoDB endpoint, e.g. DynamoDB Local')
+    args = parser.parse_args(argv)
+
+    if args.segments < 1 or args.write_workers < 1:
+        parser.error('--segments and --write-workers must be at least 1')
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if checkpoint.total_segments not in (None, args.segments):
+        parser.error(f"{args.checkpoint} was written with --segments {checkpoint.total_segments}")
+
+    client = client or boto3.client('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url)
+    # Visits are decoded with the function's own reader, which looks up interned user agents with its client
+    app._ddb_client = client
+    if args.user_agent_table:
+        os.environ['userAgentTableName'] = args.user_agent_table
+    pool = pool or KeepAlivePool(app.GEO_API_HOST, timeout=10.0)
+
+    totals = reenrich(client, args.table, pool, args.segments, args.write_workers, checkpoint)
+    print(f"Scanned {totals['scanned']} visits, updated {totals['updated']}, "
+          f"{totals['unresolved']} still without geolocation, {totals['lookups']} batch lookups")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from benchmarks import corpus, suite
+
+
+def test_suite_cases_run(monkeypatch):
+    """Test every benchmark case runs against the current code, with the handler cases answering 200"""
+    import visitor.app
+    # The handler case swaps in stubs; restore the real client, pool and table afterwards
+    monkeypatch.setattr(visitor.app, '_ddb_client', visitor.app._ddb_client)
+    monkeypatch.setattr(visitor.app, 'geo_pool', visitor.app.geo_pool)
+    monkeypatch.setenv('tableName', 'visitor_test')
+
+    results = suite.run(list(suite.CASES), number=20, rounds=1)
+
+    assert set(results) == set(suite.CASES)
+    assert all(result['median_ns'] > 0 for result in results.values())
+
+
+def test_handler_cases_fail_on_error_responses(monkeypatch):
+    """Test a handler case raises rather than timing a failing handler"""
+    import visitor.app
+    monkeypatch.setattr(visitor.app, '_ddb_client', visitor.app._ddb_client)
+    monkeypatch.setattr(visitor.app, 'geo_pool', visitor.app.geo_pool)
+    monkeypatch.setenv('tableName', 'visitor_test')
+    func, inputs = suite.case_lambda_handler(1)
+    monkeypatch.delenv('tableName')
+
+    with pytest.raises(AssertionError, match='handler returned 500'):
+        func(inputs[0])
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    """Test slowdowns within tolerance, and cases missing from the baseline, pass"""
+    baseline = {'cases': {'a': {'median_ns': 100}, 'b': {'median_ns': 100}}}
+    results = {'a': {'median_ns': 120}, 'b': {'median_ns': 150}, 'c': {'median_ns': 999}}
+
+    regressions = suite.compare(results, baseline, tolerance=0.25)
+
+    assert [name for name, *_ in regressions] == ['b']
+
+
+def test_corpus_addresses_repeat_visitors():
+    """Test the address corpus mixes IPv4 and IPv6 and brings visitors back"""
+    addresses = corpus.ip_addresses(400, visitors=50)
+
+    assert len(set(addresses)) <= 50
+    assert any(':' in address for address in addresses)
+    assert any('.' in address for address in addresses)
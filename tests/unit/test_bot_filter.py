@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from datetime import datetime
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor import bot_filter
+
+TABLE_NAME = 'visitor_test'
+CHROME = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+          'Chrome/120.0.0.0 Safari/537.36')
+BROWSER_HEADERS = {'User-Agent': CHROME, 'Accept-Language': 'en-US,en;q=0.9'}
+
+
+def test_classify_user_agents_and_headers():
+    """Test bot signatures, missing agents and tell-tale headers are caught, browsers pass"""
+    assert bot_filter.classify(CHROME, BROWSER_HEADERS, '203.0.113.9') is None
+    assert bot_filter.classify('Mozilla/5.0 (compatible; Googlebot/2.1)', {}, '66.249.66.1') == 'user-agent'
+    assert bot_filter.classify('Unknown', {}, '203.0.113.9') == 'no-user-agent'
+    assert bot_filter.classify(CHROME, {'User-Agent': CHROME}, '203.0.113.9') == 'headers'
+    assert bot_filter.classify(CHROME, {**BROWSER_HEADERS, 'Sec-Purpose': 'prefetch'}, '203.0.113.9') == 'prefetch'
+    assert bot_filter.classify(CHROME, {'User-Agent': CHROME}, '203.0.113.9', header_checks=False) is None
+
+
+def test_prefix_sets_deny_and_allow():
+    """Test deny prefixes catch browsers too, and allow prefixes override every check"""
+    deny = bot_filter.PrefixSet.parse('198.51.100.0/24, 2001:db8::/32')
+    allow = bot_filter.PrefixSet.parse('192.0.2.10/32')
+
+    assert '198.51.100.77' in deny
+    assert '2001:db8:1::5' in deny
+    assert '203.0.113.9' not in deny
+    assert 'Unknown' not in deny
+    assert bot_filter.classify(CHROME, BROWSER_HEADERS, '198.51.100.77', deny=deny) == 'deny-list'
+    assert bot_filter.classify('curl/8.4.0', {}, '192.0.2.10', deny=deny, allow=allow) is None
+
+
+def test_bot_name():
+    """Test automated traffic is aggregated under a short product name"""
+    assert bot_filter.bot_name('Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)') == 'Googlebot'
+    assert bot_filter.bot_name('facebookexternalhit/1.1') == 'facebookexternalhit'
+    assert bot_filter.bot_name('curl/8.4.0') == 'curl'
+
+
+@pytest.fixture
+def bot_event():
+    return {
+        'requestContext': {},
+        'headers': {'X-Forwarded-For': '66.249.66.1', 'User-Agent': 'Mozilla/5.0 (compatible; Googlebot/2.1)'}
+    }
+
+
+def test_skip_mode_does_no_io(monkeypatch, bot_event):
+    """Test filtered requests return before any DynamoDB call or geolocation lookup"""
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('botFilter', 'skip')
+
+    with patch.object(visitor.app, 'get_ddb_client', side_effect=AssertionError("DynamoDB used")), \
+         patch.object(visitor.app, 'get_geolocation', side_effect=AssertionError("geolocation used")):
+        response = visitor.app.lambda_handler(bot_event, "")
+
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert body['visitorCount'] is None
+
+
+@mock_dynamodb
+def test_aggregate_mode_counts_bots_only_in_rollup(monkeypatch, bot_event):
+    """Test filtered requests only bump the day's BOTS# item"""
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('botFilter', 'aggregate')
+    client = boto3.client('dynamodb', 'us-east-1')
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+    with patch.object(visitor.app, 'get_geolocation', side_effect=AssertionError("geolocation used")):
+        visitor.app.lambda_handler(bot_event, "")
+        visitor.app.lambda_handler(bot_event, "")
+
+    items = client.scan(TableName=TABLE_NAME)['Items']
+    assert [item['visitId']['S'] for item in items] == [f"BOTS#{datetime.now().date().isoformat()}"]
+    assert items[0]['visits'] == {'N': '2'}
+    assert items[0]['reason#user-agent'] == {'N': '2'}
+    assert items[0]['agent#Googlebot'] == {'N': '2'}
+
+
+def test_prefix_lists_match_the_source_address(monkeypatch):
+    """Test deny and allow prefixes match API Gateway's source address, not a spoofable X-Forwarded-For"""
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('botFilter', 'skip')
+    monkeypatch.setenv('botDenyPrefixes', '198.51.100.0/24')
+    monkeypatch.setenv('botAllowPrefixes', '192.0.2.10/32')
+
+    def visit(source_ip, forwarded_for, headers=BROWSER_HEADERS):
+        event = {
+            'requestContext': {'identity': {'sourceIp': source_ip}},
+            'headers': {**headers, 'X-Forwarded-For': forwarded_for}
+        }
+        with patch.object(visitor.app, 'get_ddb_client', side_effect=AssertionError("DynamoDB used")), \
+             patch.object(visitor.app, 'get_geolocation', side_effect=AssertionError("geolocation used")):
+            return json.loads(visitor.app.lambda_handler(event, "")['body'])
+
+    # A deny-listed client can't get out by prepending someone else's address...
+    assert visit('198.51.100.77', '203.0.113.9, 198.51.100.77')['visitorCount'] is None
+    # ...and nobody gets allow-listed by claiming an allow-listed one
+    assert visit('203.0.113.9', '192.0.2.10', {'User-Agent': 'curl/8.4.0'})['visitorCount'] is None
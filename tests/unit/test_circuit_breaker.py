@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from visitor.http_pool import KeepAlivePool
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    """Stand-in for ip-api.com (/json/<ip>) and ipwho.is (/<ip>) with injectable delay and status."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        ip = self.path.split('?')[0].rsplit('/', 1)[-1]
+        if self.path.startswith('/json/'):
+            body = {'status': 'success', 'country': self.server.country, 'countryCode': 'XX', 'query': ip}
+        else:
+            body = {'success': True, 'country': self.server.country, 'country_code': 'XX',
+                    'timezone': {'id': 'UTC'}, 'connection': {'isp': 'Example'}}
+        payload = json.dumps(body).encode()
+        self.send_response(self.server.status)
+        for name, value in self.server.extra_headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_upstream(country):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Upstream)
+    httpd.daemon_threads = True
+    httpd.requests, httpd.delay, httpd.status, httpd.extra_headers = 0, 0.0, 200, {}
+    httpd.country = country
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    import visitor.app as app
+    primary, secondary = _start_upstream('Primary'), _start_upstream('Secondary')
+    pools = [KeepAlivePool('127.0.0.1', server.server_address[1], timeout=1.0) for server in (primary, secondary)]
+    monkeypatch.setattr(app, 'geo_pool', pools[0])
+    monkeypatch.setattr(app, 'geo_breaker', CircuitBreaker(failure_threshold=2, open_seconds=30,
+                                                           slow_call_seconds=0.15))
+    monkeypatch.setattr(app, '_secondary_geo', ('ipwho.is', pools[1], CircuitBreaker(failure_threshold=2)))
+    monkeypatch.setenv('geoSourceOrder', 'api')
+    app.geo_cache.clear()
+    yield app, primary, secondary
+    app.geo_cache.clear()
+    for pool, server in zip(pools, (primary, secondary)):
+        pool.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_breaker_opens_after_failures_within_window():
+    """Test failures only open the circuit when enough of them fall inside the window"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, window=10, open_seconds=30, clock=clock)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now += 11
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_probes_half_open_once():
+    """Test an expired open circuit lets one probe through, closing on success and reopening on failure"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=30, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # probe in flight
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success(0.05)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_slow_calls_count_as_failures():
+    """Test calls slower than the threshold open the circuit although they succeeded"""
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=0.5, clock=FakeClock())
+
+    breaker.record_success(0.9)
+    breaker.record_success(0.1)
+    breaker.record_success(0.7)
+
+    assert breaker.state == OPEN
+
+
+def test_rate_limit_response_opens_circuit_until_reset(upstreams, monkeypatch):
+    """Test a 429 with X-Ttl stops all lookups without caching a failure per address"""
+    app, primary, _ = upstreams
+    monkeypatch.delenv('geoSecondaryProvider', raising=False)
+    primary.status, primary.extra_headers = 429, {'X-Rl': '0', 'X-Ttl': '42'}
+
+    assert app.get_geolocation('198.51.100.7') is None
+    assert app.geo_breaker.state == OPEN
+    primary.status, primary.extra_headers = 200, {}
+
+    assert app.get_geolocation('192.0.2.10') is None
+    assert primary.requests == 1
+    assert app.geo_cache.get('192.0.2.10') is app.MISSING
+
+
+def test_exhausted_rate_limit_pauses_after_answer(upstreams, monkeypatch):
+    """Test the answer that used up the rate limit is kept and further lookups wait for the reset"""
+    app, primary, _ = upstreams
+    monkeypatch.delenv('geoSecondaryProvider', raising=False)
+    primary.extra_headers = {'X-Rl': '0', 'X-Ttl': '10'}
+
+    assert app.get_geolocation('198.51.100.7')['country'] == 'Primary'
+    assert app.geo_breaker.state == OPEN
+
+
+def test_slow_upstream_opens_circuit(upstreams, monkeypatch):
+    """Test repeated slow answers trip the breaker so later visits don't wait on the upstream"""
+    app, primary, _ = upstreams
+    monkeypatch.delenv('geoSecondaryProvider', raising=False)
+    primary.delay = 0.2
+
+    app.get_geolocation('198.51.100.7')
+    app.get_geolocation('203.0.113.9')
+    assert app.geo_breaker.state == OPEN
+
+    start = time.monotonic()
+    assert app.get_geolocation('192.0.2.10') is None
+    assert time.monotonic() - start < 0.1
+    assert primary.requests == 2
+
+
+def test_slow_primary_is_hedged_to_secondary(upstreams, monkeypatch):
+    """Test a lookup the primary hasn't answered within geoHedgeAfterMs is answered by the secondary"""
+    app, primary, secondary = upstreams
+    monkeypatch.setenv('geoSecondaryProvider', 'ipwho.is')
+    monkeypatch.setenv('geoHedgeAfterMs', '50')
+    primary.delay = 0.6
+
+    start = time.monotonic()
+    geo_data = app.get_geolocation('198.51.100.7')
+
+    assert time.monotonic() - start < 0.4
+    assert geo_data['country'] == 'Secondary'
+    assert geo_data['timezone'] == 'UTC' and geo_data['isp'] == 'Example'
+    assert secondary.requests == 1
+
+
+def test_fast_primary_is_not_hedged(upstreams, monkeypatch):
+    """Test the secondary provider isn't called when the primary answers in time"""
+    app, primary, secondary = upstreams
+    monkeypatch.setenv('geoSecondaryProvider', 'ipwho.is')
+    monkeypatch.setenv('geoHedgeAfterMs', '300')
+
+    assert app.get_geolocation('198.51.100.7')['country'] == 'Primary'
+    assert secondary.requests == 0
+
+
+def test_open_primary_goes_straight_to_secondary(upstreams, monkeypatch):
+    """Test lookups use the secondary immediately while the primary's circuit is open"""
+    app, primary, secondary = upstreams
+    monkeypatch.setenv('geoSecondaryProvider', 'ipwho.is')
+    monkeypatch.setenv('geoHedgeAfterMs', '1000')
+    app.geo_breaker.open_for(60)
+
+    start = time.monotonic()
+    assert app.get_geolocation('198.51.100.7')['country'] == 'Secondary'
+    assert time.monotonic() - start < 0.5
+    assert primary.requests == 0
@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from benchmarks import import_time
+
+PROBE = """
+import json, sys
+import visitor.app as app
+app.lambda_handler({'httpMethod': 'OPTIONS'}, None)
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def test_options_preflight_loads_no_aws_or_http_machinery():
+    """Test importing the handler and serving OPTIONS leaves AWS clients and urllib unloaded"""
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+    env = dict(os.environ, AWS_REGION='us-east-1', tableName='visitor_test')
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=root, env=env,
+                            capture_output=True, text=True, check=True)
+    loaded = set(json.loads(result.stdout))
+
+    forbidden = import_time.load_budget()['forbiddenModules']
+    assert not loaded.intersection(forbidden)
+
+
+def test_import_budget_check_reports_violations():
+    """Test slow medians and eagerly loaded modules are reported against the budget"""
+    budget = {'importMs': 50, 'optionsMs': 1, 'forbiddenModules': ['boto3']}
+    runs = [
+        {'importMs': 40, 'optionsMs': 0.2, 'modules': {'app'}},
+        {'importMs': 90, 'optionsMs': 0.2, 'modules': {'app', 'boto3'}},
+        {'importMs': 60, 'optionsMs': 0.3, 'modules': {'app'}},
+    ]
+
+    violations = import_time.check(runs, budget)
+
+    assert len(violations) == 2
+    assert 'importMs' in violations[0]
+    assert 'boto3' in violations[1]
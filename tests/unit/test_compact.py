@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from datetime import datetime
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor import compact
+from visitor.http_pool import KeepAlivePool
+
+TABLE_NAME = 'visitor_test'
+USER_AGENT_TABLE = 'visitor_user_agents'
+CHROME = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+          "Chrome/120.0.0.0 Safari/537.36")
+
+
+def _visit_item(app, visit_id='visit-1', user_agent=CHROME, timestamp='2024-05-01T13:45:10Z'):
+    return app.build_visit_item(
+        visit_id, 7, timestamp, '203.0.113.0', user_agent, app.parse_user_agent(user_agent),
+        'https://www.linkedin.com/in/someone',
+        {'country': 'Canada', 'countryCode': 'CA', 'city': 'Toronto', 'latitude': 43.65, 'longitude': -79.38}
+    )
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        monkeypatch.setenv('userAgentTableName', USER_AGENT_TABLE)
+        monkeypatch.setenv('visitEncoding', 'compact')
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[
+                {'AttributeName': 'visitId', 'AttributeType': 'S'},
+                {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+                {'AttributeName': 'timeBucket', 'AttributeType': 'S'}
+            ],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'TimeBucketIndex',
+                'KeySchema': [
+                    {'AttributeName': 'timeBucket', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'uaHash', 'AttributeType': 'S'}],
+            TableName=USER_AGENT_TABLE,
+            KeySchema=[{'AttributeName': 'uaHash', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        visitor.app._known_user_agents.clear()
+        visitor.app.geo_cache.clear()
+        yield visitor.app, client
+        visitor.app.geo_cache.clear()
+
+
+def test_encode_decode_roundtrip():
+    """Test a compact item decodes back to the logical item, with enums and short codes"""
+    import visitor.app as app
+    item = _visit_item(app)
+
+    stored, ua_hash = compact.encode(item)
+    assert ua_hash == compact.user_agent_hash(CHROME)
+    assert 'userAgent' not in stored and 'browser' not in stored
+    assert stored['b'] == {'N': str(compact.ENUMS['browser'].index('Chrome'))}
+    assert stored['visitId'] == item['visitId'] and stored['timeBucket'] == item['timeBucket']
+    assert compact.item_size(stored) < compact.item_size(item) * 0.7
+
+    assert compact.decode(stored, {ua_hash: CHROME}) == item
+
+
+def test_decode_keeps_values_outside_the_enums():
+    """Test browsers missing from the enum tables are stored as strings, and unknown indexes decode as Unknown"""
+    stored, _ = compact.encode({'visitId': {'S': 'v'}, 'browser': {'S': 'Lynx'}, 'os': {'S': 'Windows'}})
+    assert stored['b'] == {'S': 'Lynx'}
+
+    stored['o'] = {'N': '999'}
+    assert compact.decode(stored) == {'visitId': {'S': 'v'}, 'browser': {'S': 'Lynx'}, 'os': {'S': 'Unknown'}}
+
+
+def test_legacy_items_pass_through():
+    """Test items written before compact encoding are returned unchanged"""
+    import visitor.app as app
+    item = _visit_item(app)
+
+    assert not compact.is_compact(item)
+    assert compact.decode(item) is item
+
+
+def test_item_size_follows_dynamodb_rules():
+    """Test item size counts attribute names, UTF-8 string bytes and packed number digits"""
+    assert compact.item_size({'ab': {'S': 'café'}}) == 2 + 5
+    assert compact.item_size({'n': {'N': '12345'}}) == 1 + 4
+    assert compact.item_size({'t': {'BOOL': True}}) == 2
+
+
+def test_handler_writes_compact_items_and_interns_user_agent(dynamodb):
+    """Test a compact visit stores the agent once in the dictionary table and decodes to the full record"""
+    app, client = dynamodb
+    event = {'requestContext': {}, 'headers': {'X-Forwarded-For': '203.0.113.9', 'User-Agent': CHROME}}
+    geo = (200, {}, json.dumps({'status': 'success', 'country': 'Canada', 'countryCode': 'CA'}).encode())
+
+    with patch.object(KeepAlivePool, 'get', return_value=geo):
+        for _ in range(2):
+            assert app.lambda_handler(event, "")['statusCode'] == 200
+
+    agents = client.scan(TableName=USER_AGENT_TABLE)['Items']
+    assert agents == [{'uaHash': {'S': compact.user_agent_hash(CHROME)}, 'userAgent': {'S': CHROME}}]
+
+    stored = [item for item in client.scan(TableName=TABLE_NAME)['Items'] if 'timestamp' in item]
+    assert len(stored) == 2
+    assert all(compact.is_compact(item) and 'userAgent' not in item for item in stored)
+
+    app._known_user_agents.clear()
+    decoded = app.decode_visit_items(stored)
+    assert {item['userAgent']['S'] for item in decoded} == {CHROME}
+    assert {item['browser']['S'] for item in decoded} == {'Chrome'}
+    assert {item['country']['S'] for item in decoded} == {'Canada'}
+
+
+def test_user_agent_stored_inline_when_dictionary_write_fails(dynamodb, monkeypatch):
+    """Test a visit keeps its user agent inline if the dictionary table can't be written"""
+    app, client = dynamodb
+    monkeypatch.setenv('userAgentTableName', 'missing_table')
+
+    stored = app.stored_item(_visit_item(app))
+
+    assert stored[compact.USER_AGENT_INLINE] == {'S': CHROME}
+    assert compact.decode(stored)['userAgent'] == {'S': CHROME}
+
+
+def test_recent_visits_decode_mixed_encodings(dynamodb, monkeypatch):
+    """Test /visitor/recent returns the same fields for full and compact items"""
+    app, client = dynamodb
+    timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    monkeypatch.setenv('visitEncoding', 'full')
+    client.put_item(TableName=TABLE_NAME, Item=app.stored_item(_visit_item(app, 'visit-full', timestamp=timestamp)))
+    monkeypatch.setenv('visitEncoding', 'compact')
+    client.put_item(TableName=TABLE_NAME, Item=app.stored_item(_visit_item(app, 'visit-compact', timestamp=timestamp)))
+
+    response = app.lambda_handler(
+        {'httpMethod': 'GET', 'path': '/visitor/recent', 'queryStringParameters': {'hours': '1'}}, ""
+    )
+
+    visits = json.loads(response['body'])['visits']
+    assert len(visits) == 2
+    assert visits[0] == visits[1]
+    assert visits[0]['browser'] == 'Chrome' and visits[0]['city'] == 'Toronto'
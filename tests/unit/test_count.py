@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+TABLE_NAME = 'visitor_test'
+
+
+def _get_count(app, headers=None):
+    return app.lambda_handler({'httpMethod': 'GET', 'path': '/visitor/count', 'headers': headers or {}}, "")
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.put_item(TableName=TABLE_NAME, Item={
+            'visitId': {'S': 'COUNTER'}, 'visitCount': {'N': '41'}, 'lastUpdated': {'S': '2024-05-01T13:45:10Z'}
+        })
+        visitor.app.count_cache.clear()
+        yield visitor.app, client
+
+
+def test_count_reads_without_incrementing(dynamodb):
+    """Test /visitor/count returns the stored count and leaves the counter alone"""
+    app, client = dynamodb
+
+    response = _get_count(app)
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {'visitorCount': 41, 'lastUpdated': '2024-05-01T13:45:10Z'}
+    assert response['headers']['Cache-Control'] == 'public, max-age=10'
+    assert response['headers']['ETag']
+    counter = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'COUNTER'}})['Item']
+    assert counter['visitCount'] == {'N': '41'}
+
+
+def test_count_is_served_from_the_warm_container_cache(dynamodb):
+    """Test repeated reads within countCacheTtl don't go back to DynamoDB"""
+    app, _ = dynamodb
+    _get_count(app)
+
+    with patch.object(app.get_ddb_client(), 'get_item', side_effect=AssertionError("read not cached")):
+        response = _get_count(app)
+
+    assert json.loads(response['body'])['visitorCount'] == 41
+
+
+def test_count_revalidates_with_etag(dynamodb):
+    """Test a matching If-None-Match gets 304 and a new visit changes the ETag"""
+    app, client = dynamodb
+    etag = _get_count(app)['headers']['ETag']
+
+    not_modified = _get_count(app, {'If-None-Match': etag})
+    assert not_modified['statusCode'] == 304
+    assert not_modified['body'] == ''
+    assert not_modified['headers']['ETag'] == etag
+
+    client.put_item(TableName=TABLE_NAME, Item={
+        'visitId': {'S': 'COUNTER'}, 'visitCount': {'N': '42'}, 'lastUpdated': {'S': '2024-05-01T13:50:00Z'}
+    })
+    app.count_cache.clear()
+    changed = _get_count(app, {'if-none-match': etag})
+    assert changed['statusCode'] == 200
+    assert changed['headers']['ETag'] != etag
+
+
+def test_count_uses_starting_number_before_first_visit(dynamodb, monkeypatch):
+    """Test a table without a counter reports the configured starting number minus one"""
+    app, client = dynamodb
+    monkeypatch.setenv('startingVisitNumber', '100')
+    client.delete_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'COUNTER'}})
+
+    assert json.loads(_get_count(app)['body'])['visitorCount'] == 99
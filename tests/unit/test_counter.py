@@ -0,0 +1,274 @@
+import os
+import sys
+import boto3
+import pytest
+from unittest.mock import patch
+from moto import mock_dynamodb
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
+
+TABLE_NAME = 'visitor_test'
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    """Create a mocked visitor table"""
+    monkeypatch.setenv('AWS_REGION', 'us-east-1')
+    with mock_dynamodb():
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        yield client
+
+    # Drop any block of visit numbers reserved by the simulated container
+    import visitor.app
+    visitor.app._visit_block = None
+    visitor.app._counter_snapshot = None
+
+
+def _count(client, key):
+    item = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': key}}).get('Item')
+    return int(item['visitCount']['N']) if item else None
+
+
+def test_sharded_counter_spreads_writes(dynamodb, monkeypatch):
+    """Test sharded mode increments shard items and reports the aggregate total"""
+    import visitor.app
+    monkeypatch.setenv('counterShards', '4')
+
+    numbers = [visitor.app.get_next_visit_number(TABLE_NAME, 1)[0] for _ in range(20)]
+
+    assert numbers == list(range(1, 21))
+    assert _count(dynamodb, 'COUNTER') is None
+    assert sum(_count(dynamodb, key) or 0 for key in visitor.app.counter_shard_keys(4)) == 20
+    assert visitor.app.read_visit_count(TABLE_NAME, 1)[0] == 20
+
+
+def test_sharded_counter_hash_selection_is_stable(dynamodb, monkeypatch):
+    """Test hash selection keeps one client on one shard"""
+    import visitor.app
+    monkeypatch.setenv('counterShards', '8')
+    monkeypatch.setenv('counterShardSelection', 'hash')
+
+    for _ in range(5):
+        visitor.app.get_next_visit_number(TABLE_NAME, 1, shard_key='203.0.0.0')
+
+    counts = [_count(dynamodb, key) for key in visitor.app.counter_shard_keys(8)]
+    assert sorted(count for count in counts if count) == [5]
+
+
+def test_sharded_counter_includes_legacy_counter(dynamodb, monkeypatch):
+    """Test enabling sharding continues from the existing single COUNTER"""
+    import visitor.app
+    dynamodb.put_item(TableName=TABLE_NAME, Item={
+        'visitId': {'S': 'COUNTER'},
+        'visitCount': {'N': '700'},
+        'lastUpdated': {'S': '2024-01-01T00:00:00Z'}
+    })
+    monkeypatch.setenv('counterShards', '4')
+
+    visit_number, previous_last_updated = visitor.app.get_next_visit_number(TABLE_NAME, 1)
+
+    assert visit_number == 701
+    assert previous_last_updated == '2024-01-01T00:00:00Z'
+
+
+def test_migrate_counter_shards_fold_and_collapse(dynamodb, monkeypatch):
+    """Test the migration script moves the count without losing visits"""
+    import visitor.app
+    import migrate_counter_shards
+    dynamodb.put_item(TableName=TABLE_NAME, Item={
+        'visitId': {'S': 'COUNTER'},
+        'visitCount': {'N': '700'},
+        'lastUpdated': {'S': '2024-01-01T00:00:00Z'}
+    })
+    monkeypatch.setenv('counterShards', '4')
+
+    migrate_counter_shards.main(['fold', '--table', TABLE_NAME, '--shards', '4'], client=dynamodb)
+    assert _count(dynamodb, 'COUNTER') is None
+    assert _count(dynamodb, 'COUNTER#0') == 700
+
+    visitor.app.get_next_visit_number(TABLE_NAME, 1)
+    assert visitor.app.read_visit_count(TABLE_NAME, 1)[0] == 701
+
+    migrate_counter_shards.main(['collapse', '--table', TABLE_NAME, '--shards', '4'], client=dynamodb)
+    assert _count(dynamodb, 'COUNTER') == 701
+    assert all(_count(dynamodb, key) is None for key in visitor.app.counter_shard_keys(4))
+
+
+def test_migrate_counter_shards_keeps_count_with_starting_number(dynamodb, monkeypatch):
+    """Test fold and collapse neither add nor drop the startingVisitNumber offset"""
+    import visitor.app
+    import migrate_counter_shards
+    for _ in range(2):
+        visitor.app.get_next_visit_number(TABLE_NAME, 700)  # legacy COUNTER at 701
+    monkeypatch.setenv('counterShards', '4')
+    visitor.app.get_next_visit_number(TABLE_NAME, 700)
+    assert visitor.app.read_visit_count(TABLE_NAME, 700)[0] == 702
+
+    migrate_counter_shards.main(['fold', '--table', TABLE_NAME, '--shards', '4', '--starting-number', '700'],
+                                client=dynamodb)
+    assert _count(dynamodb, 'COUNTER') is None
+    assert visitor.app.read_visit_count(TABLE_NAME, 700)[0] == 702
+    assert visitor.app.get_next_visit_number(TABLE_NAME, 700)[0] == 703
+
+    migrate_counter_shards.main(['collapse', '--table', TABLE_NAME, '--shards', '4', '--starting-number', '700'],
+                                client=dynamodb)
+    monkeypatch.delenv('counterShards')
+    assert _count(dynamodb, 'COUNTER') == 703
+    assert visitor.app.get_next_visit_number(TABLE_NAME, 700)[0] == 704
+
+
+def test_block_allocation_reserves_numbers_in_blocks(dynamodb, monkeypatch):
+    """Test block mode hands out sequential numbers with one write per block"""
+    import visitor.app
+    monkeypatch.setenv('counterBlockSize', '4')
+
+    with patch.object(visitor.app.get_ddb_client(), 'update_item', wraps=visitor.app.get_ddb_client().update_item) as update_item:
+        numbers = [visitor.app.get_next_visit_number(TABLE_NAME, 700)[0] for _ in range(10)]
+
+    assert numbers == list(range(700, 710))
+    assert update_item.call_count == 3
+    assert _count(dynamodb, 'COUNTER') == 711
+
+
+def test_block_allocation_gives_containers_disjoint_blocks(dynamodb, monkeypatch):
+    """Test two containers never hand out the same number"""
+    import visitor.app
+    monkeypatch.setenv('counterBlockSize', '5')
+
+    first_container = [visitor.app.get_next_visit_number(TABLE_NAME, 1)[0] for _ in range(3)]
+    visitor.app._visit_block = None
+    second_container = [visitor.app.get_next_visit_number(TABLE_NAME, 1)[0] for _ in range(3)]
+
+    assert first_container == [1, 2, 3]
+    assert second_container == [6, 7, 8]
+
+
+def test_block_allocation_abandons_stale_blocks(dynamodb, monkeypatch):
+    """Test blocks older than counterBlockMaxAge are replaced to keep counts current"""
+    import visitor.app
+    monkeypatch.setenv('counterBlockSize', '10')
+    monkeypatch.setenv('counterBlockMaxAge', '0')
+
+    numbers = [visitor.app.get_next_visit_number(TABLE_NAME, 1)[0] for _ in range(3)]
+
+    assert numbers == [1, 11, 21]
+
+
+def _visit_item(visit_id):
+    return {'visitId': {'S': visit_id}, 'timestamp': {'S': '2024-01-01T00:00:00Z'}}
+
+
+def test_transactional_write_records_count_and_visit(dynamodb):
+    """Test the counter and the visit record are written by one transaction"""
+    import visitor.app
+
+    with patch.object(visitor.app.get_ddb_client(), 'get_item', wraps=visitor.app.get_ddb_client().get_item) as get_item:
+        first = visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-1'), 700)
+        second = visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-2'), 700)
+
+    assert first == (700, None)
+    assert second[0] == 701
+    assert second[1] is not None
+    # Only the cold call had to read the counter
+    assert get_item.call_count == 1
+    assert _count(dynamodb, 'COUNTER') == 701
+    stored = dynamodb.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'visit-2'}})['Item']
+    assert stored['visitNumId']['N'] == '701'
+
+
+def test_transactional_write_retries_when_counter_moved(dynamodb):
+    """Test a stale container snapshot is corrected and the visit still recorded"""
+    import visitor.app
+
+    visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-1'), 1)
+    # Another container increments the counter behind this one's back
+    dynamodb.update_item(
+        TableName=TABLE_NAME,
+        Key={'visitId': {'S': 'COUNTER'}},
+        UpdateExpression='ADD visitCount :incr',
+        ExpressionAttributeValues={':incr': {'N': '5'}}
+    )
+
+    visit_number, _ = visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-2'), 1)
+
+    assert visit_number == 7
+    assert _count(dynamodb, 'COUNTER') == 7
+
+
+def test_transactional_write_retries_conflicting_transactions(dynamodb):
+    """Test a TransactionConflict cancellation is retried against a fresh read of the counter"""
+    import botocore.exceptions
+    import visitor.app
+
+    visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-1'), 1)
+    client = visitor.app.get_ddb_client()
+    transact = client.transact_write_items
+    conflict = botocore.exceptions.ClientError({
+        'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+        'CancellationReasons': [{'Code': 'TransactionConflict'}, {'Code': 'None'}]
+    }, 'TransactWriteItems')
+
+    def conflict_once(**kwargs):
+        # The conflicting transaction was another visit, so the counter moves too
+        dynamodb.update_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'COUNTER'}},
+                             UpdateExpression='ADD visitCount :incr', ExpressionAttributeValues={':incr': {'N': '1'}})
+        raise conflict
+
+    attempts = iter([conflict_once, transact])
+    with patch.object(client, 'transact_write_items', side_effect=lambda **kwargs: next(attempts)(**kwargs)) as calls, \
+            patch.object(visitor.app.time, 'sleep'):
+        visit_number, _ = visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-2'), 1)
+
+    assert visit_number == 3
+    assert calls.call_count == 2
+    assert _count(dynamodb, 'COUNTER') == 3
+
+
+def test_transactional_write_raises_on_other_cancellations(dynamodb):
+    """Test cancellations a retry can't fix, like a validation error, are not retried"""
+    import botocore.exceptions
+    import visitor.app
+
+    error = botocore.exceptions.ClientError({
+        'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+        'CancellationReasons': [{'Code': 'TransactionConflict'}, {'Code': 'ValidationError'}]
+    }, 'TransactWriteItems')
+
+    with patch.object(visitor.app.get_ddb_client(), 'transact_write_items', side_effect=error) as calls:
+        with pytest.raises(botocore.exceptions.ClientError):
+            visitor.app.record_visit_transactionally(TABLE_NAME, _visit_item('visit-1'), 1)
+
+    assert calls.call_count == 1
+
+
+@mock_dynamodb
+def test_lambda_handler_transact_mode(monkeypatch):
+    """Test the handler records visits through the transactional path"""
+    import json
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('visitWriteMode', 'transact')
+    visitor.app._counter_snapshot = None
+    client = boto3.client('dynamodb', 'us-east-1')
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+    with patch.object(visitor.app, 'get_geolocation', return_value=None), \
+         patch.object(visitor.app.get_ddb_client(), 'put_item') as put_item:
+        responses = [visitor.app.lambda_handler({'requestContext': {}, 'headers': {}}, "") for _ in range(2)]
+
+    assert [json.loads(r['body'])['visitorCount'] for r in responses] == [1, 2]
+    put_item.assert_not_called()
+    visitor.app._counter_snapshot = None
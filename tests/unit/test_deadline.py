@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import boto3
+import botocore.exceptions
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.deadline import Deadline, backoff_delay
+from visitor.http_pool import KeepAlivePool
+
+TABLE_NAME = 'visitor_test'
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeContext:
+    aws_request_id = 'request-1'
+
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        visitor.app.geo_cache.clear()
+        yield visitor.app, client
+        visitor.app.geo_cache.clear()
+
+
+def test_budget_is_the_tighter_of_remaining_time_and_slo():
+    """Test the budget takes the function's remaining time less the margin, capped by the objective"""
+    assert Deadline.from_context(FakeContext(10000), slo_ms=800, margin_ms=500).budget_ms == 800
+    assert Deadline.from_context(FakeContext(1000), slo_ms=800, margin_ms=500).budget_ms == 500
+    assert Deadline.from_context("", slo_ms=0).budget_ms is None
+
+
+def test_stage_timeouts_leave_the_reserve():
+    """Test stage timeouts shrink as time passes and never eat into the reserve"""
+    clock = FakeClock()
+    deadline = Deadline(1000, clock=clock)
+
+    assert deadline.timeout(2.0, reserve=0.5) == pytest.approx(0.5)
+    clock.now += 0.8
+    assert deadline.timeout(2.0, reserve=0.5) == 0.0
+    assert deadline.allows(0.1) and not deadline.allows(0.3)
+    assert Deadline(clock=clock).timeout(2.0, reserve=0.5) == 2.0
+
+
+def test_backoff_is_bounded_by_the_deadline():
+    """Test backoff delays grow with the attempt, stay under the cap and stop when the budget is spent"""
+    clock = FakeClock()
+    assert all(0 <= backoff_delay(attempt, base=0.01, cap=0.05) <= 0.05 for attempt in range(10))
+
+    spent = Deadline(10, clock=clock)
+    clock.now += 0.01
+    assert backoff_delay(0, base=0.01, deadline=spent) is None
+
+
+def test_counter_starts_at_starting_number(dynamodb):
+    """Test a fresh counter hands out the starting number and then counts on from it"""
+    app, _ = dynamodb
+
+    assert app.get_next_visit_number(TABLE_NAME, 100)[0] == 100
+    assert app.get_next_visit_number(TABLE_NAME, 100)[0] == 101
+
+
+def test_counter_retries_are_bounded(dynamodb, monkeypatch):
+    """Test a conflicting counter update is retried a bounded number of times, then falls back"""
+    app, _ = dynamodb
+    monkeypatch.setenv('counterRetryBaseMs', '1')
+    conflict = botocore.exceptions.ClientError(
+        {'Error': {'Code': 'TransactionConflictException', 'Message': 'Conflict'}}, 'UpdateItem'
+    )
+
+    with patch.object(app.get_ddb_client(), 'update_item', side_effect=conflict) as update_item, \
+            patch.object(app.time, 'sleep') as sleep:
+        visit_number, previous = app.get_next_visit_number(TABLE_NAME, 1)
+
+    assert update_item.call_count == 3
+    assert sleep.call_count == 2
+    assert previous is None and visit_number >= 1
+
+
+def test_short_budget_skips_geolocation_upstream(dynamodb):
+    """Test a visit with too little time left is recorded without calling ip-api.com"""
+    app, client = dynamodb
+    event = {'requestContext': {}, 'headers': {'X-Forwarded-For': '203.0.113.9', 'User-Agent': 'Mozilla/5.0',
+                                               'CloudFront-Viewer-Country': 'CA'}}
+
+    with patch.object(KeepAlivePool, 'get', side_effect=AssertionError("geolocation upstream called")):
+        response = app.lambda_handler(event, FakeContext(remaining_ms=900))
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['visitorCount'] == 1
+    visits = [item for item in client.scan(TableName=TABLE_NAME)['Items'] if 'timestamp' in item]
+    assert visits[0]['countryCode'] == {'S': 'CA'}
+    assert 'city' not in visits[0]
+
+
+def test_geolocation_gets_the_remaining_budget(dynamodb, monkeypatch):
+    """Test the upstream timeout is cut to what the budget leaves after the write reserve"""
+    app, _ = dynamodb
+    monkeypatch.setenv('latencySloMs', '1000')
+    event = {'requestContext': {}, 'headers': {'X-Forwarded-For': '203.0.113.9', 'User-Agent': 'Mozilla/5.0'}}
+    geo = (200, {}, json.dumps({'status': 'success', 'country': 'Canada'}).encode())
+
+    with patch.object(KeepAlivePool, 'get', return_value=geo) as get:
+        app.lambda_handler(event, FakeContext(remaining_ms=9000))
+
+    timeout = get.call_args.kwargs['timeout']
+    assert 0.2 <= timeout <= 0.5
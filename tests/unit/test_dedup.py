@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import boto3
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+TABLE_NAME = 'visitor_test'
+FIREFOX = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
+
+
+def _visit(app, ip='203.0.113.9', user_agent=FIREFOX):
+    event = {'requestContext': {}, 'headers': {'X-Forwarded-For': ip, 'User-Agent': user_agent}}
+    return json.loads(app.lambda_handler(event, "")['body'])
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        monkeypatch.setenv('dedupWindowSeconds', '300')
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        visitor.app.dedup_cache.clear()
+        with patch.object(visitor.app, 'get_geolocation', return_value=None) as get_geolocation:
+            yield visitor.app, client, get_geolocation
+        visitor.app.dedup_cache.clear()
+
+
+def _visit_items(client):
+    items = client.scan(TableName=TABLE_NAME)['Items']
+    return [item for item in items if 'timestamp' in item]
+
+
+def test_repeat_visit_is_not_recorded(dynamodb):
+    """Test a refresh within the window returns the count without writing or looking up geo"""
+    app, client, get_geolocation = dynamodb
+
+    first = _visit(app)
+    with patch.object(app.get_ddb_client(), 'put_item', side_effect=AssertionError("put_item used")):
+        repeat = _visit(app)
+
+    assert first['visitorCount'] == 1
+    assert repeat['visitorCount'] == 1
+    assert repeat['visitId'] is None
+    assert get_geolocation.call_count == 1
+    assert len(_visit_items(client)) == 1
+
+
+def test_repeat_visit_detected_across_containers(dynamodb):
+    """Test the DynamoDB marker catches repeats that land on a cold container"""
+    app, client, _ = dynamodb
+
+    _visit(app)
+    app.dedup_cache.clear()
+    repeat = _visit(app)
+
+    assert repeat['visitorCount'] == 1
+    assert len(_visit_items(client)) == 1
+
+
+def test_other_clients_and_expired_windows_are_counted(dynamodb):
+    """Test a different user agent, and a marker past its expiry, count as new visits"""
+    app, client, _ = dynamodb
+
+    _visit(app)
+    assert _visit(app, user_agent='curl/8.4.0')['visitorCount'] == 2
+
+    marker_key = app._dedup_key(app.anonymize_ip('203.0.113.9'), FIREFOX)
+    client.put_item(TableName=TABLE_NAME, Item={
+        'visitId': {'S': marker_key}, 'expiresAt': {'N': str(int(time.time()) - 1)}
+    })
+    app.dedup_cache.clear()
+
+    assert _visit(app)['visitorCount'] == 3
@@ -0,0 +1,83 @@
+import os
+import sys
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.geo_table import GeoTable, write_table
+
+SAN_FRANCISCO = {'country': 'United States', 'countryCode': 'US', 'city': 'San Francisco'}
+BERLIN = {'country': 'Germany', 'countryCode': 'DE', 'city': 'Berlin'}
+
+
+@pytest.fixture
+def geo_table(tmp_path):
+    path = tmp_path / 'geo.bin'
+    write_table([
+        ('203.0.113.0', '203.0.113.255', SAN_FRANCISCO),
+        ('198.51.100.0', '198.51.100.127', BERLIN),
+        ('2001:db8::', '2001:db8:ffff:ffff:ffff:ffff:ffff:ffff', BERLIN),
+    ], path)
+    table = GeoTable(path)
+    yield table
+    table.close()
+
+
+def test_geo_table_finds_ipv4_ranges(geo_table):
+    """Test lookups inside IPv4 ranges, including the range boundaries"""
+    assert geo_table.lookup('203.0.113.42') == SAN_FRANCISCO
+    assert geo_table.lookup('203.0.113.0') == SAN_FRANCISCO
+    assert geo_table.lookup('203.0.113.255') == SAN_FRANCISCO
+    assert geo_table.lookup('198.51.100.5') == BERLIN
+
+
+def test_geo_table_finds_ipv6_ranges(geo_table):
+    """Test lookups inside IPv6 ranges"""
+    assert geo_table.lookup('2001:0db8:85a3:0000:0000:8a2e:0370:7334') == BERLIN
+
+
+def test_geo_table_misses(geo_table):
+    """Test addresses between, before and after ranges and invalid input miss"""
+    assert geo_table.lookup('198.51.100.200') is None
+    assert geo_table.lookup('1.1.1.1') is None
+    assert geo_table.lookup('255.255.255.255') is None
+    assert geo_table.lookup('2001:db9::1') is None
+    assert geo_table.lookup('Unknown') is None
+
+
+def test_write_table_rejects_overlapping_ranges(tmp_path):
+    """Test the writer refuses ambiguous input"""
+    with pytest.raises(ValueError):
+        write_table([
+            ('10.0.0.0', '10.0.0.255', SAN_FRANCISCO),
+            ('10.0.0.128', '10.0.1.255', BERLIN),
+        ], tmp_path / 'geo.bin')
+
+
+def test_build_geo_table_converts_csv(tmp_path):
+    """Test the converter script handles headerless CSVs and CIDR networks"""
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
+    import build_geo_table
+
+    headerless = tmp_path / 'dbip.csv'
+    headerless.write_text('203.0.113.0,203.0.113.255,NA,US,California,San Francisco,37.7749,-122.4194\n')
+    table_path = tmp_path / 'dbip.bin'
+    build_geo_table.main([str(headerless), str(table_path),
+                          '--columns', 'ip_start,ip_end,continent,countryCode,region,city,latitude,longitude'])
+
+    networks = tmp_path / 'networks.csv'
+    networks.write_text('network,country,countryCode\n2001:db8::/32,Germany,DE\n')
+    networks_path = tmp_path / 'networks.bin'
+    build_geo_table.main([str(networks), str(networks_path)])
+
+    table = GeoTable(table_path)
+    assert table.lookup('203.0.113.42') == {
+        'countryCode': 'US', 'region': 'California', 'city': 'San Francisco',
+        'latitude': 37.7749, 'longitude': -122.4194
+    }
+    table.close()
+
+    table = GeoTable(networks_path)
+    assert table.lookup('2001:db8::1') == {'country': 'Germany', 'countryCode': 'DE'}
+    table.close()
@@ -4,12 +4,25 @@ import json
 import boto3
 import pytest
 from moto import mock_dynamodb
+import time
 from datetime import datetime
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
+from visitor.http_pool import KeepAlivePool
+
+
+@pytest.fixture(autouse=True)
+def reset_warm_state():
+    """Clear per-container caches so tests don't see each other's lookups"""
+    yield
+    # Only touch the module once a test has imported it (under its own mocks)
+    app = sys.modules.get('visitor.app')
+    if app is not None:
+        app.geo_cache.clear()
+        app.geo_breaker = app._geo_breaker()
 
 @pytest.fixture()
 def apigw_event():
@@ -88,12 +101,9 @@ def mock_geolocation():
         'isp': 'Example ISP'
     }
     
-    with patch('urllib.request.urlopen') as mock_urlopen:
-        mock_response = MagicMock()
-        mock_response.read.return_value = json.dumps(mock_geo_data).encode()
-        mock_response.__enter__.return_value = mock_response
-        mock_urlopen.return_value = mock_response
-        yield mock_urlopen
+    with patch.object(KeepAlivePool, 'get') as mock_get:
+        mock_get.return_value = (200, {'Content-Type': 'application/json'}, json.dumps(mock_geo_data).encode())
+        yield mock_get
 
 
 @mock_dynamodb
@@ -204,7 +214,7 @@ def test_lambda_handler_handles_geolocation_failure(apigw_event, set_env_vars):
     )
     
     # Mock geolocation to fail
-    with patch('urllib.request.urlopen', side_effect=Exception("API Error")):
+    with patch.object(KeepAlivePool, 'get', side_effect=Exception("API Error")):
         response = visitor.app.lambda_handler(apigw_event, "")
     
     # Should still succeed without geolocation data
@@ -403,4 +413,186 @@ def test_lambda_handler_options_request(set_env_vars):
     assert response["headers"]["Access-Control-Allow-Origin"] == "*"
     assert "Access-Control-Allow-Methods" in response["headers"]
     assert "GET,OPTIONS" in response["headers"]["Access-Control-Allow-Methods"]
-    assert response["body"] == ""
\ No newline at end of file
+    assert response["body"] == ""
+
+def test_get_geolocation_caches_repeat_lookups(mock_geolocation):
+    """Test repeat lookups for the same IP are served from the warm cache"""
+    from visitor.app import get_geolocation, geo_cache
+
+    first = get_geolocation('203.0.113.42')
+    second = get_geolocation('203.0.113.42')
+
+    assert first == second
+    assert first['country'] == 'United States'
+    assert mock_geolocation.call_count == 1
+    assert geo_cache.stats()['hits'] >= 1
+
+
+def test_get_geolocation_reuses_prefix_entry(mock_geolocation):
+    """Test an address in an already-resolved /24 reuses the prefix entry"""
+    from visitor.app import get_geolocation
+
+    get_geolocation('203.0.113.42')
+    result = get_geolocation('203.0.113.77')
+
+    assert result['city'] == 'San Francisco'
+    assert mock_geolocation.call_count == 1
+
+
+def test_get_geolocation_negative_caches_failures():
+    """Test upstream failures are cached so the next request skips the timeout"""
+    from visitor.app import get_geolocation
+
+    with patch.object(KeepAlivePool, 'get', side_effect=Exception("API Error")) as mock_get:
+        assert get_geolocation('198.51.100.7') is None
+        assert get_geolocation('198.51.100.7') is None
+
+    assert mock_get.call_count == 1
+
+
+def test_get_geolocation_prefers_local_geo_table(tmp_path, monkeypatch, mock_geolocation):
+    """Test the offline range table answers without calling ip-api"""
+    from visitor.app import get_geolocation
+    from visitor.geo_table import write_table
+
+    table_path = tmp_path / 'geo.bin'
+    write_table([('203.0.113.0', '203.0.113.255', {'country': 'Canada', 'city': 'Toronto'})], table_path)
+    monkeypatch.setenv('geoTablePath', str(table_path))
+
+    assert get_geolocation('203.0.113.42') == {'country': 'Canada', 'city': 'Toronto'}
+    assert mock_geolocation.call_count == 0
+
+    # Addresses the table doesn't cover fall back to ip-api
+    assert get_geolocation('198.51.100.7')['country'] == 'United States'
+    assert mock_geolocation.call_count == 1
+
+
+def test_get_geolocation_can_complete_table_hits(tmp_path, monkeypatch, mock_geolocation):
+    """Test geoTableFinal=false fills fields the table lacks from ip-api"""
+    from visitor.app import get_geolocation
+    from visitor.geo_table import write_table
+
+    table_path = tmp_path / 'geo.bin'
+    write_table([('203.0.113.0', '203.0.113.255', {'country': 'United States', 'city': 'Oakland'})], table_path)
+    monkeypatch.setenv('geoTablePath', str(table_path))
+    monkeypatch.setenv('geoTableFinal', 'false')
+
+    result = get_geolocation('203.0.113.42')
+
+    assert result['city'] == 'Oakland' and result['timezone'] == 'America/Los_Angeles'
+    assert mock_geolocation.call_count == 1
+
+
+@mock_dynamodb
+def test_lambda_handler_overlaps_counter_and_geolocation(apigw_event, set_env_vars, caplog):
+    """Test the counter update and geolocation lookup run concurrently"""
+    import visitor.app
+
+    table_name = os.environ['tableName']
+    dynamodb = boto3.client('dynamodb', 'us-east-1')
+    dynamodb.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        TableClass='STANDARD',
+        ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+    )
+
+    def slow_counter(table_name, starting_number, **kwargs):
+        time.sleep(0.3)
+        return 42, None
+
+    def slow_geolocation(ip_address, headers=None, api_timeout=None):
+        time.sleep(0.3)
+        return {'country': 'United States'}
+
+    with patch.object(visitor.app, 'get_next_visit_number', side_effect=slow_counter), \
+         patch.object(visitor.app, 'get_geolocation', side_effect=slow_geolocation), \
+         caplog.at_level('INFO'):
+        start = time.perf_counter()
+        response = visitor.app.lambda_handler(apigw_event, "")
+        elapsed = time.perf_counter() - start
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["visitorCount"] == 42
+    assert elapsed < 0.55
+    assert any("Stage timings (ms): " in message and "counter=" in message and "geo=" in message
+               for message in caplog.messages)
+
+
+CLOUDFRONT_GEO = {
+    "CloudFront-Viewer-Country": "US",
+    "CloudFront-Viewer-Country-Name": "United States",
+    "CloudFront-Viewer-Country-Region-Name": "Washington",
+    "CloudFront-Viewer-City": "Seattle",
+    "CloudFront-Viewer-Latitude": "47.6062",
+    "CloudFront-Viewer-Longitude": "-122.3321",
+    "CloudFront-Viewer-Time-Zone": "America/Los_Angeles",
+}
+
+
+def test_get_geolocation_uses_cloudfront_headers(mock_geolocation):
+    """Test complete CloudFront viewer headers avoid the external lookup"""
+    from visitor.app import get_geolocation
+
+    result = get_geolocation('203.0.113.42', {k.lower(): v for k, v in CLOUDFRONT_GEO.items()})
+
+    assert result == {
+        'country': 'United States',
+        'countryCode': 'US',
+        'region': 'Washington',
+        'city': 'Seattle',
+        'latitude': 47.6062,
+        'longitude': -122.3321,
+        'timezone': 'America/Los_Angeles'
+    }
+    assert mock_geolocation.call_count == 0
+
+
+def test_get_geolocation_fills_missing_header_fields(mock_geolocation):
+    """Test fields CloudFront didn't send are filled from ip-api without overriding headers"""
+    from visitor.app import get_geolocation
+
+    result = get_geolocation('203.0.113.42', {"CloudFront-Viewer-Country": "US",
+                                              "CloudFront-Viewer-City": "Oakland"})
+
+    assert result['countryCode'] == 'US' and result['country'] == 'United States'
+    assert result['city'] == 'Oakland'
+    assert result['timezone'] == 'America/Los_Angeles'
+    assert mock_geolocation.call_count == 1
+
+
+def test_get_geolocation_ignores_sources_in_another_country(mock_geolocation):
+    """Test a later source placing the address in a different country adds nothing to the record"""
+    from visitor.app import get_geolocation
+
+    result = get_geolocation('203.0.113.42', {"CloudFront-Viewer-Country": "CA"})
+
+    assert result == {'countryCode': 'CA'}
+    assert mock_geolocation.call_count == 1
+
+
+def test_get_geolocation_merges_sources_with_nothing_to_compare(tmp_path, monkeypatch, mock_geolocation):
+    """Test a table with only country names still completes a header that only has the country code"""
+    from visitor.app import get_geolocation
+    from visitor.geo_table import write_table
+
+    table_path = tmp_path / 'geo.bin'
+    write_table([('203.0.113.0', '203.0.113.255', {'country': 'United States', 'city': 'Seattle'})], table_path)
+    monkeypatch.setenv('geoTablePath', str(table_path))
+
+    result = get_geolocation('203.0.113.42', {"CloudFront-Viewer-Country": "US"})
+
+    assert result == {'countryCode': 'US', 'country': 'United States', 'city': 'Seattle'}
+    assert mock_geolocation.call_count == 0
+
+
+def test_get_geolocation_source_order_is_configurable(monkeypatch, mock_geolocation):
+    """Test geoSourceOrder can put ip-api ahead of the headers"""
+    from visitor.app import get_geolocation
+    monkeypatch.setenv('geoSourceOrder', 'api,headers')
+
+    result = get_geolocation('203.0.113.42', CLOUDFRONT_GEO)
+
+    assert result['city'] == 'San Francisco'
+    assert result['isp'] == 'Example ISP'
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.http_pool import KeepAlivePool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.peers.add(self.client_address)
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if self.path.startswith('/close'):
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.peers = set()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_pool_reuses_connection(server):
+    """Test sequential requests share one keep-alive connection"""
+    pool = KeepAlivePool('127.0.0.1', server.server_address[1])
+
+    for n in range(5):
+        status, _, body = pool.get(f"/json/{n}")
+        assert status == 200
+        assert body == f"/json/{n}".encode()
+
+    assert pool.connections_opened == 1
+    assert len(server.peers) == 1
+    pool.close()
+
+
+def test_pool_drops_connections_the_server_closes(server):
+    """Test a Connection: close response is not returned to the pool"""
+    pool = KeepAlivePool('127.0.0.1', server.server_address[1])
+
+    pool.get('/close')
+    assert len(pool) == 0
+    pool.get('/json/1')
+    assert pool.connections_opened == 2
+
+
+def test_pool_retries_stale_connection(server):
+    """Test a pooled connection closed while idle is replaced transparently"""
+    pool = KeepAlivePool('127.0.0.1', server.server_address[1])
+    pool.get('/json/1')
+
+    # Simulate the server dropping the idle connection while the container was frozen
+    pool._idle[0][0].sock.close()
+
+    status, _, body = pool.get('/json/2')
+    assert (status, body) == (200, b'/json/2')
+    assert pool.connections_opened == 2
+
+
+def test_pool_expires_idle_connections(server):
+    """Test connections idle past idle_timeout are not reused"""
+    now = [0.0]
+    pool = KeepAlivePool('127.0.0.1', server.server_address[1], idle_timeout=30, clock=lambda: now[0])
+    pool.get('/json/1')
+
+    now[0] = 31.0
+    pool.get('/json/2')
+
+    assert pool.connections_opened == 2
+
+
+def test_prewarmed_connection_serves_first_request(server):
+    """Test a connection opened ahead of time is used by the first GET"""
+    pool = KeepAlivePool('127.0.0.1', server.server_address[1])
+
+    pool.prewarm()
+    assert len(pool) == 1
+    status, _, _ = pool.get('/json/1')
+
+    assert status == 200
+    assert pool.connections_opened == 1
+    pool.close()
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.visit_queue import InMemoryVisitQueue
+
+TABLE_NAME = 'visitor_test'
+
+VISIT_EVENT = {
+    "httpMethod": "GET",
+    "requestContext": {"identity": {"sourceIp": "203.0.113.42"}},
+    "headers": {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+        "Referer": "https://google.com"
+    }
+}
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    """Create a mocked visitor table and an in-memory visit queue"""
+    monkeypatch.setenv('AWS_REGION', 'us-east-1')
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('ingestMode', 'async')
+    with mock_dynamodb():
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        import visitor.app
+        visitor.app._visit_queue = InMemoryVisitQueue()
+        yield client
+        visitor.app._visit_queue = None
+        visitor.app.geo_cache.clear()
+
+
+def _visit_items(client):
+    items = client.scan(TableName=TABLE_NAME)['Items']
+    return [item for item in items if not item['visitId']['S'].startswith('COUNTER')]
+
+
+def test_async_handler_returns_after_counter(dynamodb):
+    """Test async mode counts the visit and queues it without enriching or storing it"""
+    import visitor.app
+
+    with patch.object(visitor.app, 'get_geolocation') as get_geolocation:
+        response = visitor.app.lambda_handler(VISIT_EVENT, "")
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 200
+    assert body["visitorCount"] == 1
+    get_geolocation.assert_not_called()
+    assert _visit_items(dynamodb) == []
+
+    message = json.loads(visitor.app._visit_queue.messages[0])
+    assert message['visitId'] == body['visitId']
+    assert message['ipAddress'] == '203.0.113.42'
+    assert message['referer'] == 'https://google.com'
+
+
+def test_ingest_handler_enriches_and_batches_visits(dynamodb):
+    """Test the consumer enriches queued visits and writes them with BatchWriteItem"""
+    import visitor.app
+
+    for _ in range(30):
+        visitor.app.lambda_handler(VISIT_EVENT, "")
+
+    geo = {'country': 'United States', 'city': 'San Francisco'}
+    with patch.object(visitor.app, '_fetch_geolocation', return_value=(geo, 60)) as fetch, \
+         patch.object(visitor.app.get_ddb_client(), 'batch_write_item',
+                      wraps=visitor.app.get_ddb_client().batch_write_item) as batch_write_item:
+        result = visitor.app.ingest_handler(visitor.app._visit_queue.drain_event(max_messages=30), "")
+
+    assert result == {'batchItemFailures': []}
+    assert batch_write_item.call_count == 2
+    assert fetch.call_count == 1
+
+    items = _visit_items(dynamodb)
+    assert len(items) == 30
+    assert sorted(int(item['visitNumId']['N']) for item in items) == list(range(1, 31))
+    assert all(item['ipAddress']['S'] == '203.0.0.0' for item in items)
+    assert all(item['browser']['S'] == 'Firefox' for item in items)
+    assert all(item['country']['S'] == 'United States' for item in items)
+
+
+def test_ingest_handler_reports_unprocessed_items(dynamodb):
+    """Test items DynamoDB keeps rejecting are reported back for redelivery"""
+    import visitor.app
+
+    visitor.app.lambda_handler(VISIT_EVENT, "")
+    event = visitor.app._visit_queue.drain_event()
+
+    def reject_everything(RequestItems):
+        return {'UnprocessedItems': RequestItems}
+
+    with patch.object(visitor.app, 'get_geolocation', return_value=None), \
+         patch.object(visitor.app.get_ddb_client(), 'batch_write_item', side_effect=reject_everything), \
+         patch.object(visitor.app.time, 'sleep'):
+        result = visitor.app.ingest_handler(event, "")
+
+    assert result == {'batchItemFailures': [{'itemIdentifier': event['Records'][0]['messageId']}]}
+
+
+def test_ingest_handler_drops_incomplete_messages(dynamodb):
+    """Test messages missing fields are dropped without failing the rest of the batch"""
+    import visitor.app
+
+    for _ in range(2):
+        visitor.app.lambda_handler(VISIT_EVENT, "")
+    event = visitor.app._visit_queue.drain_event()
+    incomplete = json.loads(event['Records'][1]['body'])
+    del incomplete['ipAddress']
+    event['Records'][1]['body'] = json.dumps(incomplete)
+    event['Records'].append({'messageId': 'not-an-object', 'body': '["visit"]'})
+    event['Records'].append({'messageId': 'wrong-type', 'body': json.dumps({**incomplete, 'ipAddress': 7})})
+
+    with patch.object(visitor.app, 'get_geolocation', return_value=None):
+        result = visitor.app.ingest_handler(event, "")
+
+    assert result == {'batchItemFailures': []}
+    assert [item['visitId']['S'] for item in _visit_items(dynamodb)] == \
+        [json.loads(event['Records'][0]['body'])['visitId']]
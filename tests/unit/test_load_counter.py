@@ -0,0 +1,42 @@
+import os
+import sys
+import boto3
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from benchmarks import load_counter
+
+TABLE_NAME = 'visitor_test'
+
+
+def test_analyze_counts_duplicates_gaps_and_drift():
+    """Test the report spots repeated and missing visit numbers"""
+    results = [(5.0, 200, 1), (6.0, 200, 2), (7.0, 200, 2), (8.0, 500, None)]
+
+    report = load_counter.analyze(results, starting_number=1, counter_total=4)
+
+    assert report['succeeded'] == 3
+    assert report['failed'] == 1
+    assert report['duplicates'] == 1
+    assert report['gaps'] == 1  # 3 was never handed out
+    assert report['drift'] == 1
+
+
+def test_concurrent_visits_get_unique_numbers(monkeypatch):
+    """Test concurrent invocations on the single counter neither lose nor repeat numbers"""
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('geoSourceOrder', 'headers')
+
+    with load_counter._serialized_moto():
+        import visitor.app
+        load_counter._create_table(boto3.client('dynamodb', 'us-east-1'), TABLE_NAME)
+
+        chunk = load_counter.run_chunk(40, 8, 0)
+        counter_total, _ = visitor.app.read_visit_count(TABLE_NAME, 1, consistent=True)
+
+    report = load_counter.analyze(chunk['results'], 1, counter_total)
+    assert report['succeeded'] == 40
+    assert report['duplicates'] == 0
+    assert report['gaps'] == 0
+    assert report['drift'] == 0
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor import metrics
+from visitor.http_pool import KeepAlivePool
+
+TABLE_NAME = 'visitor_test'
+
+GEO_RESPONSE = (200, {}, json.dumps({'status': 'success', 'country': 'Canada', 'countryCode': 'CA'}).encode())
+
+
+def _emf_documents(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_request_metrics_document_is_valid_emf():
+    """Test the emitted document declares every metric under the namespace and dimensions"""
+    request = metrics.RequestMetrics('Test', {'Route': 'visit'}, clock=lambda: 1700000000.5)
+    request.put_timings({'counter': 12.5, 'total': 20.0})
+    request.add('GeoCacheHits')
+    request.add('GeoCacheHits')
+    request.set_property('requestId', 'abc')
+
+    document = request.to_document()
+
+    directive = document['_aws']['CloudWatchMetrics'][0]
+    assert document['_aws']['Timestamp'] == 1700000000500
+    assert directive['Namespace'] == 'Test'
+    assert directive['Dimensions'] == [['Route']]
+    assert {'Name': 'CounterLatency', 'Unit': 'Milliseconds'} in directive['Metrics']
+    assert document['Route'] == 'visit'
+    assert document['CounterLatency'] == 12.5
+    assert document['GeoCacheHits'] == 2
+    assert document['requestId'] == 'abc'
+
+
+def test_add_without_request_is_a_no_op():
+    """Test stages can record metrics outside a handler invocation"""
+    assert metrics.current() is None
+    metrics.add('GeoCacheHits')
+
+
+@mock_dynamodb
+def test_lambda_handler_emits_stage_metrics(monkeypatch, capsys):
+    """Test a visit emits one EMF line with stage latencies, consumed capacity and geo cache counts"""
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    client = boto3.client('dynamodb', 'us-east-1')
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    visitor.app.geo_cache.clear()
+    event = {
+        'requestContext': {},
+        'headers': {'X-Forwarded-For': '203.0.113.9', 'User-Agent': 'Mozilla/5.0'}
+    }
+
+    with patch.object(KeepAlivePool, 'get', return_value=GEO_RESPONSE):
+        visitor.app.lambda_handler(event, "")
+        visitor.app.lambda_handler(event, "")
+
+    first, second = _emf_documents(capsys.readouterr().out)
+    for stage in ('Counter', 'Geo', 'UserAgent', 'Build', 'Put', 'Total'):
+        assert f"{stage}Latency" in first
+    assert first['Route'] == 'visit'
+    assert first['ConsumedCapacity'] > 0
+    assert first['GeoCacheMisses'] == 1
+    assert second['GeoCacheHits'] == 1
+    assert metrics.current() is None
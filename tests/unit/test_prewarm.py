@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import types
+import boto3
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.http_pool import KeepAlivePool
+
+TABLE_NAME = 'visitor_test'
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        yield visitor.app
+
+
+def test_prewarm_runs_every_step_and_reports_init_metrics(dynamodb, capsys):
+    """Test prewarm reads from DynamoDB, connects to the geo upstream and emits its timings"""
+    app = dynamodb
+
+    with patch.object(KeepAlivePool, 'prewarm') as geo_prewarm, \
+            patch.object(app.get_ddb_client(), 'get_item', wraps=app.get_ddb_client().get_item) as get_item:
+        timings = app.prewarm()
+
+    assert set(timings) == {'geoTable', 'userAgentParser', 'dynamodbConnect', 'geoConnect', 'prewarm'}
+    assert get_item.call_args.kwargs['Key'] == {'visitId': {'S': 'COUNTER'}}
+    geo_prewarm.assert_called_once()
+    document = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert document['Route'] == 'init'
+    assert 'PrewarmLatency' in document and 'DynamodbConnectLatency' in document
+
+
+def test_prewarm_survives_failing_steps(dynamodb):
+    """Test an unreachable upstream is logged without failing initialization"""
+    app = dynamodb
+
+    with patch.object(KeepAlivePool, 'prewarm', side_effect=OSError("unreachable")):
+        timings = app.prewarm()
+
+    assert 'geoConnect' in timings
+
+
+def test_prewarm_on_init_is_opt_in(dynamodb, monkeypatch):
+    """Test nothing is prewarmed unless prewarmOnInit is set"""
+    app = dynamodb
+    monkeypatch.delenv('prewarmOnInit', raising=False)
+
+    with patch.object(app, 'prewarm') as prewarm:
+        app.prewarm_on_init()
+        prewarm.assert_not_called()
+
+        monkeypatch.setenv('prewarmOnInit', 'true')
+        app.prewarm_on_init()
+        prewarm.assert_called_once_with()
+
+
+def test_snapstart_defers_network_steps_to_restore(dynamodb, monkeypatch):
+    """Test only local steps run before a SnapStart snapshot and connections are opened after restore"""
+    app = dynamodb
+    hooks = []
+    monkeypatch.setitem(sys.modules, 'snapshot_restore_py',
+                        types.SimpleNamespace(register_after_restore=hooks.append))
+    monkeypatch.setenv('prewarmOnInit', 'true')
+    monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', 'snap-start')
+
+    with patch.object(app, 'prewarm') as prewarm:
+        app.prewarm_on_init()
+        prewarm.assert_called_once_with(network=False)
+
+        hooks[0]()
+        prewarm.assert_called_with(local=False)
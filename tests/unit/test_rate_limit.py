@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import boto3
+import botocore.exceptions
+import pytest
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.rate_limit import TokenBuckets
+
+TABLE_NAME = 'visitor_test'
+FIREFOX = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _visit(app, ip='203.0.113.9', forwarded_for=None):
+    event = {
+        'requestContext': {'identity': {'sourceIp': ip}},
+        'headers': {'X-Forwarded-For': forwarded_for or ip, 'User-Agent': FIREFOX}
+    }
+    return app.lambda_handler(event, "")
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        monkeypatch.setenv('rateLimitPerMinute', '6')
+        monkeypatch.setenv('rateLimitBurst', '3')
+        monkeypatch.setenv('rateLimitSharedAfter', '0')
+        client = boto3.client('dynamodb', 'us-east-1')
+        client.create_table(
+            AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        monkeypatch.setattr(visitor.app, '_rate_buckets', None)
+        with patch.object(visitor.app, 'get_geolocation', return_value=None) as get_geolocation:
+            yield visitor.app, client, get_geolocation
+
+
+def test_bucket_allows_burst_then_refills_at_rate():
+    """Test a client gets burst requests back to back, then one per interval"""
+    clock = FakeClock()
+    buckets = TokenBuckets(rate_per_minute=6, burst=3, clock=clock)
+
+    assert [buckets.take('client') for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('client') == 10
+    assert buckets.take('other') == 0
+
+    clock.now += 10
+    assert buckets.take('client') == 0
+    assert buckets.take('client') == 10
+
+
+def test_bucket_merges_later_arrival_from_elsewhere():
+    """Test an arrival time seen in the shared bucket replaces an older local one, never a newer one"""
+    clock = FakeClock()
+    buckets = TokenBuckets(rate_per_minute=6, burst=3, clock=clock)
+    now = buckets.now()
+
+    buckets.observe('client', now + 30000)
+    buckets.observe('client', now + 10000)
+
+    assert buckets.arrival('client') == now + 30000
+    assert buckets.retry_after(buckets.arrival('client'), now) == 10
+
+
+def test_client_over_limit_is_shed_before_any_work(dynamodb):
+    """Test requests past the burst get 429 with Retry-After and no counter, geolocation or visit write"""
+    app, client, get_geolocation = dynamodb
+
+    counts = [json.loads(_visit(app)['body'])['visitorCount'] for _ in range(3)]
+    with patch.object(app, 'get_next_visit_number', side_effect=AssertionError("counter used")):
+        response = _visit(app, ip='203.0.113.77')  # same /16, same bucket
+
+    assert counts == [1, 2, 3]
+    assert response['statusCode'] == 429
+    assert response['headers']['Retry-After'] == '10'
+    assert get_geolocation.call_count == 3
+    assert json.loads(_visit(app, ip='198.51.100.7')['body'])['visitorCount'] == 4
+
+
+def test_forwarded_for_cannot_pick_the_bucket(dynamodb):
+    """Test a client prepending a different X-Forwarded-For address each time is still limited"""
+    app, client, _ = dynamodb
+
+    statuses = [
+        _visit(app, forwarded_for=f"10.{n}.0.1, 203.0.113.9")['statusCode'] for n in range(5)
+    ]
+
+    assert statuses == [200, 200, 200, 429, 429]
+    assert 'Item' in client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'RATE#203.0.0.0'}})
+    assert 'Item' not in client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'RATE#10.0.0.0'}})
+
+
+def test_bots_are_filtered_before_the_rate_limit(dynamodb, monkeypatch):
+    """Test a skipped bot is answered without a bucket update or any other DynamoDB call"""
+    app, _, _ = dynamodb
+    monkeypatch.setenv('botFilter', 'skip')
+    event = {
+        'requestContext': {'identity': {'sourceIp': '203.0.113.9'}},
+        'headers': {'User-Agent': 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'}
+    }
+
+    with patch.object(app, 'get_ddb_client', side_effect=AssertionError("DynamoDB used")):
+        response = app.lambda_handler(event, "")
+
+    assert response['statusCode'] == 200
+    assert app._client_rate_buckets().arrival('203.0.0.0') is None
+
+
+def test_limit_is_shared_between_containers(dynamodb):
+    """Test a fresh container refuses a client that spent its burst elsewhere, then remembers it locally"""
+    app, client, _ = dynamodb
+    for _ in range(3):
+        _visit(app)
+
+    app._rate_buckets = None  # a different container
+    assert _visit(app)['statusCode'] == 429
+    with patch.object(app.get_ddb_client(), 'update_item', side_effect=AssertionError("DynamoDB used")):
+        assert _visit(app)['statusCode'] == 429
+
+    bucket = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'RATE#203.0.0.0'}})['Item']
+    assert int(bucket['expiresAt']['N']) > int(bucket['arrivalAt']['N']) // 1000
+
+
+def test_first_requests_only_charge_the_container(dynamodb, monkeypatch):
+    """Test a client's first rateLimitSharedAfter requests don't touch the shared bucket"""
+    app, client, _ = dynamodb
+    monkeypatch.setenv('rateLimitBurst', '5')
+    monkeypatch.setenv('rateLimitSharedAfter', '2')
+
+    with patch.object(app, '_take_shared_token', wraps=app._take_shared_token) as take_shared:
+        statuses = [_visit(app)['statusCode'] for _ in range(6)]
+
+    assert statuses == [200] * 5 + [429]
+    assert take_shared.call_count == 3  # the third to fifth; the sixth is refused in the container
+    assert 'Item' in client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'RATE#203.0.0.0'}})
+
+
+def test_unreachable_shared_bucket_falls_back_to_container(dynamodb):
+    """Test a failing bucket update lets visits through, limited by the container's own bucket"""
+    app, _, _ = dynamodb
+    error = botocore.exceptions.ClientError(
+        {'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'throttled'}}, 'UpdateItem'
+    )
+
+    with patch.object(app, '_take_shared_token', side_effect=error):
+        statuses = [_visit(app)['statusCode'] for _ in range(4)]
+
+    assert statuses == [200, 200, 200, 429]
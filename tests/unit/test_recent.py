@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from datetime import datetime, timedelta
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+TABLE_NAME = 'visitor_test'
+
+
+def _create_table(client):
+    client.create_table(
+        AttributeDefinitions=[
+            {'AttributeName': 'visitId', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'timeBucket', 'AttributeType': 'S'}
+        ],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'TimeBucketIndex',
+            'KeySchema': [
+                {'AttributeName': 'timeBucket', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def _put_visits(app, client, minutes_ago):
+    now = datetime.now()
+    for number, minutes in enumerate(minutes_ago, start=1):
+        timestamp = (now - timedelta(minutes=minutes)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        item = app.build_visit_item(
+            f"visit-{number}", number, timestamp, '203.0.113.0', 'Mozilla/5.0',
+            app.parse_user_agent('Mozilla/5.0'), 'https://www.linkedin.com/in/someone', {'country': 'Canada'}
+        )
+        client.put_item(TableName=TABLE_NAME, Item=item)
+
+
+def _get_recent(app, params):
+    return app.lambda_handler({'httpMethod': 'GET', 'path': '/visitor/recent', 'queryStringParameters': params}, "")
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        monkeypatch.setenv('tableName', TABLE_NAME)
+        client = boto3.client('dynamodb', 'us-east-1')
+        _create_table(client)
+        yield visitor.app, client
+
+
+def test_visit_item_carries_hour_bucket():
+    """Test visit items are partitioned by the hour of their timestamp"""
+    from visitor.app import time_bucket
+
+    assert time_bucket('2024-05-01T13:45:10Z') == '2024-05-01T13'
+
+
+def test_recent_pages_newest_first_across_buckets(dynamodb):
+    """Test /visitor/recent pages through several hour buckets with a continuation token"""
+    app, client = dynamodb
+    _put_visits(app, client, [1, 2, 70, 130, 60 * 30])
+
+    seen = []
+    params = {'hours': '4', 'limit': '2'}
+    with patch.object(app.get_ddb_client(), 'scan', side_effect=AssertionError("scan used")):
+        while True:
+            response = _get_recent(app, params)
+            assert response['statusCode'] == 200
+            page = json.loads(response['body'])
+            assert len(page['visits']) <= 2
+            seen.extend(page['visits'])
+            if not page['next']:
+                break
+            params = {'next': page['next']}
+
+    timestamps = [visit['timestamp'] for visit in seen]
+    assert timestamps == sorted(timestamps, reverse=True)
+    # Visits from 30 hours ago fall outside the four requested buckets
+    assert [visit['visitNumId'] for visit in seen] == [1, 2, 3, 4]
+    assert seen[0]['referer'] == 'linkedin.com'
+    assert 'ipAddress' not in seen[0] and 'userAgent' not in seen[0]
+
+
+def test_recent_covers_the_last_hours_not_clock_hours(dynamodb):
+    """Test hours=1 returns the last 60 minutes, whatever minute of the hour it is"""
+    app, client = dynamodb
+    _put_visits(app, client, [1, 50, 61, 90])
+
+    page = json.loads(_get_recent(app, {'hours': '1'})['body'])
+
+    assert [visit['visitNumId'] for visit in page['visits']] == [1, 2]
+    assert page['next'] is None
+
+
+def test_recent_validates_parameters(dynamodb):
+    """Test malformed or out-of-range parameters are rejected"""
+    app, _ = dynamodb
+
+    for params in ({'hours': '0'}, {'hours': '500'}, {'limit': '1000'}, {'limit': 'ten'}, {'next': 'not-a-token'}):
+        assert _get_recent(app, params)['statusCode'] == 400
+
+
+def test_recent_rejects_tampered_tokens(dynamodb):
+    """Test tokens with a bad bucket, position or start key get 400 instead of failing the Query"""
+    app, _ = dynamodb
+    good = {'b': '2024-05-01T13', 'h': 2, 'i': 0, 'k': None}
+
+    for changes in ({'b': 'garbage'}, {'b': 7}, {'i': -1}, {'s': 'yesterday'}, {'k': 'visit-1'}, {'k': {'visitId': 'visit-1'}},
+                    {'k': {'visitId': {'N': 1}}}):
+        token = app._encode_page_token({**good, **changes})
+        assert _get_recent(app, {'next': token})['statusCode'] == 400
+    assert _get_recent(app, {'next': app._encode_page_token(['b'])})['statusCode'] == 400
+    assert _get_recent(app, {'next': app._encode_page_token(good)})['statusCode'] == 200
+
+
+def test_backfill_adds_missing_buckets(dynamodb):
+    """Test the backfill buckets old visits and leaves counters and bucketed visits alone"""
+    from scripts import backfill_time_buckets
+
+    app, client = dynamodb
+    client.put_item(TableName=TABLE_NAME, Item={'visitId': {'S': 'old'}, 'timestamp': {'S': '2023-01-01T08:30:00Z'}})
+    client.put_item(TableName=TABLE_NAME, Item={'visitId': {'S': 'COUNTER'}, 'visitCount': {'N': '5'}})
+    _put_visits(app, client, [1])
+
+    backfill_time_buckets.main(['--table', TABLE_NAME, '--segments', '2'], client=client)
+
+    old = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'old'}})['Item']
+    counter = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'COUNTER'}})['Item']
+    assert old['timeBucket'] == {'S': '2023-01-01T08'}
+    assert 'timeBucket' not in counter
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from scripts import reenrich_visits
+from visitor import compact
+
+TABLE_NAME = 'visitor_test'
+USER_AGENT_TABLE = 'visitor_user_agents'
+CHROME = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+          "Chrome/120.0.0.0 Safari/537.36")
+
+
+class FakeBatchApi:
+    """Answers ip-api.com batch lookups, optionally starting with a 429."""
+
+    def __init__(self, rate_limited=0):
+        self.batches = []
+        self.rate_limited = rate_limited
+
+    def post(self, path, body, headers=None, timeout=None):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            return 429, {'X-Rl': '0', 'X-Ttl': '0'}, b''
+        addresses = json.loads(body)
+        self.batches.append(addresses)
+        results = [{'status': 'fail', 'query': address} if address.startswith('10.') else
+                   {'status': 'success', 'country': 'Canada', 'countryCode': 'CA', 'regionName': 'Ontario',
+                    'city': 'Toronto', 'lat': 43.65, 'lon': -79.38, 'query': address}
+                   for address in addresses]
+        return 200, {'X-Rl': '14', 'X-Ttl': '60'}, json.dumps(results).encode()
+
+
+def _visit(app, visit_id, ip_address, geo_data=None):
+    return app.build_visit_item(visit_id, 1, '2024-05-01T13:45:10Z', ip_address, CHROME,
+                                app.parse_user_agent(CHROME), 'Direct', geo_data)
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with mock_dynamodb():
+        import visitor.app
+        client = boto3.client('dynamodb', 'us-east-1')
+        for name, key in ((TABLE_NAME, 'visitId'), (USER_AGENT_TABLE, 'uaHash')):
+            client.create_table(
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'}],
+                TableName=name,
+                KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        # main() points the function's reader at the script's client; undo that afterwards
+        monkeypatch.setattr(visitor.app, '_ddb_client', visitor.app._ddb_client)
+        monkeypatch.delenv('userAgentTableName', raising=False)
+        yield visitor.app, client
+
+
+def test_reenrich_fills_missing_geolocation_and_reparses_user_agents(dynamodb, tmp_path):
+    """Test visits get geolocation from deduplicated batch lookups and stale user agent parses are redone"""
+    app, client = dynamodb
+    for n in range(150):
+        client.put_item(TableName=TABLE_NAME, Item=_visit(app, f"missing-{n}", f"203.0.{n % 120}.0"))
+    stale = _visit(app, 'stale', '198.51.100.0', {'country': 'Germany'})
+    stale['uaParserVersion'] = {'N': '1'}
+    stale['browser'] = {'S': 'Unknown'}
+    client.put_item(TableName=TABLE_NAME, Item=stale)
+    client.put_item(TableName=TABLE_NAME, Item=_visit(app, 'private', '10.1.2.0'))
+    client.put_item(TableName=TABLE_NAME, Item={'visitId': {'S': 'COUNTER'}, 'visitCount': {'N': '152'}})
+    api = FakeBatchApi(rate_limited=1)
+
+    reenrich_visits.main(['--table', TABLE_NAME, '--segments', '3', '--checkpoint', str(tmp_path / 'cp.json')],
+                         client=client, pool=api)
+
+    looked_up = [address for batch in api.batches for address in batch]
+    assert len(looked_up) == len(set(looked_up)) == 121
+    assert all(len(batch) <= 100 for batch in api.batches)
+    visit = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'missing-7'}})['Item']
+    assert visit['country'] == {'S': 'Canada'} and visit['latitude'] == {'N': '43.65'}
+    stale = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'stale'}})['Item']
+    assert stale['browser'] == {'S': 'Chrome'} and stale['country'] == {'S': 'Germany'}
+    assert 'country' not in client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'private'}})['Item']
+    counter = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'COUNTER'}})['Item']
+    assert set(counter) == {'visitId', 'visitCount'}
+
+
+def test_reenrich_resumes_from_checkpoint(dynamodb, tmp_path):
+    """Test a rerun with the checkpoint skips finished segments and reuses resolved addresses"""
+    app, client = dynamodb
+    checkpoint = tmp_path / 'cp.json'
+    client.put_item(TableName=TABLE_NAME, Item=_visit(app, 'first', '203.0.113.0'))
+    reenrich_visits.main(['--table', TABLE_NAME, '--segments', '1', '--checkpoint', str(checkpoint)],
+                         client=client, pool=FakeBatchApi())
+
+    client.put_item(TableName=TABLE_NAME, Item=_visit(app, 'second', '203.0.113.0'))
+    api = FakeBatchApi()
+    reenrich_visits.main(['--table', TABLE_NAME, '--segments', '1', '--checkpoint', str(checkpoint)],
+                         client=client, pool=api)
+    assert 'country' not in client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'second'}})['Item']
+
+    state = json.loads(checkpoint.read_text())
+    state['segments'] = {}
+    checkpoint.write_text(json.dumps(state))
+    reenrich_visits.main(['--table', TABLE_NAME, '--segments', '1', '--checkpoint', str(checkpoint)],
+                         client=client, pool=api)
+
+    assert api.batches == []
+    assert client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'second'}})['Item']['country'] == \
+        {'S': 'Canada'}
+
+
+def test_reenrich_updates_compact_visits_in_their_encoding(dynamodb, monkeypatch):
+    """Test compact visits get short attribute codes and enum values, with user agents from the dictionary"""
+    app, client = dynamodb
+    monkeypatch.setenv('visitEncoding', 'compact')
+    monkeypatch.setenv('userAgentTableName', USER_AGENT_TABLE)
+    monkeypatch.setattr(app, '_ddb_client', client)
+    app._known_user_agents.clear()
+    visit = _visit(app, 'compact', '203.0.113.0')
+    visit['uaParserVersion'] = {'N': '1'}
+    visit['browser'] = {'S': 'Unknown'}
+    client.put_item(TableName=TABLE_NAME, Item=app.stored_item(visit))
+    app._known_user_agents.clear()
+
+    reenrich_visits.main(['--table', TABLE_NAME, '--segments', '1', '--user-agent-table', USER_AGENT_TABLE],
+                         client=client, pool=FakeBatchApi())
+
+    stored = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'compact'}})['Item']
+    assert 'country' not in stored and stored['c'] == {'S': 'Canada'}
+    assert stored['b'] == {'N': str(compact.ENUMS['browser'].index('Chrome'))}
+    assert compact.decode(stored)['uaParserVersion'] == {'N': str(app.ua_parser.PARSER_VERSION)}
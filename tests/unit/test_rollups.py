@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import boto3
+import pytest
+import threading
+from datetime import datetime
+from moto import mock_dynamodb
+from unittest.mock import patch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor import rollups
+
+TABLE_NAME = 'visitor_test'
+
+
+def _visit(day, country, browser='Chrome', os_name='Windows', referer='Direct'):
+    item = {
+        'visitId': {'S': f"{day}-{country}-{browser}"},
+        'timestamp': {'S': f"{day}T12:00:00Z"},
+        'browser': {'S': browser},
+        'os': {'S': os_name},
+        'referer': {'S': referer}
+    }
+    if country:
+        item['country'] = {'S': country}
+    return item
+
+
+def test_count_rollups_groups_by_day_and_dimension():
+    """Test visits are aggregated per day with one counter per dimension value"""
+    counts = rollups.count_rollups([
+        _visit('2024-05-01', 'Germany', referer='https://www.google.com/search?q=resume'),
+        _visit('2024-05-01', 'Germany', browser='Firefox'),
+        _visit('2024-05-02', None),
+    ])
+
+    assert counts['2024-05-01']['visits'] == 2
+    assert counts['2024-05-01']['country#Germany'] == 2
+    assert counts['2024-05-01']['browser#Firefox'] == 1
+    assert counts['2024-05-01']['referer#google.com'] == 1
+    assert counts['2024-05-01']['referer#Direct'] == 1
+    assert counts['2024-05-02']['country#Unknown'] == 1
+
+
+def test_dimension_values_are_bounded():
+    """Test referers that aren't URLs count as Other and long values are cut"""
+    counts = rollups.count_rollups([
+        _visit('2024-05-01', 'Germany', referer='<script>x</script>'),
+        _visit('2024-05-01', 'Germany', browser='B' * 500, referer='https://www.' + 'a' * 300 + '.com/'),
+    ])
+
+    assert counts['2024-05-01']['referer#Other'] == 1
+    assert counts['2024-05-01'][f"browser#{'B' * rollups.MAX_VALUE_LENGTH}"] == 1
+    assert all(len(name.partition('#')[2]) <= rollups.MAX_VALUE_LENGTH for name in counts['2024-05-01'])
+
+
+def test_cap_new_values_folds_values_past_the_limit():
+    """Test values new to a full dimension are counted as Other, known ones still count as themselves"""
+    existing = {'visitId': {'S': 'STATS#2024-05-01'}, 'referer#a.com': {'N': '1'}, 'referer#b.com': {'N': '1'}}
+    counts = {'visits': 3, 'referer#a.com': 1, 'referer#c.com': 1, 'referer#d.com': 1, 'country#Germany': 3}
+
+    capped = rollups.cap_new_values(counts, existing, limit=2)
+
+    assert capped == {'visits': 3, 'referer#a.com': 1, 'referer#Other': 2, 'country#Germany': 3}
+
+
+def test_summarize_fills_missing_days():
+    """Test days without a rollup item report zero visits"""
+    item = {
+        'visitId': {'S': 'STATS#2024-05-02'},
+        'visits': {'N': '3'},
+        'country#Germany': {'N': '2'},
+        'country#France': {'N': '1'},
+    }
+    stats = rollups.summarize([item], ['2024-05-01', '2024-05-02'])
+
+    assert stats['visits'] == 3
+    assert stats['days'] == [{'date': '2024-05-01', 'visits': 0}, {'date': '2024-05-02', 'visits': 3}]
+    assert stats['country'] == {'Germany': 2, 'France': 1}
+
+
+@mock_dynamodb
+def test_stats_endpoint_reads_rollups_without_scanning(monkeypatch):
+    """Test visits maintain rollups and GET /visitor/stats answers from them"""
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('statsRollups', 'true')
+    client = boto3.client('dynamodb', 'us-east-1')
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+    visit_event = {
+        'requestContext': {},
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+            'Referer': 'https://www.linkedin.com/in/someone'
+        }
+    }
+    with patch.object(visitor.app, 'get_geolocation', return_value={'country': 'Canada'}):
+        for _ in range(3):
+            visitor.app.lambda_handler(visit_event, "")
+
+    with patch.object(visitor.app.get_ddb_client(), 'scan', side_effect=AssertionError("scan used")):
+        response = visitor.app.lambda_handler(
+            {'httpMethod': 'GET', 'path': '/visitor/stats', 'queryStringParameters': {'days': '2'}}, ""
+        )
+
+    assert response['statusCode'] == 200
+    assert 'max-age' in response['headers']['Cache-Control']
+    stats = json.loads(response['body'])
+    assert stats['visits'] == 3
+    assert stats['days'][-1] == {'date': datetime.now().date().isoformat(), 'visits': 3}
+    assert stats['country'] == {'Canada': 3}
+    assert stats['browser'] == {'Firefox': 3}
+    assert stats['referer'] == {'linkedin.com': 3}
+
+
+def test_stats_endpoint_validates_days(monkeypatch):
+    """Test out-of-range or malformed days are rejected"""
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+
+    for days in ('0', '365', 'week'):
+        response = visitor.app.lambda_handler(
+            {'httpMethod': 'GET', 'path': '/visitor/stats', 'queryStringParameters': {'days': days}}, ""
+        )
+        assert response['statusCode'] == 400
+
+
+@mock_dynamodb
+def test_rollup_items_stop_growing_past_the_cap(monkeypatch):
+    """Test client-chosen referers and bot names can't add attributes to a day's items without bound"""
+    import visitor.app
+    monkeypatch.setattr(rollups, 'MAX_DIMENSION_VALUES', 2)
+    client = boto3.client('dynamodb', 'us-east-1')
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+    for n in range(5):
+        visitor.app.record_rollups(TABLE_NAME, [_visit('2024-05-01', 'Germany', referer=f"https://site{n}.example/")])
+        visitor.app.record_bot_visit(TABLE_NAME, 'user-agent', f"scraper{n}/1.0")
+    visitor.app.record_rollups(TABLE_NAME, [_visit('2024-05-01', 'Germany', referer='https://site0.example/')])
+
+    stats = client.get_item(TableName=TABLE_NAME, Key={'visitId': {'S': 'STATS#2024-05-01'}})['Item']
+    assert {name: value['N'] for name, value in stats.items() if name.startswith('referer#')} == \
+        {'referer#site0.example': '2', 'referer#site1.example': '1', 'referer#Other': '3'}
+    assert stats['visits'] == {'N': '6'}
+    bots = client.get_item(TableName=TABLE_NAME,
+                           Key={'visitId': {'S': f"BOTS#{datetime.now().date().isoformat()}"}})['Item']
+    assert sorted(name for name in bots if name.startswith('agent#')) == ['agent#Other', 'agent#scraper0',
+                                                                           'agent#scraper1']
+
+
+@mock_dynamodb
+@pytest.mark.parametrize('write_mode', ['separate', 'transact'])
+def test_failed_visit_write_is_not_counted_in_rollups(monkeypatch, write_mode):
+    """Test a visit whose write fails (500) leaves the day's rollup untouched"""
+    import botocore.exceptions
+    import visitor.app
+    monkeypatch.setenv('tableName', TABLE_NAME)
+    monkeypatch.setenv('statsRollups', 'true')
+    monkeypatch.setenv('visitWriteMode', write_mode)
+    client = boto3.client('dynamodb', 'us-east-1')
+    client.create_table(
+        AttributeDefinitions=[{'AttributeName': 'visitId', 'AttributeType': 'S'}],
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'visitId', 'KeyType': 'HASH'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    error = botocore.exceptions.ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'boom'}}, 'Write')
+    rolled_up = threading.Event()
+
+    with patch.object(visitor.app, 'get_geolocation', return_value={'country': 'Canada'}), \
+         patch.object(visitor.app.get_ddb_client(), 'put_item', side_effect=error), \
+         patch.object(visitor.app, 'record_visit_transactionally', side_effect=error), \
+         patch.object(visitor.app, 'record_rollups', side_effect=lambda *args: rolled_up.set()):
+        response = visitor.app.lambda_handler({'requestContext': {}, 'headers': {'User-Agent': 'Mozilla/5.0'}}, "")
+
+        assert response['statusCode'] == 500
+        assert not rolled_up.wait(0.2)
@@ -0,0 +1,54 @@
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor.ttl_cache import TTLCache, MISSING
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_returns_missing_for_absent_keys():
+    """Test a miss is distinguishable from a cached None"""
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set('negative', None)
+
+    assert cache.get('absent') is MISSING
+    assert cache.get('negative') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_ttl_cache_expires_entries():
+    """Test entries expire after their own TTL"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=4, ttl=10, clock=clock)
+    cache.set('long', 'a')
+    cache.set('short', 'b', ttl=1)
+
+    clock.now += 5
+    assert cache.get('short') is MISSING
+    assert cache.get('long') == 'a'
+    assert cache.stats()['expirations'] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test the cache stays bounded and evicts the coldest entry"""
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+    assert len(cache) == 2
@@ -0,0 +1,76 @@
+import os
+import sys
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from visitor import user_agent
+
+
+@pytest.mark.parametrize("ua, expected", [
+    (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.59",
+        {'browser': 'Edge', 'browserVersion': '91.0.864.59', 'os': 'Windows', 'osVersion': '10',
+         'device': 'desktop', 'isBot': False}
+    ),
+    (
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Version/14.1.1 Mobile/15E148 Safari/604.1",
+        {'browser': 'Safari', 'browserVersion': '14.1.1', 'os': 'iOS', 'osVersion': '14.6',
+         'device': 'mobile', 'isBot': False}
+    ),
+    (
+        "Mozilla/5.0 (Linux; Android 11; Pixel 5) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/90.0.4430.91 Mobile Safari/537.36",
+        {'browser': 'Chrome', 'browserVersion': '90.0.4430.91', 'os': 'Android', 'osVersion': '11',
+         'device': 'mobile', 'isBot': False}
+    ),
+    (
+        "Mozilla/5.0 (iPad; CPU OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+        "CriOS/91.0.4472.80 Mobile/15E148 Safari/604.1",
+        {'browser': 'Chrome', 'browserVersion': '91.0.4472.80', 'os': 'iOS', 'osVersion': '14.6',
+         'device': 'tablet', 'isBot': False}
+    ),
+    (
+        "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0",
+        {'browser': 'Firefox', 'browserVersion': '89.0', 'os': 'Linux', 'osVersion': None,
+         'device': 'desktop', 'isBot': False}
+    ),
+    (
+        "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+        {'browser': 'Unknown', 'browserVersion': None, 'os': 'Unknown', 'osVersion': None,
+         'device': 'bot', 'isBot': True}
+    ),
+    (
+        "Mozilla/5.0 (Windows NT 6.1; WOW64; Trident/7.0; rv:11.0) like Gecko",
+        {'browser': 'Internet Explorer', 'browserVersion': '11.0', 'os': 'Windows', 'osVersion': '7',
+         'device': 'desktop', 'isBot': False}
+    ),
+])
+def test_parse_user_agent_details(ua, expected):
+    """Test browser, OS, versions, device class and bot flag extraction"""
+    assert user_agent.parse(ua) == expected
+
+
+def test_parse_user_agent_flags_tools_and_headless_browsers():
+    """Test scripted clients are flagged as bots"""
+    assert user_agent.parse("curl/7.68.0")['isBot'] is True
+    assert user_agent.parse("python-requests/2.31.0")['isBot'] is True
+    assert user_agent.parse(
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/91.0.4472.114 Safari/537.36"
+    )['isBot'] is True
+
+
+def test_parse_user_agent_caches_results():
+    """Test repeat user agents are served from the cache without sharing state"""
+    user_agent.clear_cache()
+    ua = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0"
+
+    first = user_agent.parse(ua)
+    first['browser'] = 'Modified'
+    second = user_agent.parse(ua)
+
+    assert second['browser'] == 'Firefox'
+    assert user_agent.cache_info().hits == 1
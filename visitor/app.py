@@ -1,83 +1,442 @@
-from ipaddress import ip_address
+from ipaddress import ip_network
 import os
+import base64
+import hashlib
 import json
 import logging
-from datetime import datetime
-import boto3
-import botocore
-import urllib.request
-import urllib.error
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+import botocore.exceptions
 from uuid import uuid4
 
+try:
+    from visitor.ttl_cache import TTLCache, MISSING
+    from visitor.geo_table import GeoTable
+    from visitor.visit_queue import SqsVisitQueue
+    from visitor.http_pool import KeepAlivePool
+    from visitor.deadline import Deadline, backoff_delay
+    from visitor.circuit_breaker import CircuitBreaker, CircuitOpenError
+    from visitor.rate_limit import TokenBuckets
+    from visitor import user_agent as ua_parser
+    from visitor import rollups
+    from visitor import metrics
+    from visitor import bot_filter
+    from visitor import compact
+except ImportError:  # deployed with visitor/ as the code root
+    from ttl_cache import TTLCache, MISSING
+    from geo_table import GeoTable
+    from visit_queue import SqsVisitQueue
+    from http_pool import KeepAlivePool
+    from deadline import Deadline, backoff_delay
+    from circuit_breaker import CircuitBreaker, CircuitOpenError
+    from rate_limit import TokenBuckets
+    import user_agent as ua_parser
+    import rollups
+    import metrics
+    import bot_filter
+    import compact
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize DynamoDB client
 region = os.environ.get('AWS_REGION', 'us-east-1')
 
-try:
-    ddbClient = boto3.client('dynamodb', region_name=region)
-except Exception as e:
-    logger.error(f"Failed to initialize DynamoDB client: {e}")
-    ddbClient = None
+# AWS clients are created on first use, so paths that never touch AWS (the
+# OPTIONS preflight, validation errors) don't pay for loading botocore's
+# client machinery and service models on a cold start. Clients come straight
+# from a botocore session; boto3 would only add its resource layer on top.
+_ddb_client = None
+_client_lock = threading.Lock()
+
+def _client_config():
+    """botocore Config for the AWS clients, tuned through environment variables."""
+    from botocore.config import Config
+    return Config(
+        connect_timeout=float(os.environ.get('awsConnectTimeout', '1')),
+        read_timeout=float(os.environ.get('awsReadTimeout', '3')),
+        tcp_keepalive=os.environ.get('awsTcpKeepalive', 'true').lower() == 'true',
+        max_pool_connections=int(os.environ.get('awsMaxPoolConnections', '10')),
+        retries={
+            'mode': os.environ.get('awsRetryMode', 'adaptive'),
+            'max_attempts': int(os.environ.get('awsMaxAttempts', '3'))
+        }
+    )
+
+def _create_client(service_name, endpoint_url=None):
+    from botocore.session import get_session
+    return get_session().create_client(service_name, region_name=region, endpoint_url=endpoint_url,
+                                       config=_client_config())
+
+def _request_consumed_capacity(params, model, **kwargs):
+    # Only ask for consumed capacity while a request's metrics are being recorded
+    if metrics.current() is not None and 'ReturnConsumedCapacity' in model.input_shape.members:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+def _record_consumed_capacity(parsed, **kwargs):
+    consumed = parsed.get('ConsumedCapacity')
+    if not consumed:
+        return
+    # Single-item calls return one entry; batch and transaction calls return one per table
+    entries = consumed if isinstance(consumed, list) else [consumed]
+    metrics.add('ConsumedCapacity', sum(entry.get('CapacityUnits', 0) for entry in entries))
+
+def get_ddb_client():
+    global _ddb_client
+    if _ddb_client is None:
+        with _client_lock:
+            if _ddb_client is None:
+                client = _create_client('dynamodb', os.environ.get('ddbEndpoint') or None)
+                client.meta.events.register('provide-client-params.dynamodb', _request_consumed_capacity)
+                client.meta.events.register('after-call.dynamodb', _record_consumed_capacity)
+                _ddb_client = client
+    return _ddb_client
+
+# Queue that carries raw visits to ingest_handler when ingestMode=async, created on first use
+_visit_queue = None
+
+def get_visit_queue():
+    global _visit_queue
+    if _visit_queue is None:
+        _visit_queue = SqsVisitQueue(os.environ['visitQueueUrl'], _create_client('sqs'))
+    return _visit_queue
+
+# Worker threads for the independent I/O stages, reused across warm invocations
+_stage_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('stageWorkers', '4')))
+
+# Geolocation cache, kept across warm invocations of the same container
+GEO_CACHE_SIZE = int(os.environ.get('geoCacheSize', '2048'))
+GEO_CACHE_TTL = float(os.environ.get('geoCacheTtl', '3600'))
+GEO_NEGATIVE_CACHE_TTL = float(os.environ.get('geoNegativeCacheTtl', '60'))
+GEO_CACHE_PREFIX_V4 = int(os.environ.get('geoCachePrefixV4', '24'))
+GEO_CACHE_PREFIX_V6 = int(os.environ.get('geoCachePrefixV6', '48'))
+
+geo_cache = TTLCache(maxsize=GEO_CACHE_SIZE, ttl=GEO_CACHE_TTL)
+
+# Keep-alive connections to ip-api.com, reused across warm invocations
+GEO_API_HOST = 'ip-api.com'
+GEO_API_FIELDS = 'status,country,countryCode,region,regionName,city,lat,lon,timezone,isp'
+
+geo_pool = KeepAlivePool(
+    GEO_API_HOST,
+    maxsize=int(os.environ.get('geoPoolSize', os.environ.get('stageWorkers', '4'))),
+    timeout=float(os.environ.get('geoTimeout', '2')),
+    idle_timeout=float(os.environ.get('geoPoolIdleTimeout', '30'))
+)
+
+def _geo_breaker():
+    return CircuitBreaker(
+        failure_threshold=int(os.environ.get('geoBreakerFailures', '5')),
+        window=float(os.environ.get('geoBreakerWindow', '30')),
+        open_seconds=float(os.environ.get('geoBreakerOpenSeconds', '30')),
+        slow_call_seconds=float(os.environ.get('geoBreakerSlowMs', '1500')) / 1000
+    )
 
-def get_geolocation(ip_address):
+# Stops calling ip-api.com while it is failing, slow or rate limiting us
+geo_breaker = _geo_breaker()
 
-    if not ip_address or ip_address == '127.0.0.1':
+# Optional offline range table (built by scripts/build_geo_table.py), loaded on first use
+_geo_table = None
+_geo_table_path = None
+
+def get_geo_table():
+    global _geo_table, _geo_table_path
+
+    path = os.environ.get('geoTablePath')
+    if not path:
         return None
-        
+    if path != _geo_table_path:
+        _geo_table_path = path
+        _geo_table = None
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        try:
+            _geo_table = GeoTable(path)
+            logger.info(f"Loaded geo table {path} with {len(_geo_table)} ranges")
+        except Exception as e:
+            logger.error(f"Failed to load geo table {path}: {e}")
+
+    return _geo_table
+
+def _geo_prefix_key(ip_address):
+    # Neighbouring addresses in the same prefix almost always share a location,
+    # so a prefix-level entry lets them reuse each other's lookups.
+    prefix = GEO_CACHE_PREFIX_V6 if ':' in ip_address else GEO_CACHE_PREFIX_V4
+    max_prefix = 128 if ':' in ip_address else 32
+    if prefix <= 0 or prefix >= max_prefix:
+        return None
+    try:
+        return str(ip_network(f"{ip_address}/{prefix}", strict=False))
+    except ValueError:
+        return None
+
+def _parse_ip_api(data):
+    if data.get('status') != 'success':
+        return None
+    return {
+        'country': data.get('country'),
+        'countryCode': data.get('countryCode'),
+        'region': data.get('regionName'),
+        'city': data.get('city'),
+        'latitude': data.get('lat'),
+        'longitude': data.get('lon'),
+        'timezone': data.get('timezone'),
+        'isp': data.get('isp')
+    }
+
+def _parse_ipwhois(data):
+    if not data.get('success'):
+        return None
+    return {
+        'country': data.get('country'),
+        'countryCode': data.get('country_code'),
+        'region': data.get('region'),
+        'city': data.get('city'),
+        'latitude': data.get('latitude'),
+        'longitude': data.get('longitude'),
+        'timezone': (data.get('timezone') or {}).get('id'),
+        'isp': (data.get('connection') or {}).get('isp')
+    }
+
+# Geolocation providers: (host, path template, response parser)
+GEO_PROVIDERS = {
+    'ip-api.com': (GEO_API_HOST, f"/json/{{ip}}?fields={GEO_API_FIELDS}", _parse_ip_api),
+    'ipwho.is': ('ipwho.is', '/{ip}?fields=success,country,country_code,region,city,latitude,longitude,'
+                             'timezone,connection', _parse_ipwhois),
+}
+
+def _apply_rate_limit(breaker, status, headers):
+    """Open the breaker until the upstream's rate limit window resets (ip-api.com's X-Rl / X-Ttl headers)."""
+    names = {name.lower(): value for name, value in headers.items()}
+    try:
+        remaining = int(names.get('x-rl', '1'))
+        reset = float(names.get('x-ttl', '0'))
+    except ValueError:
+        return
+    if status == 429 or remaining <= 0:
+        pause = reset or breaker.open_seconds
+        logger.warning(f"Geolocation upstream rate limit reached, pausing lookups for {pause:.0f}s")
+        breaker.open_for(pause)
+
+def _query_geo_provider(provider, pool, breaker, ip_address, timeout):
+    """One lookup against provider through its circuit breaker; returns geo_data, or None if unresolvable."""
+    _, path, parse = GEO_PROVIDERS[provider]
+    if not breaker.allow():
+        raise CircuitOpenError(f"{provider} circuit is open")
+    start = time.monotonic()
     try:
-        url = f"http://ip-api.com/json/{ip_address}?fields=status,country,countryCode,region,regionName,city,lat,lon,timezone,isp"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=2) as response:
-            data = json.loads(response.read().decode())
-            if data.get('status') == 'success':
-                return {
-                    'country': data.get('country'),
-                    'countryCode': data.get('countryCode'),
-                    'region': data.get('regionName'),
-                    'city': data.get('city'),
-                    'latitude': data.get('lat'),
-                    'longitude': data.get('lon'),
-                    'timezone': data.get('timezone'),
-                    'isp': data.get('isp')
-                }
+        status, headers, body = pool.get(path.format(ip=ip_address), timeout=timeout)
+    except Exception:
+        breaker.record_failure()
+        raise
+    _apply_rate_limit(breaker, status, headers)
+    if status != 200:
+        breaker.record_failure()
+        raise RuntimeError(f"{provider} returned HTTP {status}")
+    breaker.record_success(time.monotonic() - start)
+    return parse(json.loads(body.decode()))
+
+# Optional secondary provider that slow ip-api.com lookups are hedged to
+_secondary_geo = None
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+def _secondary_geo_provider():
+    """(name, pool, breaker) of the provider named by geoSecondaryProvider, or None."""
+    global _secondary_geo, _hedge_executor
+    name = os.environ.get('geoSecondaryProvider')
+    if not name or name not in GEO_PROVIDERS:
+        return None
+    with _hedge_lock:
+        if _secondary_geo is None or _secondary_geo[0] != name:
+            _secondary_geo = (name, KeepAlivePool(GEO_PROVIDERS[name][0], maxsize=geo_pool.maxsize,
+                                                  timeout=geo_pool.timeout, idle_timeout=geo_pool.idle_timeout),
+                              _geo_breaker())
+        if _hedge_executor is None:
+            # Separate from _stage_executor, whose workers wait on these lookups
+            _hedge_executor = ThreadPoolExecutor(max_workers=2 * geo_pool.maxsize)
+    return _secondary_geo
+
+def _hedged_geo_query(ip_address, timeout, secondary):
+    """
+    Query ip-api.com and, if it hasn't answered within geoHedgeAfterMs (or
+    fails or is circuit-broken first), the secondary provider as well; the
+    first answer wins.
+    """
+    timeout = geo_pool.timeout if timeout is None else timeout
+    hedge_after = float(os.environ.get('geoHedgeAfterMs', '300')) / 1000
+    start = time.monotonic()
+    futures = {_hedge_executor.submit(_query_geo_provider, 'ip-api.com', geo_pool, geo_breaker, ip_address,
+                                      timeout): 'ip-api.com'}
+    done, _ = wait(futures, timeout=min(hedge_after, timeout))
+    primary_failed = done and next(iter(done)).exception() is not None
+    if not done or primary_failed:
+        metrics.add('GeoHedged')
+        name, pool, breaker = secondary
+        remaining = max(timeout - (time.monotonic() - start), 0.001)
+        futures[_hedge_executor.submit(_query_geo_provider, name, pool, breaker, ip_address, remaining)] = name
+
+    errors = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(timeout - (time.monotonic() - start), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError(f"No geolocation answer within {timeout:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                if futures[future] != 'ip-api.com':
+                    metrics.add('GeoHedgeWins')
+                return future.result()
+            errors.append(future.exception())
+    # Report the upstream failure rather than an open circuit, if there was one
+    raise next((e for e in errors if not isinstance(e, CircuitOpenError)), errors[0])
+
+def _fetch_geolocation(ip_address, timeout=None):
+    """Query ip-api.com; returns (geo_data, ttl) where ttl is how long to cache the result (0: don't)."""
+    try:
+        secondary = _secondary_geo_provider()
+        if secondary is not None:
+            geo_data = _hedged_geo_query(ip_address, timeout, secondary)
+        else:
+            geo_data = _query_geo_provider('ip-api.com', geo_pool, geo_breaker, ip_address, timeout)
+        # None: private, reserved or malformed addresses will not start resolving
+        return geo_data, GEO_CACHE_TTL
+    except CircuitOpenError:
+        # The breaker already keeps lookups away from the upstream; nothing to cache per address
+        metrics.add('GeoCircuitOpen')
+        return None, 0
+    except TimeoutError as e:
+        if timeout is not None and timeout < geo_pool.timeout:
+            # Cut short by the request's budget rather than failed by the upstream
+            logger.warning(f"Geolocation for {ip_address} didn't fit its {timeout * 1000:.0f}ms budget")
+            return None, 0
+        logger.warning(f"Failed to get geolocation for {ip_address}: {str(e)}")
     except Exception as e:
         logger.warning(f"Failed to get geolocation for {ip_address}: {str(e)}")
-    
-    return None
 
-def parse_user_agent(user_agent):
+    # Cache upstream failures briefly so a flaky upstream doesn't cost a timeout per request
+    return None, GEO_NEGATIVE_CACHE_TTL
 
-    if not user_agent:
-        return {'browser': 'Unknown', 'os': 'Unknown'}
-    
-    # Simple browser detection
-    browser = 'Unknown'
-    if 'Edg/' in user_agent:
-        browser = 'Edge'
-    elif 'Chrome/' in user_agent:
-        browser = 'Chrome'
-    elif 'Firefox/' in user_agent:
-        browser = 'Firefox'
-    elif 'Safari/' in user_agent and 'Chrome' not in user_agent:
-        browser = 'Safari'
-    
-    # Simple OS detection
-    os_name = 'Unknown'
-    if 'Windows' in user_agent:
-        os_name = 'Windows'
-    elif 'Macintosh' in user_agent or 'Mac OS X' in user_agent:
-        os_name = 'macOS'
-    elif 'Linux' in user_agent:
-        os_name = 'Linux'
-    elif 'Android' in user_agent:
-        os_name = 'Android'
-    elif 'iPhone' in user_agent or 'iPad' in user_agent:
-        os_name = 'iOS'
-    
-    return {'browser': browser, 'os': os_name}
+def _lookup_geo_api(ip_address, timeout=None):
+    """ip-api.com lookup through the warm-container cache."""
+    cached = geo_cache.get(ip_address)
+    if cached is not MISSING:
+        metrics.add('GeoCacheHits')
+        return cached
+
+    prefix_key = _geo_prefix_key(ip_address)
+    if prefix_key:
+        cached = geo_cache.get(prefix_key)
+        if cached is not MISSING:
+            metrics.add('GeoCacheHits')
+            geo_cache.set(ip_address, cached)
+            return cached
+
+    metrics.add('GeoCacheMisses')
+    geo_data, ttl = _fetch_geolocation(ip_address, timeout)
+    if ttl > 0:
+        geo_cache.set(ip_address, geo_data, ttl=ttl)
+    if geo_data and prefix_key:
+        geo_cache.set(prefix_key, geo_data, ttl=ttl)
+
+    return geo_data
+
+def _lookup_geo_table(ip_address):
+    geo_table = get_geo_table()
+    return geo_table.lookup(ip_address) if geo_table is not None else None
+
+# CloudFront viewer headers and the geolocation fields they carry
+CLOUDFRONT_GEO_HEADERS = {
+    'cloudfront-viewer-country-name': 'country',
+    'cloudfront-viewer-country': 'countryCode',
+    'cloudfront-viewer-country-region-name': 'region',
+    'cloudfront-viewer-city': 'city',
+    'cloudfront-viewer-latitude': 'latitude',
+    'cloudfront-viewer-longitude': 'longitude',
+    'cloudfront-viewer-time-zone': 'timezone'
+}
+
+def geo_from_headers(headers):
+    """Build whatever geolocation fields CloudFront already attached to the request."""
+    geo_data = {}
+    for name, value in (headers or {}).items():
+        field = CLOUDFRONT_GEO_HEADERS.get(name.lower())
+        if not field or not value:
+            continue
+        if field in ('latitude', 'longitude'):
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+        geo_data[field] = value
+    return geo_data
+
+def _same_country(known, found):
+    """
+    True unless found places the address in another country, compared by code
+    or else by name. Sources with nothing to compare (a code on one side, only
+    a name on the other) are taken to agree.
+    """
+    for field in ('countryCode', 'country'):
+        if known.get(field) is not None and found.get(field) is not None:
+            return str(known[field]).upper() == str(found[field]).upper()
+    return True
+
+def get_geolocation(ip_address, headers=None, api_timeout=None):
+    """
+    Resolve geolocation from the sources named in geoSourceOrder (CloudFront
+    headers, the offline table, ip-api.com). Each source only fills fields the
+    earlier ones left empty, and only if it agrees on the country, so a record
+    never mixes places; later sources are skipped once every field in
+    geoRequiredFields is known, so requests with full CloudFront headers never
+    leave the function. A hit in the offline table also ends the search unless
+    geoTableFinal is false, since table layouts rarely carry every field.
+
+    api_timeout overrides geoTimeout for ip-api.com; 0 skips it (cached
+    results are still used).
+    """
+    source_order = [s.strip() for s in os.environ.get('geoSourceOrder', 'headers,table,api').split(',')]
+    required_fields = [f.strip() for f in os.environ.get(
+        'geoRequiredFields', 'country,countryCode,region,city,latitude,longitude,timezone'
+    ).split(',') if f.strip()]
+    has_ip = bool(ip_address) and ip_address != '127.0.0.1'
+
+    geo_data = {}
+    for source in source_order:
+        if source == 'headers':
+            found = geo_from_headers(headers)
+        elif source == 'table' and has_ip:
+            found = _lookup_geo_table(ip_address)
+        elif source == 'api' and has_ip:
+            if api_timeout is not None and api_timeout <= 0:
+                cached = geo_cache.get(ip_address)
+                found = cached if cached is not MISSING else None
+                metrics.add('GeoSkipped')
+            else:
+                found = _lookup_geo_api(ip_address, api_timeout)
+        else:
+            continue
+
+        if found and geo_data and not _same_country(geo_data, found):
+            logger.info(f"Ignoring {source} geolocation for {ip_address}: it disagrees on the country")
+            found = None
+        for field, value in (found or {}).items():
+            if value is not None and geo_data.get(field) is None:
+                geo_data[field] = value
+        if geo_data and all(geo_data.get(field) is not None for field in required_fields):
+            break
+        if source == 'table' and found and os.environ.get('geoTableFinal', 'true').lower() == 'true':
+            break
+
+    return geo_data or None
+
+def parse_user_agent(user_agent):
+    """Parse browser, OS, their versions, device class and bot flag (see user_agent.py)."""
+    return ua_parser.parse(user_agent)
 
 def anonymize_ip(ip_address):
     if not ip_address or ip_address == 'Unknown':
@@ -95,67 +454,931 @@ def anonymize_ip(ip_address):
         logger.warning(f"Failed to anonymize IP {ip_address}: {str(e)}")
         return ip_address
 
-def get_next_visit_number(table_name, starting_number=1):
+COUNTER_KEY = 'COUNTER'
+
+def _counter_shard_count():
+    return int(os.environ.get('counterShards', '0'))
+
+def counter_shard_keys(shards):
+    return [f"{COUNTER_KEY}#{shard}" for shard in range(shards)]
+
+BATCH_GET_SIZE = 100  # BatchGetItem limit
+
+def _batch_get_items(table_name, keys, consistent=False, projection=None, key_name='visitId'):
+    """BatchGet items by their string hash key, following UnprocessedKeys; returns the items that exist."""
+    items = []
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        table_request = {
+            'Keys': [{key_name: {'S': key}} for key in keys[start:start + BATCH_GET_SIZE]],
+            'ConsistentRead': consistent
+        }
+        if projection:
+            table_request['ProjectionExpression'] = projection
+        request = {table_name: table_request}
+        while request:
+            response = get_ddb_client().batch_get_item(RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys')
+
+    return items
+
+def _read_counter_items(table_name, keys, consistent=False):
+    """Get the given counter items; returns {key: (visitCount, lastUpdated)} for the ones that exist."""
+    projection = 'visitId, visitCount, lastUpdated'
+    if len(keys) == 1:
+        item = get_ddb_client().get_item(
+            TableName=table_name, Key={'visitId': {'S': keys[0]}}, ConsistentRead=consistent,
+            ProjectionExpression=projection
+        ).get('Item')
+        items = [item] if item else []
+    else:
+        items = _batch_get_items(table_name, keys, consistent, projection)
+    return {
+        item['visitId']['S']: (int(item.get('visitCount', {}).get('N', '0')), item.get('lastUpdated', {}).get('S'))
+        for item in items
+    }
+
+def read_visit_count(table_name, starting_number=1, consistent=False):
+    """
+    Read the current visit count and lastUpdated without incrementing.
+
+    With counterShards set, the total is the sum of every shard plus the legacy
+    COUNTER item, so enabling sharding needs no migration up front.
+    """
+    shards = _counter_shard_count()
+    keys = [COUNTER_KEY] + (counter_shard_keys(shards) if shards > 1 else [])
+    counters = _read_counter_items(table_name, keys, consistent=consistent)
+
+    total = sum(count for count, _ in counters.values())
+    if COUNTER_KEY not in counters:
+        total += starting_number - 1
+    last_updated = max((ts for _, ts in counters.values() if ts), default=None)
+    return total, last_updated
+
+def _get_next_sharded_visit_number(table_name, starting_number, shards, shard_key=None):
+
+    current_timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    # Spread increments over the shard items so no single item takes every write
+    if shard_key and os.environ.get('counterShardSelection', 'random') == 'hash':
+        shard = zlib.crc32(shard_key.encode('utf-8')) % shards
+    else:
+        shard = random.randrange(shards)
+
+    response = get_ddb_client().update_item(
+        TableName=table_name,
+        Key={'visitId': {'S': f"{COUNTER_KEY}#{shard}"}},
+        UpdateExpression='ADD visitCount :incr SET lastUpdated = :ts',
+        ExpressionAttributeValues={
+            ':incr': {'N': '1'},
+            ':ts': {'S': current_timestamp}
+        },
+        ReturnValues='ALL_OLD'
+    )
+    shard_last_updated = response.get('Attributes', {}).get('lastUpdated', {}).get('S')
+
+    # Aggregate every shard (and the legacy COUNTER) to get the total. Concurrent
+    # visits can observe the same total, so numbers are approximately sequential.
+    keys = [COUNTER_KEY] + counter_shard_keys(shards)
+    counters = _read_counter_items(table_name, keys, consistent=True)
+    visit_number = sum(count for count, _ in counters.values())
+    if COUNTER_KEY not in counters:
+        visit_number += starting_number - 1
+
+    other_updates = [ts for key, (_, ts) in counters.items() if ts and key != f"{COUNTER_KEY}#{shard}"]
+    previous_last_updated = max(other_updates + ([shard_last_updated] if shard_last_updated else []), default=None)
+
+    logger.info(f"Incremented counter shard {shard}, total: {visit_number}, previous update: {previous_last_updated}")
+    return visit_number, previous_last_updated
+
+# Block of visit numbers reserved by this container when counterBlockSize > 1
+_visit_block = None
+_visit_block_lock = threading.Lock()
+
+def _reserve_visit_block(table_name, starting_number, block_size):
 
     current_timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    response = get_ddb_client().update_item(
+        TableName=table_name,
+        Key={'visitId': {'S': COUNTER_KEY}},
+        UpdateExpression='SET visitCount = if_not_exists(visitCount, :base) + :block, lastUpdated = :ts',
+        ExpressionAttributeValues={
+            ':base': {'N': str(starting_number - 1)},
+            ':block': {'N': str(block_size)},
+            ':ts': {'S': current_timestamp}
+        },
+        ReturnValues='UPDATED_OLD'
+    )
+    old = response.get('Attributes', {})
+    first = int(old['visitCount']['N']) + 1 if 'visitCount' in old else starting_number
+
+    logger.info(f"Reserved visit numbers {first}-{first + block_size - 1}")
+    return {
+        'next': first,
+        'end': first + block_size,
+        'reserved_at': time.monotonic(),
+        'last_updated': old.get('lastUpdated', {}).get('S')
+    }
+
+def _get_next_block_visit_number(table_name, starting_number, block_size):
+    """
+    Hand out the next number from this container's reserved block, reserving a
+    new block with a single ADD once it runs out. Unused numbers in a block are
+    lost when the container goes away, so the sequence has gaps. A block older
+    than counterBlockMaxAge seconds is abandoned so a quiet container doesn't
+    keep reporting counts far behind the rest of the fleet.
+    """
+    global _visit_block
+
+    max_age = float(os.environ.get('counterBlockMaxAge', '300'))
+    with _visit_block_lock:
+        block = _visit_block
+        if block is None or block['next'] >= block['end'] or time.monotonic() - block['reserved_at'] > max_age:
+            block = _visit_block = _reserve_visit_block(table_name, starting_number, block_size)
+
+        visit_number = block['next']
+        previous_last_updated = block['last_updated']
+        block['next'] += 1
+        block['last_updated'] = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    return visit_number, previous_last_updated
+
+# Errors worth retrying a counter write for, once botocore's own retries are used up
+RETRYABLE_COUNTER_ERRORS = ('TransactionConflictException', 'ProvisionedThroughputExceededException',
+                            'ThrottlingException', 'RequestLimitExceeded', 'InternalServerError')
+# Cancellation reason codes of a TransactWriteItems call that a retry can get past
+RETRYABLE_CANCELLATION_REASONS = ('TransactionConflict', 'ProvisionedThroughputExceeded', 'ThrottlingError')
+
+def _counter_retry_settings():
+    return int(os.environ.get('counterMaxAttempts', '3')), float(os.environ.get('counterRetryBaseMs', '25')) / 1000
+
+def get_next_visit_number(table_name, starting_number=1, shard_key=None, deadline=None):
+
+    block_size = int(os.environ.get('counterBlockSize', '1'))
+    if block_size > 1:
+        try:
+            return _get_next_block_visit_number(table_name, starting_number, block_size)
+        except botocore.exceptions.ClientError as e:
+            logger.error(f"Failed to reserve visit numbers: {str(e)}")
+            # Return a fallback number based on timestamp
+            return starting_number + int(datetime.now().timestamp() % 1000), None
+
+    shards = _counter_shard_count()
+    if shards > 1:
+        try:
+            return _get_next_sharded_visit_number(table_name, starting_number, shards, shard_key)
+        except botocore.exceptions.ClientError as e:
+            logger.error(f"Failed to get sharded visit number: {str(e)}")
+            # Return a fallback number based on timestamp
+            return starting_number + int(datetime.now().timestamp() % 1000), None
+
+    # The counter starts at starting_number on the first write, so there is
+    # nothing to initialize and no creation race to retry
+    max_attempts, retry_base = _counter_retry_settings()
+    for attempt in range(max_attempts):
+        current_timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        try:
+            response = get_ddb_client().update_item(
+                TableName=table_name,
+                Key={'visitId': {'S': COUNTER_KEY}},
+                UpdateExpression='SET visitCount = if_not_exists(visitCount, :base) + :incr, lastUpdated = :ts',
+                ExpressionAttributeValues={
+                    ':base': {'N': str(starting_number - 1)},
+                    ':incr': {'N': '1'},
+                    ':ts': {'S': current_timestamp}
+                },
+                ReturnValues='UPDATED_OLD'
+            )
+        except botocore.exceptions.ClientError as e:
+            error_code = e.response['Error']['Code']
+            delay = None
+            if error_code in RETRYABLE_COUNTER_ERRORS and attempt + 1 < max_attempts:
+                delay = backoff_delay(attempt, retry_base, deadline=deadline)
+            if delay is None:
+                logger.error(f"Failed to get visit number: {str(e)}")
+                # Return a fallback number based on timestamp
+                return starting_number + int(datetime.now().timestamp() % 1000), None
+            logger.warning(f"Counter update failed ({error_code}), retrying in {delay * 1000:.0f}ms "
+                           f"(attempt {attempt + 1})")
+            time.sleep(delay)
+            continue
+
+        # Get the previous lastUpdated and count (before this update)
+        old = response.get('Attributes', {})
+        previous_last_updated = old.get('lastUpdated', {}).get('S')
+        visit_number = int(old['visitCount']['N']) + 1 if 'visitCount' in old else starting_number
+
+        logger.info(f"Incremented counter to: {visit_number}, previous update: {previous_last_updated}")
+        return visit_number, previous_last_updated
+
+# Counter value and lastUpdated this container last wrote in transact mode
+_counter_snapshot = None
+
+def _read_counter_snapshot(table_name):
+    item = get_ddb_client().get_item(
+        TableName=table_name,
+        Key={'visitId': {'S': COUNTER_KEY}},
+        ConsistentRead=True
+    ).get('Item')
+    return _parse_counter_snapshot(item)
+
+def _parse_counter_snapshot(item):
+    if not item or 'visitCount' not in item:
+        return None, None
+    return int(item['visitCount']['N']), item.get('lastUpdated', {}).get('S')
+
+def record_visit_transactionally(table_name, item, starting_number=1, max_attempts=5, deadline=None):
+    """
+    Increment the COUNTER and insert the visit record in one TransactWriteItems call.
+
+    The new count is derived from the count this container last saw, guarded by
+    a visitCount = :expected condition. When another container got there first
+    the transaction is cancelled and DynamoDB returns the current COUNTER item,
+    so the retry needs no extra read. A warm container under low contention
+    records each visit in a single round trip.
+    """
+    global _counter_snapshot
+
+    snapshot = _counter_snapshot
+    for attempt in range(max_attempts):
+        if snapshot is None:
+            snapshot = _read_counter_snapshot(table_name)
+        count, previous_last_updated = snapshot
+
+        current_timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        visit_number = count + 1 if count is not None else starting_number
+        item['visitNumId'] = {'N': str(visit_number)}
+
+        if count is None:
+            counter_write = {'Put': {
+                'TableName': table_name,
+                'Item': {
+                    'visitId': {'S': COUNTER_KEY},
+                    'visitCount': {'N': str(visit_number)},
+                    'lastUpdated': {'S': current_timestamp}
+                },
+                'ConditionExpression': 'attribute_not_exists(visitId)',
+                'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+            }}
+        else:
+            counter_write = {'Update': {
+                'TableName': table_name,
+                'Key': {'visitId': {'S': COUNTER_KEY}},
+                'UpdateExpression': 'SET visitCount = :next, lastUpdated = :ts',
+                'ConditionExpression': 'visitCount = :expected',
+                'ExpressionAttributeValues': {
+                    ':next': {'N': str(visit_number)},
+                    ':expected': {'N': str(count)},
+                    ':ts': {'S': current_timestamp}
+                },
+                'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+            }}
+
+        try:
+            get_ddb_client().transact_write_items(TransactItems=[
+                counter_write,
+                {'Put': {
+                    'TableName': table_name,
+                    'Item': stored_item(item),
+                    'ConditionExpression': 'attribute_not_exists(visitId)'
+                }}
+            ])
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons') or [{}]
+            codes = {reason.get('Code') for reason in reasons} - {'None', None}
+            if reasons[0].get('Code') == 'ConditionalCheckFailed':
+                # Fall back to a consistent read if the current item wasn't returned
+                snapshot = _parse_counter_snapshot(reasons[0]['Item']) if reasons[0].get('Item') else None
+                cause = "COUNTER changed by another request"
+            elif codes and codes <= set(RETRYABLE_CANCELLATION_REASONS):
+                # A concurrent transaction on COUNTER, or throttling; the count may have moved meanwhile
+                snapshot = None
+                cause = f"Transaction cancelled ({', '.join(sorted(codes))})"
+            else:
+                raise
+            # Jitter keeps contending containers from colliding again in lockstep
+            delay = backoff_delay(attempt, _counter_retry_settings()[1], deadline=deadline)
+            if delay is None:
+                break
+            logger.warning(f"{cause}, retrying transaction (attempt {attempt + 1})")
+            time.sleep(delay)
+            continue
+
+        _counter_snapshot = (visit_number, current_timestamp)
+        logger.info(f"Recorded visit #{visit_number} in one transaction, previous update: {previous_last_updated}")
+        return visit_number, previous_last_updated
+
+    # Heavy contention or a short budget: fall back to the separate increment and put
+    logger.warning(f"Transaction retries exhausted after {attempt + 1} attempts, using separate writes")
+    _counter_snapshot = None
+    visit_number, previous_last_updated = get_next_visit_number(table_name, starting_number, deadline=deadline)
+    item['visitNumId'] = {'N': str(visit_number)}
+    get_ddb_client().put_item(TableName=table_name, Item=stored_item(item))
+    return visit_number, previous_last_updated
+
+def time_bucket(timestamp):
+    """Hour bucket ('YYYY-MM-DDTHH') used to partition TimeBucketIndex."""
+    return timestamp[:13]
+
+def build_visit_item(visit_id, visit_num_id, timestamp, ip_address, user_agent, browser_info, referer, geo_data):
+
+    item = {
+        'visitId': {'S': visit_id},
+        'timestamp': {'S': timestamp},
+        'timeBucket': {'S': time_bucket(timestamp)},  # partition key of TimeBucketIndex
+        'ipAddress': {'S': ip_address},
+        'userAgent': {'S': user_agent},
+        'browser': {'S': browser_info['browser']},
+        'os': {'S': browser_info['os']},
+        'referer': {'S': referer}
+    }
+    if browser_info.get('browserVersion'):
+        item['browserVersion'] = {'S': browser_info['browserVersion']}
+    if browser_info.get('osVersion'):
+        item['osVersion'] = {'S': browser_info['osVersion']}
+    if browser_info.get('device'):
+        item['device'] = {'S': browser_info['device']}
+    if 'isBot' in browser_info:
+        item['isBot'] = {'BOOL': browser_info['isBot']}
+    item['uaParserVersion'] = {'N': str(ua_parser.PARSER_VERSION)}
+    if visit_num_id is not None:
+        item['visitNumId'] = {'N': str(visit_num_id)}  # Sequential counter
     
+    # Add geolocation data if available
+    if geo_data:
+        if geo_data.get('country'):
+            item['country'] = {'S': geo_data['country']}
+        if geo_data.get('countryCode'):
+            item['countryCode'] = {'S': geo_data['countryCode']}
+        if geo_data.get('region'):
+            item['region'] = {'S': geo_data['region']}
+        if geo_data.get('city'):
+            item['city'] = {'S': geo_data['city']}
+        if geo_data.get('latitude') is not None:
+            item['latitude'] = {'N': str(geo_data['latitude'])}
+        if geo_data.get('longitude') is not None:
+            item['longitude'] = {'N': str(geo_data['longitude'])}
+        if geo_data.get('timezone'):
+            item['timezone'] = {'S': geo_data['timezone']}
+        if geo_data.get('isp'):
+            item['isp'] = {'S': geo_data['isp']}
+
+    return item
+
+# Interned user agents (hash -> agent) known to be in the dictionary table
+# used by visitEncoding=compact, so each one is written once per container
+_known_user_agents = TTLCache(maxsize=int(os.environ.get('userAgentCacheSize', '1024')), ttl=86400)
+
+def _compact_encoding():
+    return os.environ.get('visitEncoding', 'full') == 'compact'
+
+def _intern_user_agent(ua_hash, user_agent):
+    """Make sure the dictionary table maps ua_hash to user_agent. Returns False if it couldn't be written."""
+    if _known_user_agents.get(ua_hash) is not MISSING:
+        return True
+    try:
+        get_ddb_client().put_item(
+            TableName=os.environ['userAgentTableName'],
+            Item={'uaHash': {'S': ua_hash}, 'userAgent': {'S': user_agent}},
+            ConditionExpression='attribute_not_exists(uaHash)'
+        )
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.warning(f"Failed to intern user agent {ua_hash}: {e.response['Error']['Message']}")
+            return False
+    except KeyError:
+        logger.warning("visitEncoding=compact needs userAgentTableName, storing the user agent inline")
+        return False
+    _known_user_agents.set(ua_hash, user_agent)
+    return True
+
+def stored_item(item):
+    """The visit item as written to the table: compact-encoded when visitEncoding=compact."""
+    if not _compact_encoding():
+        return item
+    stored, ua_hash = compact.encode(item)
+    if ua_hash and not _intern_user_agent(ua_hash, item['userAgent']['S']):
+        stored[compact.USER_AGENT_INLINE] = item['userAgent']
+    return stored
+
+def decode_visit_items(items, resolve_user_agents=True):
+    """Logical visit items for stored ones of either encoding, looking up interned user agents in batches."""
+    agents = {}
+    if resolve_user_agents:
+        missing = set()
+        for item in items:
+            if compact.USER_AGENT_HASH in item:
+                ua_hash = item[compact.USER_AGENT_HASH]['S']
+                cached = _known_user_agents.get(ua_hash)
+                if cached is MISSING:
+                    missing.add(ua_hash)
+                else:
+                    agents[ua_hash] = cached
+        if missing:
+            for entry in _batch_get_items(os.environ['userAgentTableName'], sorted(missing), key_name='uaHash'):
+                agents[entry['uaHash']['S']] = entry['userAgent']['S']
+                _known_user_agents.set(entry['uaHash']['S'], entry['userAgent']['S'])
+    return [compact.decode(item, agents) for item in items]
+
+# Allow/deny prefix sets for the bot pre-filter, parsed again only when the settings change
+_bot_prefixes = None
+
+def _bot_prefix_sets():
+    global _bot_prefixes
+    settings = (os.environ.get('botDenyPrefixes', ''), os.environ.get('botAllowPrefixes', ''))
+    if _bot_prefixes is None or _bot_prefixes[0] != settings:
+        _bot_prefixes = (settings, bot_filter.PrefixSet.parse(settings[0]), bot_filter.PrefixSet.parse(settings[1]))
+    return _bot_prefixes[1], _bot_prefixes[2]
+
+def record_bot_visit(table_name, reason, user_agent):
+    """Count an automated request on today's BOTS# aggregate item. Errors are logged, never raised."""
+    counts = {'visits': 1, f"reason#{reason}": 1, f"agent#{bot_filter.bot_name(user_agent)}": 1}
+    day = datetime.now().date().isoformat()
+    try:
+        add_rollup_counts(table_name, day, counts, rollups.BOT_ROLLUP_PREFIX)
+    except botocore.exceptions.ClientError as e:
+        logger.error(f"Failed to count automated request for {day}: {e.response['Error']['Message']}")
+
+# Repeat visits from the same client within dedupWindowSeconds are answered
+# with the current count instead of being recorded again. Markers live in
+# the visitor table as DEDUP#<anonymized IP>#<user agent hash> items that
+# DynamoDB's TTL removes via expiresAt; the condition on expiresAt covers the
+# time between expiry and the TTL sweep. The in-process cache spares repeat
+# hits on a warm container the marker write.
+DEDUP_PREFIX = 'DEDUP#'
+
+dedup_cache = TTLCache(maxsize=int(os.environ.get('dedupCacheSize', '4096')))
+
+def _dedup_window():
+    return int(os.environ.get('dedupWindowSeconds', '0'))
+
+def _dedup_key(ip_address, user_agent):
+    digest = hashlib.blake2b(user_agent.encode('utf-8'), digest_size=8).hexdigest()
+    return f"{DEDUP_PREFIX}{ip_address}#{digest}"
+
+def is_repeat_visit(table_name, ip_address, user_agent, window):
+    """
+    True if this client already visited within the window; otherwise claim the
+    window for it and return False. Fails open: if the marker can't be
+    written the visit is counted.
+    """
+    key = _dedup_key(ip_address, user_agent)
+    if dedup_cache.get(key) is not MISSING:
+        return True
+
+    now = int(time.time())
     try:
-        response = ddbClient.update_item(
+        get_ddb_client().put_item(
             TableName=table_name,
-            Key={'visitId': {'S': 'COUNTER'}},
-            UpdateExpression='ADD visitCount :incr SET lastUpdated = :ts',
-            ExpressionAttributeValues={
-                ':incr': {'N': '1'},
-                ':ts': {'S': current_timestamp}
-            },
-            ReturnValues='ALL_OLD'
+            Item={'visitId': {'S': key}, 'expiresAt': {'N': str(now + window)}},
+            ConditionExpression='attribute_not_exists(visitId) OR expiresAt <= :now',
+            ExpressionAttributeValues={':now': {'N': str(now)}},
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
         )
-        
-        # Get the previous lastUpdated (before this update)
-        previous_last_updated = None
-        if 'Attributes' in response and 'lastUpdated' in response['Attributes']:
-            previous_last_updated = response['Attributes']['lastUpdated']['S']
-        
-        # Get the new count (we need to add 1 to the old count since we used ALL_OLD)
-        if 'Attributes' in response and 'visitCount' in response['Attributes']:
-            visit_number = int(response['Attributes']['visitCount']['N']) + 1
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.warning(f"Failed to write dedup marker, counting the visit: {e.response['Error']['Message']}")
+            return False
+        # Cache the repeat only for what is left of the other request's window
+        expires_at = int(e.response.get('Item', {}).get('expiresAt', {}).get('N', now + window))
+        dedup_cache.set(key, True, ttl=max(expires_at - now, 1))
+        return True
+
+    dedup_cache.set(key, True, ttl=window)
+    return False
+
+# Per-client token buckets (rateLimitPerMinute, rateLimitBurst), keyed by the
+# anonymized IP. The shared bucket is a RATE#<anonymized IP> item in the
+# visitor table holding the bucket's GCRA arrival time (see rate_limit.py),
+# moved on by conditional UpdateItems so containers can't both spend the
+# last token, and removed by the expiresAt TTL once the bucket is full again.
+# Each container keeps the arrival times it has seen: a client it already
+# knows to be over the limit is refused without a DynamoDB call, and its
+# first rateLimitSharedAfter requests only charge the container's copy.
+RATE_LIMIT_PREFIX = 'RATE#'
+RATE_LIMIT_ATTEMPTS = 3
+
+_rate_buckets = None
+
+def _client_rate_buckets():
+    """The container's token buckets, or None when rate limiting is off."""
+    global _rate_buckets
+    rate = float(os.environ.get('rateLimitPerMinute', '0'))
+    if rate <= 0:
+        return None
+    burst = int(os.environ.get('rateLimitBurst', '20'))
+    if _rate_buckets is None or (_rate_buckets.rate_per_minute, _rate_buckets.burst) != (rate, max(1, burst)):
+        _rate_buckets = TokenBuckets(rate, burst, int(os.environ.get('rateLimitCacheSize', '4096')))
+    return _rate_buckets
+
+def _take_shared_token(table_name, key, buckets, now):
+    """Take a token from the client's bucket in DynamoDB; returns 0 or the seconds to wait."""
+    local = arrival = buckets.arrival(key)
+    for _ in range(RATE_LIMIT_ATTEMPTS):
+        if arrival is None or arrival <= now:
+            # The shared bucket is full: start it over, from what this container already spent
+            update = 'SET arrivalAt = :next, expiresAt = :expires'
+            condition = 'attribute_not_exists(arrivalAt) OR arrivalAt <= :now'
+            values = {':now': {'N': str(now)}, ':next': {'N': str(max(local or now, now) + buckets.interval_ms)}}
         else:
-            visit_number = starting_number
-        
-        logger.info(f"Incremented counter to: {visit_number}, previous update: {previous_last_updated}")
-        return visit_number, previous_last_updated
-        
+            update = 'SET arrivalAt = arrivalAt + :interval, expiresAt = :expires'
+            condition = 'arrivalAt > :now AND arrivalAt <= :latest'
+            values = {':now': {'N': str(now)}, ':interval': {'N': str(buckets.interval_ms)},
+                      ':latest': {'N': str(now + buckets.tolerance_ms)}}
+        # The arrival time never passes now + burst intervals, so expire the item there
+        values[':expires'] = {'N': str((now + buckets.tolerance_ms + buckets.interval_ms) // 1000 + 1)}
+        try:
+            response = get_ddb_client().update_item(
+                TableName=table_name,
+                Key={'visitId': {'S': key}},
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+                ReturnValues='UPDATED_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # Another container moved the bucket on; retry against its arrival time
+            old = e.response.get('Item', {}).get('arrivalAt')
+            arrival = int(old['N']) if old else None
+            wait = buckets.retry_after(arrival, now)
+            if wait:
+                buckets.observe(key, arrival, now)
+                return wait
+            continue
+        buckets.observe(key, int(response['Attributes']['arrivalAt']['N']), now)
+        return 0
+    logger.warning(f"Rate limit bucket {key} kept changing, letting the request through")
+    return 0
+
+def take_rate_limit_token(table_name, ip_address, buckets):
+    """
+    Take a token from the client's bucket. Returns 0 if the request may go
+    ahead, otherwise the seconds until it would be allowed. Fails open to the
+    container's own bucket if the shared one can't be reached.
+    """
+    key = f"{RATE_LIMIT_PREFIX}{ip_address}"
+    now = buckets.now()
+    wait = buckets.retry_after(buckets.arrival(key), now)
+    if wait:
+        return wait
+    # Most visitors make a handful of requests; only clients that have spent
+    # rateLimitSharedAfter tokens in this container cost a bucket write
+    shared_after = int(os.environ.get('rateLimitSharedAfter', '5'))
+    if os.environ.get('rateLimitShared', 'true').lower() != 'true' or buckets.in_use(key, now) < shared_after:
+        return buckets.take(key, now)
+    try:
+        return _take_shared_token(table_name, key, buckets, now)
     except botocore.exceptions.ClientError as e:
-        error_code = e.response['Error']['Code']
-        
-        # If item doesn't exist, create it with starting_number
-        if error_code == 'ValidationException' or 'Item' not in str(e):
-            logger.info(f"COUNTER doesn't exist, initializing with {starting_number}")
+        logger.warning(f"Failed to update rate limit bucket, using this container's: {e.response['Error']['Message']}")
+        return buckets.take(key, now)
+
+def _rollups_enabled():
+    return os.environ.get('statsRollups', 'false').lower() == 'true'
+
+def add_rollup_counts(table_name, day, counts, prefix=rollups.ROLLUP_PREFIX):
+    """
+    ADD counts onto a day's rollup item. Values the item already has take one
+    conditional UpdateItem; when some are new, the failed condition returns
+    the item and a second update adds them, capped per dimension.
+    """
+    try:
+        get_ddb_client().update_item(**rollups.update_request(table_name, day, counts, prefix, existing_only=True))
+        return
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        existing = e.response.get('Item', {})
+    get_ddb_client().update_item(**rollups.update_request(table_name, day, rollups.cap_new_values(counts, existing),
+                                                          prefix))
+
+def record_rollups(table_name, items):
+    """ADD the visits onto their days' STATS# rollup items; usually one UpdateItem per day."""
+    for day, counts in rollups.count_rollups(items).items():
+        try:
+            add_rollup_counts(table_name, day, counts)
+        except botocore.exceptions.ClientError as e:
+            # Rollups are derived data; never fail a visit because of them
+            logger.error(f"Failed to update rollups for {day}: {e.response['Error']['Message']}")
+
+def get_visit_stats(table_name, days):
+    """Read the rollups for the last `days` days (today included)."""
+    today = datetime.now().date()
+    day_list = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+    items = _batch_get_items(table_name, [rollups.rollup_key(day) for day in day_list])
+    return rollups.summarize(items, day_list)
+
+BATCH_WRITE_SIZE = 25  # BatchWriteItem limit
+
+def write_visit_items(table_name, items, max_attempts=5):
+    """
+    Write visit items with BatchWriteItem, retrying unprocessed items with
+    backoff. Returns the visitIds that could not be written.
+    """
+    failed = []
+    for start in range(0, len(items), BATCH_WRITE_SIZE):
+        pending = [{'PutRequest': {'Item': stored_item(item)}} for item in items[start:start + BATCH_WRITE_SIZE]]
+        for attempt in range(max_attempts):
             try:
-                # Initialize counter
-                ddbClient.put_item(
-                    TableName=table_name,
-                    Item={
-                        'visitId': {'S': 'COUNTER'},
-                        'visitCount': {'N': str(starting_number)},
-                        'lastUpdated': {'S': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")}
-                    },
-                    ConditionExpression='attribute_not_exists(visitId)'  # Only if doesn't exist
-                )
-                return starting_number, None
-            except botocore.exceptions.ClientError as create_error:
-                # If another Lambda created it simultaneously, try to get it
-                if create_error.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                    logger.warning("COUNTER was created by another request, retrying...")
-                    return get_next_visit_number(table_name, starting_number)
-                else:
-                    logger.error(f"Failed to initialize counter: {str(create_error)}")
-                    # Return a fallback number
-                    return starting_number, None
+                response = get_ddb_client().batch_write_item(RequestItems={table_name: pending})
+            except botocore.exceptions.ClientError as e:
+                logger.error(f"Batch write failed: {e.response['Error']['Message']}")
+                break
+            pending = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not pending:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 1.0))
+
+        failed.extend(request['PutRequest']['Item']['visitId']['S'] for request in pending)
+
+    return failed
+
+def _metrics_namespace():
+    return os.environ.get('metricsNamespace', metrics.DEFAULT_NAMESPACE)
+
+def ingest_handler(event: dict, context: any) -> dict:
+    """
+    SQS consumer for ingestMode=async: enrich queued raw visits and write them
+    in batches. Messages whose items couldn't be written are reported back as
+    batch item failures so SQS redelivers only those.
+    """
+    ddb_table_name = os.environ.get('tableName')
+    request_start = time.perf_counter()
+    request_metrics = metrics.begin(_metrics_namespace(), {'Route': 'ingest'})
+    try:
+        return _ingest(event, ddb_table_name, request_metrics)
+    finally:
+        request_metrics.put_timings({'total': (time.perf_counter() - request_start) * 1000})
+        metrics.finish(request_metrics)
+
+# Fields lambda_handler puts on every queued visit, and their types
+VISIT_MESSAGE_FIELDS = {'visitId': str, 'visitNumId': int, 'timestamp': str, 'ipAddress': str,
+                        'userAgent': str, 'referer': str}
+
+def _check_visit_message(visit):
+    """Raise ValueError unless visit has every field _ingest reads, with the right type."""
+    if not isinstance(visit, dict):
+        raise ValueError("message body is not an object")
+    for field, kind in VISIT_MESSAGE_FIELDS.items():
+        if not isinstance(visit.get(field), kind):
+            raise ValueError(f"missing or invalid {field}")
+    if not isinstance(visit.get('geoHeaders', {}), dict):
+        raise ValueError("invalid geoHeaders")
+    return visit
+
+def _ingest(event, ddb_table_name, request_metrics):
+    visits = []
+    for record in event.get('Records', []):
+        try:
+            visits.append((record['messageId'], _check_visit_message(json.loads(record['body']))))
+        except (KeyError, ValueError) as e:
+            # A malformed message will never succeed, so don't ask for redelivery
+            logger.error(f"Dropping malformed visit message: {str(e)}")
+            request_metrics.add('MessagesDropped')
+
+    # Resolve each distinct address (and CloudFront header set) once, concurrently
+    geo_keys = list({(visit['ipAddress'], tuple(sorted(visit.get('geoHeaders', {}).items()))) for _, visit in visits})
+    geo_by_key = dict(zip(geo_keys, _stage_executor.map(lambda key: get_geolocation(key[0], dict(key[1])), geo_keys)))
+
+    message_ids = {}
+    items = []
+    for message_id, visit in visits:
+        message_ids[visit['visitId']] = message_id
+        items.append(build_visit_item(
+            visit['visitId'],
+            visit['visitNumId'],
+            visit['timestamp'],
+            anonymize_ip(visit['ipAddress']),
+            visit['userAgent'],
+            parse_user_agent(visit['userAgent']),
+            visit['referer'],
+            geo_by_key[(visit['ipAddress'], tuple(sorted(visit.get('geoHeaders', {}).items())))]
+        ))
+
+    failed = write_visit_items(ddb_table_name, items)
+    logger.info(f"Ingested {len(items) - len(failed)} of {len(items)} queued visits")
+    request_metrics.add('VisitsIngested', len(items) - len(failed))
+    request_metrics.add('VisitsFailed', len(failed))
+
+    if _rollups_enabled():
+        # Failed items are redelivered, so only count the ones that were written
+        failed_ids = set(failed)
+        record_rollups(ddb_table_name, [item for item in items if item['visitId']['S'] not in failed_ids])
+
+    return {'batchItemFailures': [{'itemIdentifier': message_ids[visit_id]} for visit_id in failed]}
+
+def _json_response(status_code, body, headers=None):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            **(headers or {})
+        },
+        "body": json.dumps(body),
+        "isBase64Encoded": False
+    }
+
+def _visit_response(visit_id, visit_num_id, previous_last_updated, message):
+    return _json_response(200, {
+        "success": True,
+        "visitId": visit_id,
+        "visitorCount": visit_num_id,
+        "previousLastViewedDate": previous_last_updated,
+        "message": message
+    })
+
+# Fields of a visit exposed by GET /visitor/recent; addresses and raw user agents stay private
+RECENT_VISIT_FIELDS = ('visitNumId', 'timestamp', 'country', 'countryCode', 'region', 'city',
+                       'browser', 'os', 'device', 'referer')
+MAX_RECENT_HOURS = 72
+MAX_RECENT_LIMIT = 100
+
+def _encode_page_token(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode()
+
+def _decode_page_token(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode()))
+
+def _is_page_key(key):
+    """True if key has the shape of a TimeBucketIndex LastEvaluatedKey (string attributes only)."""
+    return isinstance(key, dict) and bool(key) and all(
+        isinstance(value, dict) and list(value) == ['S'] and isinstance(value['S'], str) for value in key.values()
+    )
+
+def _public_visit(item):
+    visit = {}
+    for field in RECENT_VISIT_FIELDS:
+        value = item.get(field)
+        if not value:
+            continue
+        if 'N' in value:
+            visit[field] = int(value['N']) if field == 'visitNumId' else float(value['N'])
+        elif 'S' in value:
+            visit[field] = rollups.referer_host(value['S']) if field == 'referer' else value['S']
+    return visit
+
+def query_recent_visits(table_name, newest_bucket, hours, limit, bucket_index=0, start_key=None, since=None):
+    """
+    Page through visits newest first, one hour bucket at a time, with a Query
+    per bucket against TimeBucketIndex. With since (a visit timestamp), the
+    window is the last hours hours rather than whole buckets: one more bucket
+    is read, and the range key condition drops visits before since. Returns
+    (visits, state) where state resumes the walk, or None once every bucket
+    has been read.
+    """
+    index_name = os.environ.get('timeBucketIndex', 'TimeBucketIndex')
+    newest = datetime.strptime(newest_bucket, "%Y-%m-%dT%H")
+    buckets = hours + 1 if since else hours
+    visits = []
+
+    while bucket_index < buckets and len(visits) < limit:
+        bucket = (newest - timedelta(hours=bucket_index)).strftime("%Y-%m-%dT%H")
+        query = {
+            'TableName': table_name,
+            'IndexName': index_name,
+            'KeyConditionExpression': 'timeBucket = :bucket',
+            'ExpressionAttributeValues': {':bucket': {'S': bucket}},
+            'ScanIndexForward': False,
+            'Limit': limit - len(visits)
+        }
+        if since:
+            query['KeyConditionExpression'] += ' AND #ts >= :since'
+            query['ExpressionAttributeNames'] = {'#ts': 'timestamp'}
+            query['ExpressionAttributeValues'][':since'] = {'S': since}
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+
+        response = get_ddb_client().query(**query)
+        visits.extend(_public_visit(item) for item in decode_visit_items(response.get('Items', []), False))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            bucket_index += 1
+
+    if bucket_index >= buckets:
+        return visits, None
+    return visits, {'b': newest_bucket, 'h': hours, 'i': bucket_index, 'k': start_key, 's': since}
+
+def _handle_recent(event, table_name):
+    """GET /visitor/recent?hours=N&limit=M&next=TOKEN: recent visits, newest first."""
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = int(params.get('limit', '25'))
+        if params.get('next'):
+            state = _decode_page_token(params['next'])
+            newest_bucket, hours, bucket_index, start_key = state['b'], int(state['h']), int(state['i']), state['k']
+            since = state.get('s')
+            # Tokens come back from the client: check everything that goes into the next Query
+            datetime.strptime(newest_bucket, "%Y-%m-%dT%H")
+            if since is not None:
+                datetime.strptime(since, "%Y-%m-%dT%H:%M:%SZ")
+            if bucket_index < 0 or (start_key is not None and not _is_page_key(start_key)):
+                raise ValueError("invalid page position")
         else:
-            logger.error(f"Failed to get visit number: {str(e)}")
-            # Return a fallback number based on timestamp
-            return starting_number + int(datetime.now().timestamp() % 1000), None
+            hours = int(params.get('hours', '1'))
+            now = datetime.now()
+            newest_bucket, bucket_index, start_key = now.strftime("%Y-%m-%dT%H"), 0, None
+            since = (now - timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    except (ValueError, KeyError, TypeError):
+        return _json_response(400, {"error": "Invalid hours, limit or next token"})
+    if not 1 <= hours <= MAX_RECENT_HOURS or not 1 <= limit <= MAX_RECENT_LIMIT:
+        return _json_response(400, {
+            "error": f"hours must be between 1 and {MAX_RECENT_HOURS}, limit between 1 and {MAX_RECENT_LIMIT}"
+        })
+
+    try:
+        visits, state = query_recent_visits(table_name, newest_bucket, hours, limit, bucket_index, start_key, since)
+    except botocore.exceptions.ClientError as e:
+        logger.error(f"DynamoDB error: {e.response['Error']['Message']}")
+        return _json_response(500, {"error": "Failed to read recent visits"})
+
+    return _json_response(200, {
+        "visits": visits,
+        "next": _encode_page_token(state) if state else None
+    })
+
+MAX_STATS_DAYS = 90
+
+def _handle_stats(event, table_name):
+    """GET /visitor/stats?days=N: visit breakdowns read from the daily rollups."""
+    params = event.get('queryStringParameters') or {}
+    try:
+        days = int(params.get('days', '7'))
+    except ValueError:
+        return _json_response(400, {"error": "days must be an integer"})
+    if not 1 <= days <= MAX_STATS_DAYS:
+        return _json_response(400, {"error": f"days must be between 1 and {MAX_STATS_DAYS}"})
+
+    try:
+        stats = get_visit_stats(table_name, days)
+    except botocore.exceptions.ClientError as e:
+        logger.error(f"DynamoDB error: {e.response['Error']['Message']}")
+        return _json_response(500, {"error": "Failed to read visitor stats"})
+
+    return _json_response(200, stats, {"Cache-Control": "public, max-age=60"})
+
+# Last count read per table for GET /visitor/count, so bursts of page views
+# share one eventually consistent read per countCacheTtl
+count_cache = TTLCache(maxsize=8)
+
+def get_cached_visit_count(table_name, starting_number=1):
+    """read_visit_count through the warm container's short-lived cache."""
+    key = (table_name, starting_number, _counter_shard_count())
+    cached = count_cache.get(key)
+    if cached is not MISSING:
+        metrics.add('CountCacheHits')
+        return cached
+    metrics.add('CountCacheMisses')
+    count = read_visit_count(table_name, starting_number)
+    count_cache.set(key, count, ttl=float(os.environ.get('countCacheTtl', '5')))
+    return count
+
+def _count_etag(visit_count, last_updated):
+    return f'"{visit_count}-{zlib.crc32((last_updated or "").encode()):08x}"'
+
+def _handle_count(event, table_name, starting_number):
+    """GET /visitor/count: the current count without recording a visit, revalidated with ETags."""
+    request_start = time.perf_counter()
+    request_metrics = metrics.begin(_metrics_namespace(), {'Route': 'count'})
+    try:
+        return _count_response(event, table_name, starting_number)
+    finally:
+        request_metrics.put_timings({'total': (time.perf_counter() - request_start) * 1000})
+        metrics.finish(request_metrics)
+
+def _count_response(event, table_name, starting_number):
+    try:
+        visit_count, last_updated = get_cached_visit_count(table_name, starting_number)
+    except botocore.exceptions.ClientError as e:
+        logger.error(f"DynamoDB error: {e.response['Error']['Message']}")
+        metrics.add('Errors')
+        return _json_response(500, {"error": "Failed to read visitor count"})
+
+    etag = _count_etag(visit_count, last_updated)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={int(os.environ.get('countMaxAge', '10'))}",
+        "Access-Control-Expose-Headers": "ETag"
+    }
+    request_headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    if_none_match = request_headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+        return {"statusCode": 304, "headers": {"Access-Control-Allow-Origin": "*", **headers}, "body": "",
+                "isBase64Encoded": False}
+
+    return _json_response(200, {"visitorCount": visit_count, "lastUpdated": last_updated}, headers)
+
+def _timed_stage(timings, stage, func, *args, **kwargs):
+    """Run one handler stage and record its wall time in milliseconds."""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
 
 def lambda_handler(event: dict, context: any) -> dict:
 
@@ -187,11 +1410,25 @@ def lambda_handler(event: dict, context: any) -> dict:
             "body": json.dumps({"error": "Internal server error"}),
             "isBase64Encoded": False
         }
+
+    path = (event.get('path') or '').rstrip('/')
+    if path.endswith('/visitor/stats'):
+        return _handle_stats(event, ddb_table_name)
+    if path.endswith('/visitor/recent'):
+        return _handle_recent(event, ddb_table_name)
+    if path.endswith('/visitor/count'):
+        return _handle_count(event, ddb_table_name, starting_visit_number)
     
+    request_start = time.perf_counter()
+    timings = {}
+    request_metrics = metrics.begin(_metrics_namespace(), {'Route': 'visit'})
+    request_metrics.set_property('requestId', getattr(context, 'aws_request_id', None))
+    deadline = Deadline.from_context(
+        context, float(os.environ.get('latencySloMs', '0')), float(os.environ.get('deadlineMarginMs', '500'))
+    )
+    request_metrics.set_property('budgetMs', deadline.budget_ms)
+
     try:
-        # Get next sequential visit number
-        visit_num_id, previous_last_updated = get_next_visit_number(ddb_table_name, starting_visit_number)
-        
         # Extract request information from API Gateway event
         request_context = event.get('requestContext', {})
         headers = event.get('headers', {})
@@ -207,81 +1444,147 @@ def lambda_handler(event: dict, context: any) -> dict:
         # Anonymize IP for privacy compliance
         ip_address = anonymize_ip(raw_ip_address)
         logger.info(f"IP anonymized: {raw_ip_address} -> {ip_address}")
-        
+
+        # The address API Gateway saw the request come from; unlike X-Forwarded-For,
+        # the client can't choose it, so it is what limits and allow lists key on
+        source_ip = request_context.get('identity', {}).get('sourceIp') or 'Unknown'
+
         # Get user agent
         user_agent = headers.get('User-Agent') or headers.get('user-agent', 'Unknown')
         
-        # Parse browser and OS
-        browser_info = parse_user_agent(user_agent)
-        
-        # Get geolocation
-        geo_data = get_geolocation(raw_ip_address)
-        
         # Get referer
         referer = headers.get('Referer') or headers.get('referer', 'Direct')
+
+        # Crawlers, monitors and link previews are caught before any network I/O
+        bot_mode = os.environ.get('botFilter', 'off')
+        if bot_mode in ('skip', 'aggregate'):
+            deny, allow = _bot_prefix_sets()
+            reason = _timed_stage(
+                timings, 'botFilter', bot_filter.classify, user_agent, headers, source_ip, deny, allow,
+                os.environ.get('botHeaderChecks', 'true').lower() == 'true'
+            )
+            if reason:
+                request_metrics.add('BotVisits')
+                request_metrics.set_property('botReason', reason)
+                if bot_mode == 'aggregate':
+                    _timed_stage(timings, 'aggregate', record_bot_visit, ddb_table_name, reason, user_agent)
+                logger.info(f"Automated request ({reason}) from {ip_address}, not counted as a visit")
+                return _visit_response(None, None, None, "Automated request, not counted")
+
+        # Clients over their rate limit are shed before any dedup, counter, geolocation or visit write
+        rate_buckets = _client_rate_buckets()
+        rate_key = anonymize_ip(source_ip)
+        if rate_buckets is not None and rate_key != 'Unknown':
+            retry_after = _timed_stage(
+                timings, 'rateLimit', take_rate_limit_token, ddb_table_name, rate_key, rate_buckets
+            )
+            if retry_after:
+                request_metrics.add('RateLimited')
+                logger.info(f"Rate limited {rate_key}, retry after {retry_after}s")
+                return _json_response(429, {"error": "Too many requests"}, {"Retry-After": str(retry_after)})
+
+        dedup_window = _dedup_window()
+        if dedup_window > 0 and ip_address != 'Unknown' and _timed_stage(
+                timings, 'dedup', is_repeat_visit, ddb_table_name, ip_address, user_agent, dedup_window):
+            visit_count, last_updated = _timed_stage(
+                timings, 'count', read_visit_count, ddb_table_name, starting_visit_number
+            )
+            request_metrics.add('RepeatVisits')
+            logger.info(f"Repeat visit from {ip_address} within {dedup_window}s, not counted")
+            return _visit_response(None, visit_count, last_updated, "Repeat visit, not counted again")
+
+        if os.environ.get('ingestMode', 'sync') == 'async':
+            # Write-behind: count the visit now and leave enrichment and the
+            # detail write to ingest_handler
+            visit_num_id, previous_last_updated = _timed_stage(
+                timings, 'counter', get_next_visit_number, ddb_table_name, starting_visit_number,
+                shard_key=ip_address, deadline=deadline
+            )
+            visit_id = str(uuid4())
+            _timed_stage(timings, 'enqueue', get_visit_queue().send, {
+                'visitId': visit_id,
+                'visitNumId': visit_num_id,
+                'timestamp': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'ipAddress': raw_ip_address,
+                'userAgent': user_agent,
+                'referer': referer,
+                'geoHeaders': {k: v for k, v in headers.items() if k.lower() in CLOUDFRONT_GEO_HEADERS}
+            })
+            timings['total'] = (time.perf_counter() - request_start) * 1000
+
+            logger.info(f"Queued visit: {visit_id} (#{visit_num_id})")
+            logger.info("Stage timings (ms): " + ", ".join(f"{stage}={ms:.1f}" for stage, ms in timings.items()))
+            return _visit_response(visit_id, visit_num_id, previous_last_updated, "Visit queued for recording")
+
+        # In transact mode the counter increment is written together with the visit record
+        transact_writes = os.environ.get('visitWriteMode', 'separate') == 'transact'
+
+        # The counter update and geolocation lookup don't depend on each other,
+        # so run them concurrently and parse the user agent while they're in flight
+        counter_future = None
+        if not transact_writes:
+            counter_future = _stage_executor.submit(
+                _timed_stage, timings, 'counter', get_next_visit_number, ddb_table_name, starting_visit_number,
+                shard_key=ip_address, deadline=deadline
+            )
+
+        # Geolocation is optional: it gets whatever the budget leaves after
+        # reserving time for the writes, and isn't called at all below the minimum
+        write_reserve = float(os.environ.get('writeReserveMs', '500')) / 1000
+        geo_min_budget = float(os.environ.get('geoMinBudgetMs', '200')) / 1000
+        geo_timeout = deadline.timeout(geo_pool.timeout, reserve=write_reserve)
+        if geo_timeout < geo_min_budget:
+            geo_timeout = 0
+        geo_start = time.perf_counter()
+        geo_future = _stage_executor.submit(
+            _timed_stage, timings, 'geo', get_geolocation, raw_ip_address, headers, geo_timeout
+        )
+        browser_info = _timed_stage(timings, 'userAgent', parse_user_agent, user_agent)
+
+        if counter_future is not None:
+            visit_num_id, previous_last_updated = counter_future.result()
+        geo_wait = deadline.timeout(None, reserve=write_reserve)
+        try:
+            geo_data = geo_future.result(timeout=None if geo_wait is None else max(geo_wait, geo_min_budget))
+        except TimeoutError:
+            # Record the visit without it; the lookup still fills the cache when it finishes
+            timings['geo'] = (time.perf_counter() - geo_start) * 1000
+            request_metrics.add('GeoAbandoned')
+            logger.warning(f"Geolocation for {ip_address} overran the request budget, recording without it")
+            geo_data = None
         
         # Create timestamp and unique ID
         now = datetime.now()
         timestamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
         visit_id = str(uuid4())
         
-        # Prepare DynamoDB item
-        item = {
-            'visitId': {'S': visit_id},
-            'visitNumId': {'N': str(visit_num_id)},  # Sequential counter
-            'timestamp': {'S': timestamp},
-            'ipAddress': {'S': ip_address},
-            'userAgent': {'S': user_agent},
-            'browser': {'S': browser_info['browser']},
-            'os': {'S': browser_info['os']},
-            'referer': {'S': referer}
-        }
-        
-        # Add geolocation data if available
-        if geo_data:
-            if geo_data.get('country'):
-                item['country'] = {'S': geo_data['country']}
-            if geo_data.get('countryCode'):
-                item['countryCode'] = {'S': geo_data['countryCode']}
-            if geo_data.get('region'):
-                item['region'] = {'S': geo_data['region']}
-            if geo_data.get('city'):
-                item['city'] = {'S': geo_data['city']}
-            if geo_data.get('latitude') is not None:
-                item['latitude'] = {'N': str(geo_data['latitude'])}
-            if geo_data.get('longitude') is not None:
-                item['longitude'] = {'N': str(geo_data['longitude'])}
-            if geo_data.get('timezone'):
-                item['timezone'] = {'S': geo_data['timezone']}
-            if geo_data.get('isp'):
-                item['isp'] = {'S': geo_data['isp']}
-        
-        # Store the visit record
-        ddbClient.put_item(
-            TableName=ddb_table_name,
-            Item=item
-        )
+        item = _timed_stage(timings, 'build', build_visit_item, visit_id, None if transact_writes else visit_num_id,
+                            timestamp, ip_address, user_agent, browser_info, referer, geo_data)
+
+        if transact_writes:
+            visit_num_id, previous_last_updated = _timed_stage(
+                timings, 'transact', record_visit_transactionally, ddb_table_name, item, starting_visit_number,
+                deadline=deadline
+            )
+        else:
+            # Store the visit record
+            _timed_stage(timings, 'put', lambda: get_ddb_client().put_item(
+                TableName=ddb_table_name, Item=stored_item(item)
+            ))
+
+        # Daily rollups only count visits that were stored
+        if _rollups_enabled():
+            _timed_stage(timings, 'rollup', record_rollups, ddb_table_name, [item])
+        timings['total'] = (time.perf_counter() - request_start) * 1000
         
         logger.info(f"Successfully recorded visit: {visit_id} (#{visit_num_id})")
+        logger.info("Stage timings (ms): " + ", ".join(f"{stage}={ms:.1f}" for stage, ms in timings.items()))
         
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({
-                "success": True,
-                "visitId": visit_id,
-                "visitorCount": visit_num_id,
-                "previousLastViewedDate": previous_last_updated,
-                "message": "Visit recorded successfully"
-            }),
-            "isBase64Encoded": False
-        }
+        return _visit_response(visit_id, visit_num_id, previous_last_updated, "Visit recorded successfully")
         
     except botocore.exceptions.ClientError as e:
         logger.error(f"DynamoDB error: {e.response['Error']['Message']}")
+        request_metrics.add('Errors')
         return {
             "statusCode": 500,
             "headers": {
@@ -293,6 +1596,7 @@ def lambda_handler(event: dict, context: any) -> dict:
         }
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
+        request_metrics.add('Errors')
         return {
             "statusCode": 500,
             "headers": {
@@ -301,4 +1605,79 @@ def lambda_handler(event: dict, context: any) -> dict:
             },
             "body": json.dumps({"error": "Internal server error"}),
             "isBase64Encoded": False
-        }
\ No newline at end of file
+        }
+    finally:
+        timings.setdefault('total', (time.perf_counter() - request_start) * 1000)
+        request_metrics.put_timings(timings)
+        metrics.finish(request_metrics)
+
+# A typical browser agent, parsed during prewarm to run the parser's first-call work
+PREWARM_USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                      "Chrome/120.0.0.0 Safari/537.36")
+
+def _prewarm_dynamodb():
+    """Create the DynamoDB client and open its connection with a cheap read of the counter's key."""
+    client = get_ddb_client()
+    table_name = os.environ.get('tableName')
+    if table_name:
+        client.get_item(TableName=table_name, Key={'visitId': {'S': COUNTER_KEY}}, ProjectionExpression='visitId')
+
+def _prewarm_geo_connections():
+    """Resolve and connect to the geolocation upstream(s) the visit path will call."""
+    if 'api' not in os.environ.get('geoSourceOrder', 'headers,table,api'):
+        return
+    geo_pool.prewarm()
+    secondary = _secondary_geo_provider()
+    if secondary is not None:
+        secondary[1].prewarm()
+
+def prewarm(local=True, network=True):
+    """
+    Do the first-request work of a fresh container ahead of time: load the
+    geo table and warm the user agent parser (local), create the DynamoDB
+    client and open connections to DynamoDB and ip-api.com (network).
+    Returns the milliseconds each step took; a failing step is logged and
+    skipped, so prewarming can't break initialization.
+    """
+    steps = []
+    if local:
+        steps += [('geoTable', get_geo_table), ('userAgentParser', lambda: parse_user_agent(PREWARM_USER_AGENT))]
+    if network:
+        steps += [('dynamodbConnect', _prewarm_dynamodb), ('geoConnect', _prewarm_geo_connections)]
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Prewarm step {name} failed: {e}")
+        timings[name] = (time.perf_counter() - start) * 1000
+    timings['prewarm'] = sum(timings.values())
+
+    init_metrics = metrics.RequestMetrics(_metrics_namespace(), {'Route': 'init'})
+    init_metrics.put_timings(timings)
+    init_metrics.emit()
+    logger.info("Prewarm timings (ms): " + ", ".join(f"{step}={ms:.1f}" for step, ms in timings.items()))
+    return timings
+
+def prewarm_on_init():
+    """
+    Run prewarm() during the init phase when prewarmOnInit=true. Under
+    SnapStart only the local steps run before the snapshot; connections
+    don't survive a restore, so the network steps run after each restore.
+    """
+    if os.environ.get('prewarmOnInit', 'false').lower() != 'true':
+        return
+    if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'snap-start':
+        try:
+            from snapshot_restore_py import register_after_restore
+        except ImportError:
+            pass
+        else:
+            prewarm(network=False)
+            register_after_restore(lambda: prewarm(local=False))
+            return
+    prewarm()
+
+prewarm_on_init()
@@ -0,0 +1,80 @@
+"""
+Cheap pre-filter that spots crawlers, uptime checks and link previewers
+before the handler does any network I/O.
+
+A request is classified as automated, with the reason, when:
+  - its client address is in the deny prefix set (and not the allow set),
+  - its user agent is missing or matches the bot signatures in user_agent,
+  - or its headers give it away: prefetch/preview purpose headers, or no
+    Accept-Language, which browsers always send and most HTTP libraries don't.
+
+Addresses in the allow prefix set are never classified, e.g. for a monitor
+that should count as a real visit.
+"""
+import re
+from ipaddress import ip_address, ip_network
+
+try:
+    from visitor import user_agent as ua_parser
+except ImportError:  # deployed with visitor/ as the code root
+    import user_agent as ua_parser
+
+PREFETCH_HEADERS = ('purpose', 'sec-purpose', 'x-purpose', 'x-moz')
+
+_BOT_NAME = re.compile(r'([A-Za-z][\w.-]*?(?:bot|crawler|spider|preview|hit|fetcher)|Headless\w+)\b', re.IGNORECASE)
+_PRODUCT = re.compile(r'^([A-Za-z][\w.-]*)/')
+
+
+class PrefixSet:
+    """Set of IP networks with one set lookup per distinct prefix length."""
+
+    def __init__(self, cidrs=()):
+        self._networks = {}  # (version, prefix length) -> set of networks
+        for cidr in cidrs:
+            network = ip_network(cidr.strip(), strict=False)
+            self._networks.setdefault((network.version, network.prefixlen), set()).add(network)
+
+    @classmethod
+    def parse(cls, value):
+        """Build from a comma separated list of CIDRs, e.g. an environment variable."""
+        return cls(cidr for cidr in (value or '').split(',') if cidr.strip())
+
+    def __contains__(self, address):
+        try:
+            address = ip_address(address)
+        except ValueError:
+            return False
+        for (version, prefix), networks in self._networks.items():
+            if version == address.version and ip_network(f"{address}/{prefix}", strict=False) in networks:
+                return True
+        return False
+
+    def __bool__(self):
+        return bool(self._networks)
+
+
+def classify(user_agent, headers, client_ip, deny=None, allow=None, header_checks=True):
+    """Return why the request looks automated ('deny-list', 'user-agent', ...), or None."""
+    if allow and client_ip in allow:
+        return None
+    if deny and client_ip in deny:
+        return 'deny-list'
+    if not user_agent or user_agent == 'Unknown':
+        return 'no-user-agent'
+    if ua_parser.is_bot(user_agent):
+        return 'user-agent'
+    if header_checks:
+        names = {name.lower(): value for name, value in (headers or {}).items()}
+        if any(names.get(header, '').lower() in ('prefetch', 'preview') for header in PREFETCH_HEADERS):
+            return 'prefetch'
+        if 'accept-language' not in names:
+            return 'headers'
+    return None
+
+
+def bot_name(user_agent):
+    """Short name to aggregate automated traffic under, e.g. 'Googlebot' or 'curl'."""
+    if not user_agent or user_agent == 'Unknown':
+        return 'Unknown'
+    match = _BOT_NAME.search(user_agent) or _PRODUCT.search(user_agent)
+    return match.group(1)[:64] if match else 'Other'
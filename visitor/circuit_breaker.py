@@ -0,0 +1,93 @@
+"""
+Circuit breaker for an HTTP upstream, kept across warm invocations.
+
+closed     calls go through; failures (errors, and calls slower than
+           slow_call_seconds) within the last window seconds are counted,
+           and failure_threshold of them open the circuit
+open       calls are refused without touching the network until
+           open_seconds have passed, or until the reset time the upstream
+           gave in its rate-limit headers (open_for)
+half-open  a single probe call is let through; success closes the circuit,
+           failure opens it again
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold=5, window=30.0, open_seconds=30.0, slow_call_seconds=None,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = deque()  # times of failures within the window
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._clock() >= self._open_until:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Whether a call may go ahead; in half-open state only the first caller gets to probe."""
+        with self._lock:
+            if self._state == OPEN:
+                if self._clock() < self._open_until:
+                    return False
+                self._state, self._probing = HALF_OPEN, False
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self, latency=0.0):
+        if self.slow_call_seconds is not None and latency > self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state, self._probing = CLOSED, False
+                self._failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                self._open(now, self.open_seconds)
+                return
+            self._failures.append(now)
+            while self._failures and self._failures[0] <= now - self.window:
+                self._failures.popleft()
+            if len(self._failures) >= self.failure_threshold:
+                self._open(now, self.open_seconds)
+
+    def open_for(self, seconds):
+        """Open the circuit for at least seconds, e.g. until an upstream rate limit resets."""
+        with self._lock:
+            self._open(self._clock(), seconds)
+
+    def _open(self, now, seconds):
+        if self._state != OPEN:
+            self.opened += 1
+        self._state, self._probing = OPEN, False
+        self._open_until = max(self._open_until, now + seconds)
+        self._failures.clear()
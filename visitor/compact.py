@@ -0,0 +1,138 @@
+"""
+Compact storage encoding for visit items, used when visitEncoding=compact.
+
+Stored visits keep their key attributes (visitId, and timestamp/timeBucket,
+which the indexes are built on) but every other attribute gets a one or two
+letter code, browser/OS/device become small numbers from the enum tables
+below, and the raw user agent is replaced by a hash into a separate
+dictionary table that holds each distinct agent once.
+
+decode() turns either encoding back into the logical item that
+build_visit_item produces, so readers don't care how a visit was stored.
+Items written before compact encoding was enabled have no schema version
+attribute and pass through unchanged.
+
+The enum tables are append-only: stored items refer to positions in them.
+"""
+import hashlib
+
+SCHEMA_VERSION = 1
+SCHEMA_ATTRIBUTE = 'sv'
+USER_AGENT_HASH = 'uh'
+# Raw agent, kept inline only when it couldn't be added to the dictionary table
+USER_AGENT_INLINE = 'ua'
+
+# Logical attribute -> stored code. Key attributes are never renamed.
+CODES = {
+    'visitNumId': 'n',
+    'ipAddress': 'ip',
+    'browser': 'b',
+    'browserVersion': 'bv',
+    'os': 'o',
+    'osVersion': 'ov',
+    'device': 'd',
+    'isBot': 'bt',
+    'uaParserVersion': 'pv',
+    'referer': 'r',
+    'country': 'c',
+    'countryCode': 'cc',
+    'region': 'rg',
+    'city': 'ct',
+    'latitude': 'la',
+    'longitude': 'lo',
+    'timezone': 'tz',
+    'isp': 'is',
+}
+NAMES = {code: name for name, code in CODES.items()}
+
+ENUMS = {
+    'browser': ('Unknown', 'Chrome', 'Safari', 'Firefox', 'Edge', 'Opera', 'Samsung Internet', 'Yandex',
+                'Vivaldi', 'Chromium', 'Internet Explorer'),
+    'os': ('Unknown', 'Windows', 'macOS', 'iOS', 'Android', 'Linux', 'ChromeOS'),
+    'device': ('Unknown', 'desktop', 'mobile', 'tablet', 'tv', 'bot'),
+}
+_ENUM_INDEX = {name: {value: index for index, value in enumerate(values)} for name, values in ENUMS.items()}
+
+
+def user_agent_hash(user_agent):
+    return hashlib.blake2b(user_agent.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def is_compact(item):
+    return SCHEMA_ATTRIBUTE in item
+
+
+def encode_attribute(name, value):
+    """Stored (code, value) of one logical attribute other than userAgent."""
+    if name not in CODES:
+        return name, value
+    index = _ENUM_INDEX.get(name, {}).get(value.get('S'))
+    return CODES[name], {'N': str(index)} if index is not None else value
+
+
+def encode(item):
+    """Compact form of a logical visit item; returns (stored item, user agent hash or None)."""
+    stored = {SCHEMA_ATTRIBUTE: {'N': str(SCHEMA_VERSION)}}
+    ua_hash = None
+    for name, value in item.items():
+        if name == 'userAgent':
+            ua_hash = user_agent_hash(value['S'])
+            stored[USER_AGENT_HASH] = {'S': ua_hash}
+        else:
+            code, stored_value = encode_attribute(name, value)
+            stored[code] = stored_value
+    return stored, ua_hash
+
+
+def decode(item, user_agents=None):
+    """
+    Logical form of a stored visit item. user_agents maps hashes to agent
+    strings; without an entry for the item's hash, userAgent is left out.
+    """
+    if not is_compact(item):
+        return item
+    logical = {}
+    for code, value in item.items():
+        if code == SCHEMA_ATTRIBUTE:
+            continue
+        if code == USER_AGENT_HASH:
+            user_agent = (user_agents or {}).get(value['S'])
+            if user_agent is not None:
+                logical.setdefault('userAgent', {'S': user_agent})
+            continue
+        if code == USER_AGENT_INLINE:
+            logical['userAgent'] = value
+            continue
+        name = NAMES.get(code, code)
+        if name in ENUMS and 'N' in value:
+            index = int(value['N'])
+            values = ENUMS[name]
+            logical[name] = {'S': values[index] if index < len(values) else 'Unknown'}
+        else:
+            logical[name] = value
+    return logical
+
+
+def _number_size(value):
+    digits = value.lstrip('-').replace('.', '').strip('0') or '0'
+    return (len(digits) + 1) // 2 + 1
+
+
+def _value_size(value):
+    (kind, data), = value.items()
+    if kind == 'S':
+        return len(data.encode('utf-8'))
+    if kind == 'N':
+        return _number_size(data)
+    if kind in ('BOOL', 'NULL'):
+        return 1
+    if kind == 'M':
+        return 3 + sum(len(name.encode('utf-8')) + _value_size(nested) + 1 for name, nested in data.items())
+    if kind == 'L':
+        return 3 + sum(_value_size(nested) + 1 for nested in data)
+    return len(data)
+
+
+def item_size(item):
+    """Approximate stored size in bytes, following DynamoDB's item size rules."""
+    return sum(len(name.encode('utf-8')) + _value_size(value) for name, value in item.items())
@@ -0,0 +1,65 @@
+"""
+Latency budget for one invocation.
+
+The budget is the smaller of the time Lambda has left for the invocation
+(less a margin to build and return a response before the function is cut
+off) and the configured latency objective. Stages ask it for their timeouts:
+optional enrichment only gets what is left after reserving time for the
+writes that must still happen, and is skipped entirely once that drops below
+its minimum, so a slow upstream costs a partially enriched visit rather
+than a timed-out invocation.
+
+Without a Lambda context (tests, local invocations) and without an
+objective, the budget is unbounded and every stage keeps its own timeout.
+"""
+import random
+import time
+
+
+class Deadline:
+
+    def __init__(self, budget_ms=None, clock=time.monotonic):
+        self._clock = clock
+        self.budget_ms = budget_ms
+        self.expires_at = None if budget_ms is None else clock() + budget_ms / 1000
+
+    @classmethod
+    def from_context(cls, context, slo_ms=0, margin_ms=0, clock=time.monotonic):
+        """Budget from a Lambda context's remaining time and an optional objective in milliseconds."""
+        budgets = []
+        remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        if callable(remaining):
+            budgets.append(max(remaining() - margin_ms, 0))
+        if slo_ms > 0:
+            budgets.append(slo_ms)
+        return cls(min(budgets) if budgets else None, clock)
+
+    def remaining(self):
+        """Seconds left, or None when unbounded."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - self._clock(), 0.0)
+
+    def timeout(self, cap, reserve=0.0):
+        """Timeout in seconds for a stage that must leave reserve seconds for later ones, at most cap."""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        available = max(remaining - reserve, 0.0)
+        return available if cap is None else min(cap, available)
+
+    def allows(self, seconds):
+        """Whether at least seconds are left."""
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+
+def backoff_delay(attempt, base=0.025, cap=1.0, deadline=None):
+    """
+    Full-jitter exponential backoff before retry number attempt (0-based),
+    or None if the deadline leaves no time to wait and try again.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if deadline is not None and not deadline.allows(delay + base):
+        return None
+    return delay
@@ -0,0 +1,133 @@
+"""
+Offline IP-to-location lookup backed by a memory-mapped range table.
+
+The table file is produced by scripts/build_geo_table.py and holds sorted,
+non-overlapping IPv4 and IPv6 ranges plus a de-duplicated list of locations:
+
+    header      CRGT magic, version, record counts and section offsets
+    IPv4 ranges 12-byte records: start (4 bytes BE), end (4 bytes BE), location index
+    IPv6 ranges 36-byte records: start (16 bytes BE), end (16 bytes BE), location index
+    locations   UTF-8 JSON array of geolocation dicts
+
+Lookups binary search the range records directly in the mapping, so a table
+costs no parsing at load time beyond the location list.
+"""
+import json
+import mmap
+import struct
+from ipaddress import ip_address
+
+MAGIC = b'CRGT'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHIIIIII')
+_INDEX = struct.Struct('<I')
+_ADDRESS_BYTES = {4: 4, 6: 16}
+
+
+class GeoTable:
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, v4_count, v6_count, v4_offset, v6_offset, loc_offset, loc_length = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} geo table")
+
+        self._sections = {
+            4: (v4_offset, v4_count),
+            6: (v6_offset, v6_count)
+        }
+        self._locations = json.loads(self._mm[loc_offset:loc_offset + loc_length].decode('utf-8'))
+
+    def __len__(self):
+        return self._sections[4][1] + self._sections[6][1]
+
+    def lookup(self, ip):
+        """Return the location for ip, or None when no range covers it."""
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            return None
+
+        key = address.packed
+        width = _ADDRESS_BYTES[address.version]
+        record_size = 2 * width + _INDEX.size
+        offset, count = self._sections[address.version]
+        mm = self._mm
+
+        # Find the last range whose start is <= the address
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * record_size
+            if mm[start:start + width] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+
+        record = offset + (lo - 1) * record_size
+        if key > mm[record + width:record + 2 * width]:
+            return None
+
+        index = _INDEX.unpack_from(mm, record + 2 * width)[0]
+        return dict(self._locations[index])
+
+    def close(self):
+        self._mm.close()
+
+
+def write_table(ranges, path):
+    """
+    Write a geo table file.
+
+    ranges is an iterable of (start_ip, end_ip, location) where location is a
+    geolocation dict. Ranges may arrive in any order but must not overlap.
+    Returns the number of (IPv4, IPv6) records written.
+    """
+    locations = []
+    location_index = {}
+    records = {4: [], 6: []}
+
+    for start_ip, end_ip, location in ranges:
+        start, end = ip_address(start_ip), ip_address(end_ip)
+        if start.version != end.version:
+            raise ValueError(f"Range {start_ip}-{end_ip} mixes IPv4 and IPv6")
+        if start > end:
+            raise ValueError(f"Range {start_ip}-{end_ip} ends before it starts")
+
+        location_key = json.dumps(location, sort_keys=True)
+        if location_key not in location_index:
+            location_index[location_key] = len(locations)
+            locations.append(location)
+        records[start.version].append((start.packed, end.packed, location_index[location_key]))
+
+    sections = {}
+    for version, version_records in records.items():
+        version_records.sort()
+        for previous, current in zip(version_records, version_records[1:]):
+            if current[0] <= previous[1]:
+                raise ValueError(f"Overlapping IPv{version} ranges in geo table input")
+        sections[version] = b''.join(start + end + _INDEX.pack(index) for start, end, index in version_records)
+
+    location_blob = json.dumps(locations, separators=(',', ':')).encode('utf-8')
+    v4_offset = _HEADER.size
+    v6_offset = v4_offset + len(sections[4])
+    loc_offset = v6_offset + len(sections[6])
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(
+            MAGIC, VERSION, 0,
+            len(records[4]), len(records[6]),
+            v4_offset, v6_offset, loc_offset, len(location_blob)
+        ))
+        f.write(sections[4])
+        f.write(sections[6])
+        f.write(location_blob)
+
+    return len(records[4]), len(records[6])
@@ -0,0 +1,109 @@
+"""
+Small keep-alive HTTP connection pool for the geolocation upstream.
+
+urllib.request opens and tears down a TCP connection per request. The pool
+instead keeps idle http.client connections to one host and hands them back
+out, so warm invocations of a container skip connection setup. Connections
+are dropped when the server asks to close them or after sitting idle for
+idle_timeout seconds; a GET that fails on a reused connection (typically one
+the server closed while the container was frozen) is retried once on a fresh
+connection.
+
+http.client is imported on first use so importing this module stays cheap on
+cold starts.
+"""
+import threading
+import time
+
+
+class KeepAlivePool:
+
+    def __init__(self, host, port=80, maxsize=4, timeout=2.0, idle_timeout=30.0, clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._idle = []  # (connection, last used), most recently used last
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _new_connection(self, timeout):
+        import http.client
+        self.connections_opened += 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _checkout(self):
+        now = self._clock()
+        with self._lock:
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return None, False
+
+    def _checkin(self, connection):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append((connection, self._clock()))
+                return
+        connection.close()
+
+    def get(self, path, headers=None, timeout=None):
+        """GET path; returns (status, response headers, body bytes)."""
+        return self.request('GET', path, headers=headers, timeout=timeout)
+
+    def post(self, path, body, headers=None, timeout=None):
+        """POST body to path; like get, also retried once on a stale connection, so only for idempotent calls."""
+        return self.request('POST', path, body, headers, timeout)
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        connection, reused = self._checkout()
+        while True:
+            if connection is None:
+                connection = self._new_connection(timeout)
+            try:
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                connection.timeout = timeout
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+            except (ConnectionError, OSError) as e:
+                connection.close()
+                # A reused connection may have been closed by the server while idle
+                if reused and not isinstance(e, TimeoutError):
+                    connection, reused = None, False
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(connection)
+            return response.status, dict(response.getheaders()), body
+
+    def prewarm(self):
+        """Open a connection ahead of the first request, e.g. during a Lambda init phase."""
+        connection = self._new_connection(self.timeout)
+        try:
+            connection.connect()
+        except OSError:
+            connection.close()
+            raise
+        self._checkin(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+    def __len__(self):
+        return len(self._idle)
@@ -0,0 +1,98 @@
+"""
+Per-request metrics emitted as CloudWatch Embedded Metric Format (EMF).
+
+A handler starts a request with begin(), stages add values to it while it
+runs (from any thread, since stages run on the worker pool), and finish()
+prints one EMF JSON line to stdout. CloudWatch Logs turns that line into
+metrics, so nothing calls the CloudWatch API and the cost per request is a
+dict update per value and one json.dumps.
+
+A Lambda container serves one request at a time, so the request being
+recorded is kept in a module global rather than passed through every call;
+add() is a no-op when no request is being recorded.
+"""
+import json
+import threading
+import time
+
+DEFAULT_NAMESPACE = 'CloudResumeVisitor'
+
+_current = None
+
+
+class RequestMetrics:
+
+    def __init__(self, namespace=DEFAULT_NAMESPACE, dimensions=None, clock=time.time):
+        self.namespace = namespace
+        self.dimensions = dict(dimensions or {})
+        self.values = {}  # metric name -> [value, unit]
+        self.properties = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def put(self, name, value, unit='None'):
+        with self._lock:
+            self.values[name] = [value, unit]
+
+    def add(self, name, value=1, unit='Count'):
+        with self._lock:
+            if name in self.values:
+                self.values[name][0] += value
+            else:
+                self.values[name] = [value, unit]
+
+    def set_property(self, key, value):
+        self.properties[key] = value
+
+    def put_timings(self, timings):
+        """Record stage wall times ({'counter': ms, ...}) as <Stage>Latency metrics."""
+        for stage, ms in list(timings.items()):
+            self.put(f"{stage[0].upper()}{stage[1:]}Latency", round(ms, 3), 'Milliseconds')
+
+    def to_document(self):
+        with self._lock:
+            values = {name: value for name, (value, _) in self.values.items()}
+            definitions = [{'Name': name, 'Unit': unit} for name, (_, unit) in self.values.items()]
+        return {
+            '_aws': {
+                'Timestamp': int(self._clock() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [sorted(self.dimensions)],
+                    'Metrics': definitions
+                }]
+            },
+            **self.properties,
+            **self.dimensions,
+            **values
+        }
+
+    def emit(self):
+        if self.values:
+            print(json.dumps(self.to_document(), separators=(',', ':'), default=str), flush=True)
+
+
+def begin(namespace=DEFAULT_NAMESPACE, dimensions=None):
+    """Start recording a request; returns its RequestMetrics."""
+    global _current
+    _current = RequestMetrics(namespace, dimensions)
+    return _current
+
+
+def current():
+    return _current
+
+
+def add(name, value=1, unit='Count'):
+    """Add to a metric of the request being recorded, if any."""
+    request = _current
+    if request is not None:
+        request.add(name, value, unit)
+
+
+def finish(request):
+    """Emit the request's metrics and stop recording it."""
+    global _current
+    if _current is request:
+        _current = None
+    request.emit()
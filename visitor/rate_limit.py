@@ -0,0 +1,86 @@
+"""
+Per-client token buckets, kept across warm invocations.
+
+Each bucket holds burst tokens and refills at rate_per_minute. Instead of a
+token count and a refill time, a bucket is stored as the single number GCRA
+(the generic cell rate algorithm) uses: the time at which the bucket will be
+full again, in epoch milliseconds. A request at now is allowed while
+
+    max(arrival, now) <= now + (burst - 1) * interval
+
+and moves arrival on by one interval. Two views of the same bucket merge by
+taking the later arrival, which is what lets a container keep a local copy
+of a bucket shared through DynamoDB: the local copy only ever lags the
+shared one, so a request it refuses would have been refused there too.
+"""
+import math
+import threading
+import time
+
+try:
+    from visitor.ttl_cache import TTLCache, MISSING
+except ImportError:  # deployed with visitor/ as the code root
+    from ttl_cache import TTLCache, MISSING
+
+
+def now_ms(clock=time.time):
+    return int(clock() * 1000)
+
+
+class TokenBuckets:
+
+    def __init__(self, rate_per_minute, burst, cache_size=4096, clock=time.time):
+        self.rate_per_minute = rate_per_minute
+        self.burst = max(1, burst)
+        self.interval_ms = max(1, int(60000 / rate_per_minute))
+        self.tolerance_ms = (self.burst - 1) * self.interval_ms
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Buckets that are full again are indistinguishable from unknown ones,
+        # so entries only live until their arrival time
+        self._arrivals = TTLCache(maxsize=cache_size)
+
+    def now(self):
+        return now_ms(self._clock)
+
+    def arrival(self, key):
+        """The bucket's arrival time as last seen by this container, or None for a full bucket."""
+        arrival = self._arrivals.get(key)
+        return None if arrival is MISSING else arrival
+
+    def retry_after(self, arrival, now):
+        """Seconds until a bucket with this arrival time allows a request at now; 0 if it does already."""
+        if arrival is None:
+            return 0
+        wait_ms = arrival - now - self.tolerance_ms
+        return math.ceil(wait_ms / 1000) if wait_ms > 0 else 0
+
+    def in_use(self, key, now):
+        """Tokens of the client's bucket spent (and not yet refilled) as far as this container knows."""
+        arrival = self.arrival(key)
+        return math.ceil((arrival - now) / self.interval_ms) if arrival is not None and arrival > now else 0
+
+    def observe(self, key, arrival, now=None):
+        """Merge an arrival time seen elsewhere (the shared bucket) into the local copy."""
+        now = self.now() if now is None else now
+        with self._lock:
+            known = self.arrival(key)
+            if known is not None and known >= arrival:
+                return
+            if arrival > now:
+                self._arrivals.set(key, arrival, ttl=(arrival - now) / 1000)
+
+    def take(self, key, now=None):
+        """Take a token from the local bucket. Returns 0 if allowed, otherwise seconds to wait."""
+        now = self.now() if now is None else now
+        with self._lock:
+            arrival = max(self.arrival(key) or now, now)
+            wait = self.retry_after(arrival, now)
+            if wait:
+                return wait
+            arrival += self.interval_ms
+            self._arrivals.set(key, arrival, ttl=(arrival - now) / 1000)
+            return 0
+
+    def clear(self):
+        self._arrivals.clear()
@@ -0,0 +1,134 @@
+"""
+Daily visit rollups maintained on the write path.
+
+Each day has one STATS#<YYYY-MM-DD> item in the visitor table. Besides a
+total 'visits' attribute it holds one number attribute per dimension value,
+named '<dimension>#<value>' (e.g. 'country#Germany'), bumped with ADD as
+visits are recorded. Reporting then reads one small item per day instead of
+scanning every visit.
+
+Values come from request headers, so the item is kept small no matter what
+clients send: values are cut to MAX_VALUE_LENGTH, referers that aren't URLs
+count as 'Other', and once a dimension has MAX_DIMENSION_VALUES values on a
+day, visits with further new values count as '<dimension>#Other'.
+"""
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+ROLLUP_PREFIX = 'STATS#'
+DIMENSIONS = ('country', 'browser', 'os', 'referer')
+OTHER = 'Other'
+MAX_VALUE_LENGTH = 64
+MAX_DIMENSION_VALUES = 200  # per dimension and day, well within DynamoDB's 400 KB item limit
+
+# Automated traffic filtered out with botFilter=aggregate is only counted
+# here, with 'reason#<why>' and 'agent#<bot name>' attributes
+BOT_ROLLUP_PREFIX = 'BOTS#'
+
+
+def rollup_key(day, prefix=ROLLUP_PREFIX):
+    return f"{prefix}{day}"
+
+
+def referer_host(referer):
+    """Reduce a referer URL to its host so the rollup stays small."""
+    if not referer or referer == 'Direct':
+        return 'Direct'
+    try:
+        host = urlsplit(referer).hostname
+    except ValueError:
+        host = None
+    if not host:
+        return OTHER
+    host = host[4:] if host.startswith('www.') else host
+    return host[:MAX_VALUE_LENGTH]
+
+
+def dimension_values(item):
+    """Map each rollup dimension to its value for one DynamoDB visit item."""
+    values = {}
+    for dimension in DIMENSIONS:
+        value = item.get(dimension, {}).get('S') or 'Unknown'
+        values[dimension] = referer_host(value) if dimension == 'referer' else value[:MAX_VALUE_LENGTH]
+    return values
+
+
+def count_rollups(items):
+    """Aggregate visit items into {day: Counter(attribute name -> visits)}."""
+    days = defaultdict(Counter)
+    for item in items:
+        counts = days[item['timestamp']['S'][:10]]
+        counts['visits'] += 1
+        for dimension, value in dimension_values(item).items():
+            counts[f"{dimension}#{value}"] += 1
+    return days
+
+
+def cap_new_values(counts, existing, limit=None):
+    """
+    Count attributes the stored item (existing) doesn't have yet as
+    '<dimension>#Other' once their dimension already has limit values.
+    """
+    limit = MAX_DIMENSION_VALUES if limit is None else limit
+    known = Counter(attribute.partition('#')[0] for attribute in existing if '#' in attribute)
+    capped = Counter()
+    for attribute, count in counts.items():
+        dimension, separator, _ = attribute.partition('#')
+        if separator and attribute not in existing:
+            if known[dimension] >= limit:
+                attribute = f"{dimension}#{OTHER}"
+            if attribute not in existing and attribute not in capped:
+                known[dimension] += 1
+        capped[attribute] += count
+    return capped
+
+
+def update_request(table_name, day, counts, prefix=ROLLUP_PREFIX, existing_only=False):
+    """
+    UpdateItem arguments that ADD counts onto the day's rollup item. With
+    existing_only, the update only applies if the item already has every
+    attribute, and a failed condition returns the item so new values can be
+    capped with cap_new_values.
+    """
+    names = {}
+    values = {}
+    clauses = []
+    for index, (attribute, count) in enumerate(sorted(counts.items())):
+        names[f"#a{index}"] = attribute
+        values[f":v{index}"] = {'N': str(count)}
+        clauses.append(f"#a{index} :v{index}")
+
+    request = {
+        'TableName': table_name,
+        'Key': {'visitId': {'S': rollup_key(day, prefix)}},
+        'UpdateExpression': 'ADD ' + ', '.join(clauses),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+    if existing_only:
+        request['ConditionExpression'] = ' AND '.join(f"attribute_exists({name})" for name in names)
+        request['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+    return request
+
+
+def summarize(rollup_items, days):
+    """Combine rollup items for the given days into per-day totals and per-dimension breakdowns."""
+    by_day = {item['visitId']['S'][len(ROLLUP_PREFIX):]: item for item in rollup_items}
+    totals = {dimension: Counter() for dimension in DIMENSIONS}
+    per_day = []
+
+    for day in days:
+        item = by_day.get(day, {})
+        per_day.append({'date': day, 'visits': int(item.get('visits', {}).get('N', '0'))})
+        for attribute, value in item.items():
+            dimension, _, dimension_value = attribute.partition('#')
+            if dimension in totals and 'N' in value:
+                totals[dimension][dimension_value] += int(value['N'])
+
+    return {
+        'from': days[0] if days else None,
+        'to': days[-1] if days else None,
+        'visits': sum(day['visits'] for day in per_day),
+        'days': per_day,
+        **{dimension: dict(counts.most_common()) for dimension, counts in totals.items()}
+    }
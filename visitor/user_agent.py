@@ -0,0 +1,153 @@
+"""
+User agent parser used by the visitor handler.
+
+Browser tokens (Chrome/91.0, Firefox/89.0, ...) are pulled out with a single
+precompiled scan and then resolved by priority, so Chromium derivatives that
+also advertise Chrome/ and Safari/ are attributed correctly. Operating
+systems are matched against an ordered rule table; the more specific
+platforms come first (iOS before macOS, since iOS agents say "like Mac OS X",
+and Android before Linux). Results are cached per user agent string because
+the same handful of agents account for most traffic.
+"""
+import os
+import re
+from functools import lru_cache
+
+# Bump when parsing changes, so stored visits parsed by older rules can be found
+PARSER_VERSION = 2
+
+# Matched against the lowercased agent; IGNORECASE makes this alternation ~20x slower
+BOT_PATTERN = re.compile(
+    r'bot\b|bot/|crawl|spider|slurp|bingpreview|facebookexternalhit|facebookcatalog|embedly|'
+    r'quora link preview|whatsapp|skypeuripreview|pinterest|headlesschrome|phantomjs|lighthouse|'
+    r'pingdom|uptimerobot|statuscake|site24x7|curl/|wget/|python-requests|python-urllib|aiohttp|'
+    r'go-http-client|java/|okhttp|axios/|node-fetch|undici|libwww-perl|httpclient|scrapy|'
+    r'ahrefs|semrush|baiduspider|yandex(?:bot|images)|bytespider|gptbot|ccbot|'
+    r'google-inspectiontool|feedfetcher|chrome-lighthouse'
+)
+
+_BROWSER_TOKENS = re.compile(
+    r'(?<![A-Za-z])(EdgA|EdgiOS|Edg|Edge|OPR|OPiOS|SamsungBrowser|YaBrowser|Vivaldi|FxiOS|Firefox|'
+    r'CriOS|Chromium|Chrome|Version|Safari|MSIE|rv)[/: ]([\d.]+)'
+)
+
+# (token, browser name), highest priority first
+_BROWSER_PRIORITY = (
+    ('Edg', 'Edge'),
+    ('EdgA', 'Edge'),
+    ('EdgiOS', 'Edge'),
+    ('Edge', 'Edge'),
+    ('OPR', 'Opera'),
+    ('OPiOS', 'Opera'),
+    ('SamsungBrowser', 'Samsung Internet'),
+    ('YaBrowser', 'Yandex'),
+    ('Vivaldi', 'Vivaldi'),
+    ('FxiOS', 'Firefox'),
+    ('Firefox', 'Firefox'),
+    ('CriOS', 'Chrome'),
+    ('Chromium', 'Chromium'),
+    ('Chrome', 'Chrome'),
+    ('MSIE', 'Internet Explorer'),
+)
+
+# (OS name, pattern whose first group, if any, is the version), first match wins
+_OS_RULES = tuple((name, re.compile(pattern)) for name, pattern in (
+    ('iOS', r'(?:iPhone|iPad|iPod)[^)]*? OS (\d+(?:_\d+)*)|iPhone|iPad|iPod'),
+    ('Android', r'Android(?: (\d+(?:\.\d+)*))?'),
+    ('Windows', r'Windows NT (\d+\.\d+)|Windows'),
+    ('ChromeOS', r'CrOS \S+ (\d+(?:\.\d+)*)|CrOS'),
+    ('macOS', r'Mac[^)]*?OS X (\d+(?:[_.]\d+)*)|Macintosh|Mac OS X'),
+    ('Linux', r'Linux'),
+))
+
+_WINDOWS_VERSIONS = {'10.0': '10', '6.3': '8.1', '6.2': '8', '6.1': '7', '6.0': 'Vista', '5.1': 'XP'}
+
+_TABLET_PATTERN = re.compile(r'iPad|Tablet|Kindle|Silk/|PlayBook')
+_MOBILE_PATTERN = re.compile(r'Mobi|iPhone|iPod|Android|Windows Phone')
+_TV_PATTERN = re.compile(r'SMART-TV|SmartTV|Smart TV|CrKey|AppleTV|GoogleTV|HbbTV|Web0S|Tizen.+TV')
+
+UNKNOWN = {
+    'browser': 'Unknown',
+    'browserVersion': None,
+    'os': 'Unknown',
+    'osVersion': None,
+    'device': 'Unknown',
+    'isBot': False
+}
+
+
+def _parse_browser(user_agent):
+    tokens = {}
+    for token, version in _BROWSER_TOKENS.findall(user_agent):
+        tokens.setdefault(token, version)
+
+    for token, browser in _BROWSER_PRIORITY:
+        if token in tokens:
+            return browser, tokens[token]
+    if 'Trident/' in user_agent and 'rv' in tokens:
+        return 'Internet Explorer', tokens['rv']
+    if 'Safari' in tokens:
+        return 'Safari', tokens.get('Version')
+    return 'Unknown', None
+
+
+def _parse_os(user_agent):
+    for name, pattern in _OS_RULES:
+        match = pattern.search(user_agent)
+        if match:
+            version = match.group(1) if pattern.groups else None
+            if version:
+                version = version.replace('_', '.')
+                if name == 'Windows':
+                    version = _WINDOWS_VERSIONS.get(version, version)
+            return name, version
+    return 'Unknown', None
+
+
+def _parse_device(user_agent, os_name, is_bot):
+    if is_bot:
+        return 'bot'
+    if _TV_PATTERN.search(user_agent):
+        return 'tv'
+    if _TABLET_PATTERN.search(user_agent) or (os_name == 'Android' and 'Mobile' not in user_agent):
+        return 'tablet'
+    if _MOBILE_PATTERN.search(user_agent):
+        return 'mobile'
+    if os_name == 'Unknown':
+        return 'Unknown'
+    return 'desktop'
+
+
+def is_bot(user_agent):
+    return bool(user_agent) and BOT_PATTERN.search(user_agent.lower()) is not None
+
+
+@lru_cache(maxsize=int(os.environ.get('userAgentCacheSize', '1024')))
+def _parse(user_agent):
+    browser, browser_version = _parse_browser(user_agent)
+    os_name, os_version = _parse_os(user_agent)
+    bot = is_bot(user_agent)
+    return {
+        'browser': browser,
+        'browserVersion': browser_version,
+        'os': os_name,
+        'osVersion': os_version,
+        'device': _parse_device(user_agent, os_name, bot),
+        'isBot': bot
+    }
+
+
+def parse(user_agent):
+    """Return browser, browserVersion, os, osVersion, device and isBot for a user agent."""
+    if not user_agent:
+        return dict(UNKNOWN)
+    # Copy so callers can't modify the cached result
+    return dict(_parse(user_agent))
+
+
+def cache_info():
+    return _parse.cache_info()
+
+
+def clear_cache():
+    _parse.cache_clear()
@@ -0,0 +1,47 @@
+"""
+Queues used to hand raw visits from the API handler to the ingest consumer
+when the function runs with ingestMode=async.
+
+SqsVisitQueue is what the deployed function uses. InMemoryVisitQueue is a
+local stand-in with the same send() interface that can also build the SQS
+event the consumer would receive, so the whole write-behind path can be run
+in tests or locally without AWS.
+"""
+import json
+from uuid import uuid4
+
+
+class SqsVisitQueue:
+
+    def __init__(self, queue_url, client):
+        self.queue_url = queue_url
+        self._client = client
+
+    def send(self, message):
+        self._client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message))
+
+
+class InMemoryVisitQueue:
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(json.dumps(message))
+
+    def drain_event(self, max_messages=10):
+        """Remove up to max_messages and wrap them in an SQS Lambda event."""
+        batch, self.messages = self.messages[:max_messages], self.messages[max_messages:]
+        return {
+            'Records': [
+                {
+                    'messageId': str(uuid4()),
+                    'body': body,
+                    'eventSource': 'aws:sqs'
+                }
+                for body in batch
+            ]
+        }
+
+    def __len__(self):
+        return len(self.messages)